@@ -5,7 +5,7 @@
 # Run: streamlit run app.py
 # ============================================================
 
-import re, warnings
+import os, warnings
 import numpy as np
 import pandas as pd
 import plotly.express as px
@@ -13,15 +13,28 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
 from datetime import datetime, timedelta
-
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
-from sklearn.linear_model import Ridge
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from charts import (STATUS_COLORS, PRIORITY_COLORS, grade_donut, recommendations_by_factor,
+                    season_yield_bar, yield_status_bar)
+from drift import PSI_RETRAIN, PSI_WARN, PartitionedProfiles, ProfileLibrary, drift_report
+from export import FORMATS, available_formats, export_file, file_name
+from forecasting import FORECASTERS, forecast_clusters, next_season_label
+from loader import DumpSource, DuplicateKeyError, filter_mask, load_source
+from page_cache import PageCache, filter_signature
+from peers import PEER_FEATURES, build_peer_index
+from picks import FEW_PICKS, curve_metrics, pick_profile, season_curves
+from recommendations import RECOMMENDATIONS, recommendations_table
+from risk_index import build_risk_index
+from scenarios import LEVERS, grid_key, scenario_grid, simulate
+from shared_store import SharedStore
+from training import (ML_FEATURES, DEFAULT_PARAMS, TUNED_PARAMS_PATH, TrainingService,
+                      data_fingerprint, load_tuned, ml_ready, model_params)
 
 warnings.filterwarnings("ignore")
+# Datasets are shared across sessions as copy-on-write views (default from pandas 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # ── Page Config ───────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -41,280 +54,64 @@ ROBUSTA_IDEALS = {
     "pruning_interval_months": (10, 18),
     "bean_moisture":    (10.5, 12.5),
 }
-FERT_FREQ_MAP = {"never": 0, "rarely": 1, "sometimes": 2, "often": 3}
-PEST_FREQ_MAP = {"never": 0, "rarely": 1, "sometimes": 2, "often": 3}
-FERT_TYPE_MAP = {"none": 0, "organic": 1, "non-organic": 2, "both": 3}
-PEST_TYPE_MAP = {"none": 0, "organic": 1, "non-organic": 2, "both": 3}
-STATUS_COLORS = {
-    "Critical Drop (>20%)":  "#d62728",
-    "Moderate Drop (5-20%)": "#ff7f0e",
-    "Stable (±5%)":          "#2ca02c",
-    "Improvement (>5%)":     "#1f77b4",
-}
-
-ML_FEATURES = [
-    "plant_age_months", "pre_yield_kg", "pruning_interval_months",
-    "shade_binary", "fert_type_enc", "fert_freq_enc", "pest_type_enc", "pest_freq_enc",
-    "mgmt_score", "soil_ph", "avg_temp_c", "avg_rainfall_mm", "avg_humidity_pct",
-    "elevation_m", "planting_density", "climate_stress", "season_idx",
-    "previous_fine_pct", "previous_premium_pct", "previous_commercial_pct"
-]
 
 GRADE_COLORS = {"Fine": "#1B5E20", "Premium": "#66BB6A", "Commercial": "#C8E6C9"}
 
-RECOMMENDATIONS = [
-    ("soil_ph", 5.6, 6.5,
-     "Soil pH too low → apply agricultural lime to raise pH toward 5.6–6.5.",
-     "Soil pH too high → apply sulfur amendments to lower pH toward 5.6–6.5.", "High"),
-    ("avg_temp_c", 13, 26,
-     "Temperature below optimum → consider windbreaks; monitor frost risk.",
-     "Temperature above optimum → increase shade tree cover to cool canopy.", "Medium"),
-    ("avg_rainfall_mm", 150, 250,
-     "Rainfall below optimum → supplement with irrigation during dry months.",
-     "Rainfall above optimum → improve drainage; monitor fungal disease risk.", "Medium"),
-    ("avg_humidity_pct", 75, 85,
-     "Humidity too low → mulch around base; add shade trees.",
-     "Humidity too high → improve airflow; apply preventive fungicide.", "Medium"),
-    ("elevation_m", 600, 1200,
-     "Elevation below Robusta ideal → consider Excelsa or lower-altitude variety.",
-     "Elevation above Robusta ideal → assess suitability; may suit Arabica instead.", "Low"),
-    ("pruning_interval_months", 10, 18,
-     "Pruning overdue (> 18 months) → prune immediately after harvest for vigour.",
-     "Pruning too frequent (< 10 months) → allow full recovery between cycles.", "High"),
-    ("fert_freq_enc", 2, 3,
-     "Fertilizer too infrequent → increase to at least 1×/year (sometimes).",
-     None, "High"),
-    ("pest_freq_enc", 1, 3,
-     "Pesticide never applied → establish a pest monitoring schedule.",
-     None, "Low"),
-    ("bean_moisture", 10.5, 12.5,
-     "Bean moisture too low → review drying duration; risk of brittle beans.",
-     "Bean moisture too high → extend drying; risk of mould and grade downgrade.", "High"),
-]
-
 # ═════════════════════════════════════════════════════════════════════════════
 # DATA LOADING
 # ═════════════════════════════════════════════════════════════════════════════
 
-def split_csv_row(row_str):
-    values, current, in_q = [], [], False
-    for ch in row_str:
-        if ch == "'" and not in_q:
-            in_q = True
-        elif ch == "'" and in_q:
-            in_q = False
-        elif ch == "," and not in_q:
-            values.append("".join(current).strip().strip("'"))
-            current = []
-            continue
-        current.append(ch)
-    values.append("".join(current).strip().strip("'"))
-    return values
-
-def parse_table(sql_text, table_name):
-    pattern = (
-        r"INSERT\s+INTO\s+(?:public\.)?{t}\s*"
-        r"\(([^)]+)\)\s*VALUES\s*(.*?)(?=INSERT\s+INTO|--\s*VERIF|$)"
-    ).format(t=re.escape(table_name))
-    matches = re.findall(pattern, sql_text, re.DOTALL | re.IGNORECASE)
-    all_rows = []
-    for cols_raw, vals_block in matches:
-        cols = [c.strip() for c in cols_raw.split(",")]
-        # Allow one level of nesting to handle SQL functions like NOW()
-        row_tuples = re.findall(r"\(((?:[^()]*|\([^()]*\))*)\)", vals_block)
-        for tup in row_tuples:
-            vals = split_csv_row(tup)
-            if len(vals) == len(cols):
-                all_rows.append(dict(zip(cols, vals)))
-    df = pd.DataFrame(all_rows)
-    df.replace({"NULL": None, "null": None, "": None}, inplace=True)
-    return df
-
-@st.cache_data(show_spinner="⏳ Parsing SQL & building analytics table...")
-def load_data(sql_text):
-    df_users    = parse_table(sql_text, "users")
-    df_farms    = parse_table(sql_text, "farms")
-    df_clusters = parse_table(sql_text, "clusters")
-    df_csd      = parse_table(sql_text, "cluster_stage_data")
-    df_hr       = parse_table(sql_text, "harvest_records")
-    if df_hr.empty:
-        df_hr = pd.DataFrame(columns=["id", "cluster_id", "season", "actual_harvest_date", "yield_kg", "grade_fine", "grade_premium", "grade_commercial", "notes", "recorded_at"])
-
-    def to_num(s): return pd.to_numeric(s, errors="coerce")
-    def to_dt(s):  return pd.to_datetime(s, errors="coerce")
-
-    for c in ["farm_area", "elevation_m", "overall_tree_count"]:
-        if c in df_farms.columns: df_farms[c] = to_num(df_farms[c])
-    for c in ["area_size_sqm", "plant_count"]:
-        if c in df_clusters.columns: df_clusters[c] = to_num(df_clusters[c])
-
-    num_csd = ["plant_age_months","number_of_plants","pruning_interval_months",
-               "soil_ph","avg_temp_c","avg_rainfall_mm","avg_humidity_pct",
-               "pre_yield_kg","pre_grade_fine","pre_grade_premium","pre_grade_commercial",
-               "previous_fine_pct","previous_premium_pct","previous_commercial_pct",
-               "defect_count","bean_moisture","predicted_yield","pre_total_trees"]
-    date_csd = ["date_planted","last_pruned_date","previous_pruned_date",
-                "actual_flowering_date","estimated_flowering_date",
-                "estimated_harvest_date","actual_harvest_date","pre_last_harvest_date"]
-    for c in num_csd:
-        if c in df_csd.columns: df_csd[c] = to_num(df_csd[c])
-    for c in date_csd:
-        if c in df_csd.columns: df_csd[c] = to_dt(df_csd[c])
-    for c in ["yield_kg","grade_fine","grade_premium","grade_commercial"]:
-        if c in df_hr.columns: df_hr[c] = to_num(df_hr[c])
-    df_hr["actual_harvest_date"] = to_dt(df_hr.get("actual_harvest_date"))
-
-    # Ensure df_hr has cluster_id
-    if not df_hr.empty and "cluster_id" not in df_hr.columns:
-        possible = [c for c in df_hr.columns if "cluster" in c.lower()]
-        if possible:
-            df_hr = df_hr.rename(columns={possible[0]:"cluster_id"})
-        elif len(df_hr.columns) > 1:
-            df_hr = df_hr.rename(columns={df_hr.columns[1]:"cluster_id"})
-
-    # Rename columns for indexing
-    if not df_farms.empty:
-        if "id" in df_farms.columns:
-            df_farms = df_farms.rename(columns={"id":"farm_id"})
-        elif "farm_id" not in df_farms.columns:
-            df_farms = df_farms.rename(columns={df_farms.columns[0]:"farm_id"})
-        farm_lu = df_farms.set_index("farm_id")[ ["elevation_m","farm_area","overall_tree_count","farm_name"] ].to_dict("index")
-        farm_user_lu = df_farms.set_index("farm_id")[["user_id"]].to_dict("index")
-    else:
-        farm_lu = {}
-        farm_user_lu = {}
-
-    if not df_clusters.empty:
-        if "id" in df_clusters.columns:
-            df_clusters = df_clusters.rename(columns={"id":"cluster_id"})
-        elif "cluster_id" not in df_clusters.columns:
-            df_clusters = df_clusters.rename(columns={df_clusters.columns[0]:"cluster_id"})
-        cluster_lu = df_clusters.set_index("cluster_id")[ ["farm_id","cluster_name","area_size_sqm","plant_count","variety","plant_stage"] ].to_dict("index")
-    else:
-        cluster_lu = {}
-
-    # Build farmer name map via users->farms
-    if not df_users.empty:
-        if "id" in df_users.columns:
-            df_users = df_users.rename(columns={"id":"user_id"})
-        elif "user_id" not in df_users.columns:
-            df_users = df_users.rename(columns={df_users.columns[0]:"user_id"})
-        user_lu = df_users.set_index("user_id")[ ["first_name","last_name","municipality","province"] ].to_dict("index")
-    else:
-        user_lu = {}
-
-    hr = df_hr.copy()
-    hr["farm_id"]          = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("farm_id"))
-    hr["cluster_name"]     = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("cluster_name"))
-    hr["area_size_sqm"]    = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("area_size_sqm"))
-    hr["plant_count"]      = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("plant_count"))
-    hr["variety"]          = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("variety","Robusta"))
-    hr["plant_stage"]      = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("plant_stage"))
-    hr["elevation_m"]      = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("elevation_m") if x else None)
-    hr["farm_area"]        = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("farm_area") if x else None)
-    hr["farm_name"]        = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("farm_name","") if x else "")
-    hr["user_id"]          = hr["farm_id"].map(lambda x: farm_user_lu.get(x,{}).get("user_id") if x else None)
-    hr["farmer_name"]      = hr["user_id"].map(lambda x: f"{user_lu.get(x,{}).get('first_name','')} {user_lu.get(x,{}).get('last_name','')}".strip() if x else "")
-    hr["municipality"]     = hr["user_id"].map(lambda x: user_lu.get(x,{}).get("municipality","") if x else "")
-    hr["province"]         = hr["user_id"].map(lambda x: user_lu.get(x,{}).get("province","") if x else "")
-
-    csd_cols = ["cluster_id","season"] + num_csd + date_csd + [
-        "fertilizer_type","fertilizer_frequency","pesticide_type","pesticide_frequency",
-        "shade_tree_present","shade_tree_species"]
-    flat = hr.merge(df_csd[[c for c in csd_cols if c in df_csd.columns]],
-                    on=["cluster_id","season"], how="left", suffixes=("","_csd"))
-
-    flat["plant_age_months"] = flat["plant_age_months"].fillna(
-        ((flat["actual_harvest_date"] - flat["date_planted"]).dt.days / 30.44).round(0))
-    flat["flowering_to_harvest_days"] = (
-        flat["actual_harvest_date"] - flat["actual_flowering_date"]).dt.days
-    flat["shade_binary"] = (
-        flat["shade_tree_present"].astype(str).str.lower()
-        .map({"true":1,"1":1,"false":0,"0":0}).fillna(0).astype(int))
-    flat["yield_per_tree"] = (flat["yield_kg"] / flat["plant_count"].replace(0, np.nan)).round(3)
-    flat["fine_grade_pct"]       = (flat["grade_fine"]       / flat["yield_kg"].replace(0,np.nan)*100).round(2)
-    flat["premium_grade_pct"]    = (flat["grade_premium"]     / flat["yield_kg"].replace(0,np.nan)*100).round(2)
-    flat["commercial_grade_pct"] = (flat["grade_commercial"]  / flat["yield_kg"].replace(0,np.nan)*100).round(2)
-    flat["yield_delta_kg"]  = (flat["yield_kg"] - flat["pre_yield_kg"]).round(2)
-    flat["yield_delta_pct"] = (flat["yield_delta_kg"] / flat["pre_yield_kg"].replace(0,np.nan)*100).round(2)
-    flat["yield_drop"] = (flat["yield_delta_kg"] < 0).astype(int)
-    flat["planting_density"] = (flat["plant_count"] / flat["area_size_sqm"].replace(0,np.nan)).round(4)
-    flat["fert_type_enc"] = flat["fertilizer_type"].astype(str).str.lower().str.strip().map(FERT_TYPE_MAP).fillna(0)
-    flat["fert_freq_enc"] = flat["fertilizer_frequency"].astype(str).str.lower().str.strip().map(FERT_FREQ_MAP).fillna(0)
-    flat["pest_type_enc"] = flat["pesticide_type"].astype(str).str.lower().str.strip().map(PEST_TYPE_MAP).fillna(0)
-    flat["pest_freq_enc"] = flat["pesticide_frequency"].astype(str).str.lower().str.strip().map(PEST_FREQ_MAP).fillna(0)
-    flat["mgmt_score"] = (flat["fert_freq_enc"]*0.30 + flat["fert_type_enc"]*0.15 +
-                          flat["pest_freq_enc"]*0.40 + flat["pest_type_enc"]*0.15)
-    flat["climate_stress"] = (
-        (flat["avg_temp_c"]-22).abs()*0.3 +
-        (flat["avg_rainfall_mm"]-200).abs()*0.005 +
-        (flat["soil_ph"]-6.05).abs()*3.0 +
-        (flat["avg_humidity_pct"]-80).abs()*0.1)
-    season_order = sorted(flat["season"].dropna().unique())
-    flat["season_idx"] = flat["season"].map({s:i for i,s in enumerate(season_order)})
-
-    flat["yield_status"] = pd.cut(
-        flat["yield_delta_pct"],
-        bins=[-np.inf, -20, -5, 5, np.inf],
-        labels=["Critical Drop (>20%)","Moderate Drop (5-20%)","Stable (±5%)","Improvement (>5%)"])
-
-    return flat, df_users, df_farms, df_clusters, df_csd
-
-@st.cache_resource(show_spinner="🤖 Training ML models...")
-def train_models(flat_df):
-    ml = flat_df.copy()
-    ml_clean = ml.dropna(subset=ML_FEATURES + ["yield_kg","fine_grade_pct","premium_grade_pct","commercial_grade_pct"])
-    if len(ml_clean) < 10:
-        return None, None, None, None
-    X = ml_clean[ML_FEATURES].values
-    y_yield = ml_clean["yield_kg"].values
-    X_tr, X_te, y_tr, y_te = train_test_split(X, y_yield, test_size=0.2, random_state=42)
-    models = {
-        "GBR" : GradientBoostingRegressor(n_estimators=400, learning_rate=0.04, max_depth=4, subsample=0.8, random_state=42),
-        "RF"  : RandomForestRegressor(n_estimators=300, max_depth=8, min_samples_leaf=2, random_state=42),
-        "Ridge": Pipeline([("scaler", StandardScaler()), ("ridge", Ridge(alpha=10.0))]),
-    }
-    results = {}
-    for name, mdl in models.items():
-        mdl.fit(X_tr, y_tr)
-        yp = mdl.predict(X_te)
-        cv = cross_val_score(mdl, X, y_yield, cv=min(5,len(ml_clean)), scoring="r2")
-        results[name] = {"model":mdl,"y_pred":yp,"y_test":y_te,
-                         "MAE":round(mean_absolute_error(y_te,yp),2),
-                         "RMSE":round(mean_squared_error(y_te,yp)**0.5,2),
-                         "R2":round(r2_score(y_te,yp),4),
-                         "CV_R2":round(cv.mean(),4)}
-    grade_models, grade_metrics = {}, {}
-    for target in ["fine_grade_pct","premium_grade_pct","commercial_grade_pct"]:
-        yg = ml_clean[target].values
-        Xg_tr,Xg_te,yg_tr,yg_te = train_test_split(X, yg, test_size=0.2, random_state=42)
-        gm = GradientBoostingRegressor(n_estimators=300, learning_rate=0.04, max_depth=3, random_state=42)
-        gm.fit(Xg_tr, yg_tr)
-        yg_p = gm.predict(Xg_te)
-        cv_g = cross_val_score(gm, X, yg, cv=min(5,len(ml_clean)), scoring="r2")
-        grade_models[target] = gm
-        grade_metrics[target] = {"model":gm,"y_pred":yg_p,"y_test":yg_te,
-                                  "MAE":round(mean_absolute_error(yg_te,yg_p),2),
-                                  "R2":round(r2_score(yg_te,yg_p),4),
-                                  "CV_R2":round(cv_g.mean(),4)}
-    best_name = max(results, key=lambda k: results[k]["R2"])
-    imp = pd.Series(results["GBR"]["model"].feature_importances_, index=ML_FEATURES).sort_values(ascending=False)
-    return results, grade_models, grade_metrics, imp, best_name, ml_clean
-
-def get_recommendations(row):
-    recs = []
-    for col, lo, hi, lo_msg, hi_msg, priority in RECOMMENDATIONS:
-        val = pd.to_numeric(row.get(col), errors="coerce")
-        if pd.isna(val): continue
-        if val < lo and lo_msg:
-            recs.append({"factor":col,"value":round(val,2),"ideal":f"{lo}–{hi}","recommendation":lo_msg,"priority":priority})
-        elif val > hi and hi_msg:
-            recs.append({"factor":col,"value":round(val,2),"ideal":f"{lo}–{hi}","recommendation":hi_msg,"priority":priority})
-    if str(row.get("shade_tree_present","")).lower() in ("false","0","no","none"):
-        recs.append({"factor":"shade_tree_present","value":"absent","ideal":"present",
-                     "recommendation":"No shade trees → plant Madre de Cacao or banana to improve grade quality and moisture retention.",
-                     "priority":"Medium"})
-    return recs
+@st.cache_resource
+def get_store():
+    # Process-wide: every session shares one parsed copy per dataset digest
+    return SharedStore()
+
+def session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "local"
+
+def load_data(source):
+    def parse():
+        with st.spinner("⏳ Parsing SQL & building analytics table..."):
+            return load_source(source)
+    return get_store().dataset(source.digest, session_id(), parse)
+
+@st.cache_resource
+def get_page_cache():
+    # Keys are content-based (digest + normalised filters), so sessions share entries
+    return PageCache()
+
+@st.cache_resource
+def get_trainer():
+    # One process-wide service so training survives reruns and is shared by sessions
+    return TrainingService()
+
+@st.cache_resource
+def get_profile_library():
+    # Partition content hash -> drift profile, so re-uploaded partitions aren't re-summarised;
+    # bounded LRU, so profiles of long-gone dumps are eventually dropped
+    return ProfileLibrary()
+
+def model_job(rows, drift_vs, digest):
+    """Training job to serve ``rows``, and the drift report behind the choice.
+
+    The latest model trained on this dump (``digest``; never another
+    session's upload) keeps serving while the rows' ingest-time profile stays
+    within the drift thresholds of its training profile; a new model is only
+    trained when drift is major, hyperparameters changed or a retrain is forced.
+    ``drift_vs(job)`` is the drift report of ``rows`` against ``job``'s training profile.
+    """
+    trainer = get_trainer()
+    fp = data_fingerprint(rows, digest)
+    job = trainer.job(fp)
+    if job is not None:
+        return job, None
+    latest = trainer.latest(digest)
+    if (latest is None or latest.profile is None or latest.params != model_params()
+            or st.session_state.get("force_retrain") == fp):
+        return trainer.submit(fp, rows, digest), None
+    report = drift_vs(latest)
+    return (trainer.submit(fp, rows, digest) if report[1]["retrain"] else latest), report
 
 # ═════════════════════════════════════════════════════════════════════════════
 # SIDEBAR
@@ -325,50 +122,102 @@ st.sidebar.caption("Robusta Coffee Bean Quality Dashboard")
 uploaded = st.sidebar.file_uploader("📂 Upload SQL file", type=["sql","txt"],
                                      help="Upload coffee_bean_quality_dataset.sql")
 
-# Try default file if none uploaded
-sql_text = None
+# Uploads are spooled to a temp file once per upload; local dumps are mapped in place
+# Replacing or clearing the upload also drops this session's reference on the old
+# dataset so it can be evicted (sessions that just go away expire after SESSION_TTL_S)
+source = None
+held = st.session_state.get("dump_source")
+upload_key = (uploaded.name, uploaded.size, getattr(uploaded, "file_id", None)) if uploaded else None
+if held is not None and held[0] != upload_key:
+    held[1].close()
+    del st.session_state["dump_source"]
+    get_store().release(session_id())
 if uploaded:
-    sql_text = uploaded.read().decode("utf-8")
+    if "dump_source" not in st.session_state:
+        st.session_state["dump_source"] = (upload_key, DumpSource.from_upload(uploaded))
+    source = st.session_state["dump_source"][1]
     st.sidebar.success(f"✅ Loaded: {uploaded.name}")
 else:
-    import os
     for candidate in ["coffee_bean_quality_dataset.sql","paste.txt"]:
         if os.path.exists(candidate):
-            with open(candidate, "r", encoding="utf-8") as f:
-                sql_text = f.read()
+            source = DumpSource.from_path(candidate)
             st.sidebar.info(f"📄 Using default: {candidate}")
             break
 
-if not sql_text:
+if source is None or source.size == 0:
     st.title("☕ Coffee Bean Quality Analytics")
     st.info("👈 Upload your SQL file in the sidebar to begin.")
     st.stop()
 
-flat, df_users, df_farms, df_clusters, df_csd = load_data(sql_text)
-season_order = sorted(flat["season"].dropna().unique())
+try:
+    flat, df_users, df_farms, df_clusters, df_csd, join_stats, picks = load_data(source)
+except DuplicateKeyError as e:
+    st.error(f"❌ Duplicate cluster_stage_data rows: {e}")
+    st.stop()
+if join_stats["duplicate_rows"]:
+    st.sidebar.warning(f"⚠️ {join_stats['duplicate_rows']} duplicate stage rows across "
+                       f"{join_stats['duplicate_keys']} cluster-seasons resolved ({join_stats['policy']} wins)"
+                       if join_stats["policy"] == "latest" else
+                       f"⚠️ {join_stats['duplicate_rows']} duplicate stage rows across "
+                       f"{join_stats['duplicate_keys']} cluster-seasons aggregated")
+data_memo = get_page_cache().page(source.digest)
+season_order = data_memo.frame("season_order", lambda: sorted(flat["season"].dropna().unique()))
+next_season = next_season_label(season_order)
+
+# Next-season forecast per cluster, fitted on every season regardless of filters.
+# The choice lives in a plain session key: the selectbox's own key is dropped
+# whenever the Yield Trends page isn't rendered.
+forecast_method = st.session_state.setdefault("forecast_method", "damped")
+forecasts = get_store().artifact(("forecast", source.digest, forecast_method),
+                                 lambda: forecast_clusters(flat, forecast_method))
+flat = get_store().artifact(("flat+forecast", source.digest, forecast_method),
+                            lambda: flat.assign(**{c: flat["cluster_id"].map(forecasts[c])
+                                                   for c in ["forecast_yield_kg","forecast_lo","forecast_hi"]}))
+
+# Drift summaries per (farm, season), built once per dump; any filter's profile is a merge
+drift_parts = get_store().artifact(("drift-parts", source.digest),
+                                   lambda: PartitionedProfiles(ml_ready(flat), ML_FEATURES,
+                                                               library=get_profile_library()))
 
 # ── Sidebar filters ────────────────────────────────────────────────────────────
 st.sidebar.markdown("---")
 st.sidebar.subheader("🔍 Filters")
 
-all_provinces = sorted(flat["province"].dropna().unique()) if "province" in flat.columns else []
+all_provinces = data_memo.frame("provinces", lambda:
+    sorted(flat["province"].dropna().unique()) if "province" in flat.columns else [])
 sel_province = st.sidebar.multiselect("Province", all_provinces, default=all_provinces)
 
-all_municipalities = sorted(flat[flat["province"].isin(sel_province)]["municipality"].dropna().unique()) if sel_province else sorted(flat["municipality"].dropna().unique())
+all_municipalities = data_memo.frame("municipalities", lambda:
+    sorted(flat[flat["province"].isin(sel_province)]["municipality"].dropna().unique()) if sel_province else sorted(flat["municipality"].dropna().unique()),
+    provinces=sorted(sel_province))
 sel_municipality = st.sidebar.multiselect("Municipality", all_municipalities, default=all_municipalities)
 
-all_farms = sorted(flat[flat["municipality"].isin(sel_municipality)]["farm_name"].dropna().unique()) if "farm_name" in flat.columns else []
+all_farms = data_memo.frame("farms", lambda:
+    sorted(flat[flat["municipality"].isin(sel_municipality)]["farm_name"].dropna().unique()) if "farm_name" in flat.columns else [],
+    municipalities=sorted(sel_municipality))
 sel_farms = st.sidebar.multiselect("Farm", all_farms, default=all_farms)
 
 sel_seasons = st.sidebar.multiselect("Season", season_order, default=season_order)
 
-# Apply filters
-filtered = flat.copy()
-if sel_province:      filtered = filtered[filtered["province"].isin(sel_province)]
-if sel_municipality:  filtered = filtered[filtered["municipality"].isin(sel_municipality)]
-if sel_farms and "farm_name" in filtered.columns:
-    filtered = filtered[filtered["farm_name"].isin(sel_farms)]
-if sel_seasons:       filtered = filtered[filtered["season"].isin(sel_seasons)]
+# Apply filters — one combined mask, so at most one copy of the selected rows.
+# Equivalent filter states share a signature, and with it every cached page entry.
+filter_sig = filter_signature(province=(sel_province, all_provinces), municipality=(sel_municipality, all_municipalities),
+                              farm=(sel_farms, all_farms), season=(sel_seasons, season_order))
+filter_memo = get_page_cache().page(source.digest, filter_sig)
+row_ids = filter_memo.frame("row_ids", lambda:
+    np.flatnonzero(filter_mask(flat, sel_province, sel_municipality, sel_farms, sel_seasons)))
+filtered = flat if len(row_ids) == len(flat) else filter_memo.frame(
+    "filtered", lambda: flat.iloc[row_ids], forecast=forecast_method)
+
+# Drift of the filtered rows: partition summaries are merged once per filter
+# signature and each model's report is cached with them, so reruns are lookups
+def filtered_profile(season=None):
+    return filter_memo.frame("drift_profile", lambda: drift_parts.for_rows(
+        filtered if season is None else filtered[filtered["season"] == season]), season=season)
+
+def filtered_drift(job, season=None):
+    return filter_memo.frame("drift_report", lambda: drift_report(job.profile, filtered_profile(season)),
+                             model=job.fingerprint, season=season)
 
 # Sidebar pages
 st.sidebar.markdown("---")
@@ -380,10 +229,23 @@ PAGES = [
     "🤖 ML Models",
     "⚠️ Yield Drop Detection",
     "🌸 Harvest Date Estimator",
+    "🧺 Harvest Curves",
     "💡 Recommendations",
     "🗃️ Raw Data",
 ]
 page = st.sidebar.radio("Navigate", PAGES)
+memo = get_page_cache().page(source.digest, filter_sig, page)
+
+with st.sidebar.expander("🧠 Shared store"):
+    m = get_store().metrics()
+    st.caption(f"Sessions: {m['active_sessions']} active (peak {m['peak_sessions']})  \n"
+               f"Datasets: {m['datasets']} · Artifacts: {m['artifacts']}  \n"
+               f"Memory: {m['bytes']/2**20:,.1f} / {m['budget_bytes']/2**20:,.0f} MiB  \n"
+               f"Hit rate: {m['hit_rate']:.0%} ({m['hits']} hits, {m['misses']} misses, {m['evictions']} evicted)  \n"
+               f"Training jobs: {get_trainer().running} running, {get_trainer().joins} joined")
+    pm = get_page_cache().metrics()
+    st.caption(f"Page cache: {pm['entries']} entries, {pm['bytes']/2**20:,.1f} / {pm['budget_bytes']/2**20:,.0f} MiB, "
+               f"hit rate {pm['hit_rate']:.0%} ({pm['evictions']} evicted)")
 
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: OVERVIEW
@@ -393,52 +255,47 @@ if page == "📊 Overview":
     st.caption("Robusta — Western Visayas + Negros Occidental | Seasons 2021–2025")
     st.markdown("---")
 
-    c1, c2, c3, c4, c5 = st.columns(5)
+    def kpis():
+        fc = filtered.drop_duplicates("cluster_id")
+        return {"total":    filtered["yield_kg"].sum(),
+                "clusters": filtered["cluster_id"].nunique(),
+                "farms":    filtered["farm_id"].nunique() if "farm_id" in filtered.columns else "—",
+                "avg_fine": filtered["fine_grade_pct"].mean(),
+                "drop_pct": (filtered["yield_drop"].sum() / len(filtered) * 100) if len(filtered) else 0,
+                "fc":       fc[["forecast_yield_kg","forecast_lo","forecast_hi"]].sum().to_dict()}
+    k = memo.frame("kpis", kpis, forecast=forecast_method)
+
+    c1, c2, c3, c4, c5, c6 = st.columns(6)
     with c1:
-        st.metric("Total Yield (kg)", f"{filtered['yield_kg'].sum():,.1f}")
+        st.metric("Total Yield (kg)", f"{k['total']:,.1f}")
     with c2:
-        st.metric("Clusters", filtered["cluster_id"].nunique())
+        st.metric("Clusters", k["clusters"])
     with c3:
-        st.metric("Farms", filtered["farm_id"].nunique() if "farm_id" in filtered.columns else "—")
+        st.metric("Farms", k["farms"])
     with c4:
-        avg_fine = filtered["fine_grade_pct"].mean()
-        st.metric("Avg Fine %", f"{avg_fine:.1f}%" if not np.isnan(avg_fine) else "—")
+        st.metric("Avg Fine %", f"{k['avg_fine']:.1f}%" if not np.isnan(k["avg_fine"]) else "—")
     with c5:
-        drop_pct = (filtered["yield_drop"].sum() / len(filtered) * 100) if len(filtered) else 0
-        st.metric("Yield Drop Rate", f"{drop_pct:.1f}%")
+        st.metric("Yield Drop Rate", f"{k['drop_pct']:.1f}%")
+    with c6:
+        st.metric(f"Forecast {next_season} (kg)", f"{k['fc']['forecast_yield_kg']:,.1f}",
+                  help=f"Summed 80% bounds: {k['fc']['forecast_lo']:,.0f}–{k['fc']['forecast_hi']:,.0f} kg "
+                       f"({FORECASTERS[forecast_method][0]})")
 
     st.markdown("---")
     col1, col2 = st.columns(2)
 
     # Yield by season bar
     with col1:
-        s_agg = filtered.groupby("season")["yield_kg"].agg(["sum","mean"]).reset_index().sort_values("season")
-        fig = px.bar(s_agg, x="season", y="sum",
-                     title="Total Yield per Season (kg)",
-                     labels={"sum":"Total Yield (kg)","season":"Season"},
-                     color_discrete_sequence=["#4A7C59"],
-                     text_auto=".0f")
-        fig.update_traces(textposition="outside")
-        fig.update_layout(showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(memo.figure("season_bar", lambda: season_yield_bar(filtered)), use_container_width=True)
 
     # Grade mix pie
     with col2:
-        totals = filtered[["grade_fine","grade_premium","grade_commercial"]].sum()
-        fig2 = go.Figure(go.Pie(
-            labels=["Fine","Premium","Commercial"],
-            values=totals.values,
-            marker_colors=["#1B5E20","#66BB6A","#C8E6C9"],
-            hole=0.4,
-            textinfo="label+percent"
-        ))
-        fig2.update_layout(title="Overall Grade Composition (kg)")
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(memo.figure("grade_pie", lambda: grade_donut(filtered)), use_container_width=True)
 
     # Farm-level summary table
     st.markdown("### Farm Summary")
     if "farm_name" in filtered.columns:
-        farm_summary = (
+        farm_summary = memo.frame("farm_summary", lambda:
             filtered.groupby(["farm_name","province","municipality"])
             .agg(clusters=("cluster_id","nunique"),
                  seasons=("season","nunique"),
@@ -454,6 +311,32 @@ if page == "📊 Overview":
         )
         st.dataframe(farm_summary, use_container_width=True, hide_index=True)
 
+    # Risk index is materialised once per dataset + forecast model; queries are lookups
+    st.markdown("### 🚨 Farms Requiring Immediate Attention")
+    risk = get_store().artifact(("risk", source.digest, forecast_method),
+                                lambda: build_risk_index(flat, RECOMMENDATIONS, forecasts))
+    top_n = st.slider("Show top", 5, 50, 10, key="risk_top_k")
+    loc = dict(province=sel_province, municipality=sel_municipality, farm_name=sel_farms)
+    top_farms = memo.frame("risk_top", lambda: risk.top_k(top_n, **loc, per_farm=True),
+                           k=top_n, forecast=forecast_method)
+    st.caption("Priority score (0–100) ranks each cluster's latest season on climate stress, management gap, "
+               "yield decline, forecast decline and High-priority recommendations; each farm is listed with "
+               "its riskiest cluster. Season filter not applied.")
+    st.dataframe(top_farms[["farm_name","cluster_name","risk_level","yield_decline_pct",
+                            "predicted_decline_pct","priority_score","clusters"]]
+                 .rename(columns={"farm_name":"Farm Name","cluster_name":"Cluster","risk_level":"Risk Level",
+                                  "yield_decline_pct":"Yield Decline (%)",
+                                  "predicted_decline_pct":"Predicted Decline (%)",
+                                  "priority_score":"Priority Score","clusters":"Clusters"}),
+                 use_container_width=True, hide_index=True)
+    if len(top_farms):
+        farm_opts = dict(zip(top_farms["farm_name"] + " — " + top_farms["municipality"], top_farms["farm_id"]))
+        drill = st.selectbox("Drill down into farm", list(farm_opts), key="risk_drill")
+        st.dataframe(risk.clusters(farm_opts[drill])[
+                         ["cluster_name","season","yield_kg","climate_stress","mgmt_score","yield_decline_pct",
+                          "forecast_yield_kg","predicted_decline_pct","high_priority_recs","priority_score","risk_level"]]
+                     .round(2), use_container_width=True, hide_index=True)
+
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: YIELD TRENDS
 # ═════════════════════════════════════════════════════════════════════════════
@@ -461,72 +344,112 @@ elif page == "📈 Yield Trends":
     st.title("📈 Yield Trends")
     st.markdown("Season-over-season yield performance across all filtered clusters.")
 
-    s_agg = (
+    s_agg = memo.frame("s_agg", lambda:
         filtered.groupby("season")["yield_kg"]
         .agg(total="sum", mean="mean", std="std", median="median", count="count")
         .reset_index().sort_values("season")
     )
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Total Yield", "Distribution", "Mean Trend", "Per-Cluster Timeline"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Total Yield", "Distribution", "Mean Trend", "Per-Cluster Timeline", "Forecast"])
 
     with tab1:
-        fig = px.bar(s_agg, x="season", y="total",
-                     title="Total Yield per Season",
-                     labels={"total":"Total Yield (kg)","season":"Season"},
-                     color_discrete_sequence=["#4A7C59"],
-                     text_auto=".1f")
-        fig.update_traces(textposition="outside")
-        fig.update_layout(xaxis_title="Season", yaxis_title="kg")
-        st.plotly_chart(fig, use_container_width=True)
+        def total_bar():
+            fig = px.bar(s_agg, x="season", y="total",
+                         title="Total Yield per Season",
+                         labels={"total":"Total Yield (kg)","season":"Season"},
+                         color_discrete_sequence=["#4A7C59"],
+                         text_auto=".1f")
+            fig.update_traces(textposition="outside")
+            fig.update_layout(xaxis_title="Season", yaxis_title="kg")
+            return fig
+        st.plotly_chart(memo.figure("total_bar", total_bar), use_container_width=True)
 
     with tab2:
-        fig2 = px.box(filtered.dropna(subset=["yield_kg"]),
-                      x="season", y="yield_kg",
-                      title="Yield Distribution per Season",
-                      color="season",
-                      labels={"yield_kg":"Yield (kg)","season":"Season"},
-                      points="all")
-        fig2.update_layout(showlegend=False)
-        st.plotly_chart(fig2, use_container_width=True)
+        def yield_box():
+            fig2 = px.box(filtered.dropna(subset=["yield_kg"]),
+                          x="season", y="yield_kg",
+                          title="Yield Distribution per Season",
+                          color="season",
+                          labels={"yield_kg":"Yield (kg)","season":"Season"},
+                          points="all")
+            fig2.update_layout(showlegend=False)
+            return fig2
+        st.plotly_chart(memo.figure("yield_box", yield_box), use_container_width=True)
 
     with tab3:
-        fig3 = go.Figure()
-        fig3.add_trace(go.Scatter(
-            x=s_agg["season"], y=s_agg["mean"],
-            mode="lines+markers", name="Mean Yield",
-            line=dict(color="#4A7C59", width=2.5),
-            marker=dict(size=8)))
-        fig3.add_trace(go.Scatter(
-            x=s_agg["season"], y=s_agg["median"],
-            mode="lines+markers", name="Median",
-            line=dict(color="#C62828", width=1.5, dash="dash"),
-            marker=dict(size=6)))
-        fig3.add_trace(go.Scatter(
-            x=list(s_agg["season"]) + list(s_agg["season"])[::-1],
-            y=list((s_agg["mean"]+s_agg["std"].fillna(0))) + list((s_agg["mean"]-s_agg["std"].fillna(0)))[::-1],
-            fill="toself", fillcolor="rgba(74,124,89,0.15)",
-            line=dict(color="rgba(255,255,255,0)"), name="±1 SD"))
-        fig3.update_layout(title="Mean & Median Yield Trend ± 1 SD",
-                            xaxis_title="Season", yaxis_title="Yield (kg)")
-        st.plotly_chart(fig3, use_container_width=True)
+        def mean_trend():
+            fig3 = go.Figure()
+            fig3.add_trace(go.Scatter(
+                x=s_agg["season"], y=s_agg["mean"],
+                mode="lines+markers", name="Mean Yield",
+                line=dict(color="#4A7C59", width=2.5),
+                marker=dict(size=8)))
+            fig3.add_trace(go.Scatter(
+                x=s_agg["season"], y=s_agg["median"],
+                mode="lines+markers", name="Median",
+                line=dict(color="#C62828", width=1.5, dash="dash"),
+                marker=dict(size=6)))
+            fig3.add_trace(go.Scatter(
+                x=list(s_agg["season"]) + list(s_agg["season"])[::-1],
+                y=list((s_agg["mean"]+s_agg["std"].fillna(0))) + list((s_agg["mean"]-s_agg["std"].fillna(0)))[::-1],
+                fill="toself", fillcolor="rgba(74,124,89,0.15)",
+                line=dict(color="rgba(255,255,255,0)"), name="±1 SD"))
+            fig3.update_layout(title="Mean & Median Yield Trend ± 1 SD",
+                                xaxis_title="Season", yaxis_title="Yield (kg)")
+            return fig3
+        st.plotly_chart(memo.figure("mean_trend", mean_trend), use_container_width=True)
 
     with tab4:
         if "farm_name" in filtered.columns:
             grp_col = st.selectbox("Group by", ["farm_name","cluster_name","province","municipality"])
         else:
             grp_col = "cluster_name"
-        pivot = (filtered.groupby(["season", grp_col])["yield_kg"]
-                 .mean().reset_index().sort_values("season"))
-        fig4 = px.line(pivot, x="season", y="yield_kg", color=grp_col,
-                       title=f"Avg Yield per Season by {grp_col.replace('_',' ').title()}",
-                       labels={"yield_kg":"Avg Yield (kg)","season":"Season"},
-                       markers=True)
-        st.plotly_chart(fig4, use_container_width=True)
+        def group_lines():
+            pivot = (filtered.groupby(["season", grp_col])["yield_kg"]
+                     .mean().reset_index().sort_values("season"))
+            return px.line(pivot, x="season", y="yield_kg", color=grp_col,
+                           title=f"Avg Yield per Season by {grp_col.replace('_',' ').title()}",
+                           labels={"yield_kg":"Avg Yield (kg)","season":"Season"},
+                           markers=True)
+        st.plotly_chart(memo.figure("group_lines", group_lines, grp_col=grp_col), use_container_width=True)
+
+    with tab5:
+        st.selectbox("Forecast model", list(FORECASTERS), key="forecast_method_select",
+                     index=list(FORECASTERS).index(forecast_method), format_func=lambda k: FORECASTERS[k][0],
+                     on_change=lambda: st.session_state.update(
+                         forecast_method=st.session_state["forecast_method_select"]))
+        fc = memo.frame("forecast_table", lambda:
+            filtered.drop_duplicates("cluster_id")
+            .set_index("cluster_id")[["cluster_name","farm_name","forecast_yield_kg","forecast_lo","forecast_hi"]]
+            .join(forecasts["forecast_n_obs"]).reset_index(drop=True)
+            .rename(columns={"cluster_name":"Cluster","farm_name":"Farm",
+                             "forecast_yield_kg":f"Forecast {next_season} (kg)",
+                             "forecast_lo":"Low (80%)","forecast_hi":"High (80%)",
+                             "forecast_n_obs":"Seasons Observed"})
+            .sort_values(f"Forecast {next_season} (kg)", ascending=False),
+            forecast=forecast_method)
+        st.caption(f"{FORECASTERS[forecast_method][0]} fitted on every cluster's full season history "
+                   f"(all seasons, ignoring the season filter); 80% prediction intervals.")
+        def forecast_bar():
+            tot = fc[[f"Forecast {next_season} (kg)","Low (80%)","High (80%)"]].sum().to_numpy()
+            fig5 = go.Figure()
+            fig5.add_trace(go.Bar(x=s_agg["season"], y=s_agg["total"], name="Actual",
+                                  marker_color="#4A7C59"))
+            fig5.add_trace(go.Bar(x=[next_season], y=[tot[0]], name="Forecast",
+                                  marker_color="#A5D6A7",
+                                  error_y=dict(type="data", symmetric=False,
+                                               array=[tot[2] - tot[0]], arrayminus=[tot[0] - tot[1]])))
+            fig5.update_layout(title=f"Total Yield per Season with {next_season} Forecast",
+                               xaxis_title="Season", yaxis_title="kg")
+            return fig5
+        st.plotly_chart(memo.figure("forecast_bar", forecast_bar, forecast=forecast_method), use_container_width=True)
+        st.dataframe(fc, use_container_width=True, hide_index=True)
 
     st.markdown("### Season Summary Table")
-    st.dataframe(s_agg.rename(columns={"season":"Season","total":"Total (kg)",
-                                        "mean":"Mean (kg)","std":"Std Dev","median":"Median","count":"Count"})
-                      .round(2), use_container_width=True, hide_index=True)
+    st.dataframe(memo.frame("season_table", lambda:
+                     s_agg.rename(columns={"season":"Season","total":"Total (kg)",
+                                           "mean":"Mean (kg)","std":"Std Dev","median":"Median","count":"Count"})
+                          .round(2)), use_container_width=True, hide_index=True)
 
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: GRADE DISTRIBUTION
@@ -538,58 +461,67 @@ elif page == "🎯 Grade Distribution":
     tab1, tab2, tab3, tab4 = st.tabs(["By Season", "Overall Pie", "Fine % Histogram", "Bean Moisture"])
 
     with tab1:
-        grade_s = (filtered.groupby("season")[["fine_grade_pct","premium_grade_pct","commercial_grade_pct"]]
-                   .mean().round(2).reset_index().sort_values("season"))
-        fig = go.Figure()
-        for g, col, color in [("Fine","fine_grade_pct","#1B5E20"),
-                               ("Premium","premium_grade_pct","#66BB6A"),
-                               ("Commercial","commercial_grade_pct","#C8E6C9")]:
-            fig.add_trace(go.Bar(name=g, x=grade_s["season"], y=grade_s[col],
-                                 marker_color=color))
-        fig.update_layout(barmode="stack", title="Avg Grade % per Season",
-                          xaxis_title="Season", yaxis_title="% of Yield",
-                          legend_title="Grade")
-        st.plotly_chart(fig, use_container_width=True)
+        def grade_by_season():
+            grade_s = (filtered.groupby("season")[["fine_grade_pct","premium_grade_pct","commercial_grade_pct"]]
+                       .mean().round(2).reset_index().sort_values("season"))
+            fig = go.Figure()
+            for g, col, color in [("Fine","fine_grade_pct","#1B5E20"),
+                                   ("Premium","premium_grade_pct","#66BB6A"),
+                                   ("Commercial","commercial_grade_pct","#C8E6C9")]:
+                fig.add_trace(go.Bar(name=g, x=grade_s["season"], y=grade_s[col],
+                                     marker_color=color))
+            fig.update_layout(barmode="stack", title="Avg Grade % per Season",
+                              xaxis_title="Season", yaxis_title="% of Yield",
+                              legend_title="Grade")
+            return fig
+        st.plotly_chart(memo.figure("grade_by_season", grade_by_season), use_container_width=True)
 
     with tab2:
-        totals = filtered[["grade_fine","grade_premium","grade_commercial"]].sum()
-        fig2 = go.Figure(go.Pie(
-            labels=["Fine","Premium","Commercial"],
-            values=totals.values,
-            marker_colors=["#1B5E20","#66BB6A","#C8E6C9"],
-            hole=0.35, textinfo="label+percent+value",
-            hovertemplate="%{label}<br>%{value:.2f} kg<br>%{percent}"))
-        fig2.update_layout(title=f"Overall Grade Mix — Total {totals.sum():,.1f} kg")
-        st.plotly_chart(fig2, use_container_width=True)
+        def grade_pie():
+            totals = filtered[["grade_fine","grade_premium","grade_commercial"]].sum()
+            fig2 = go.Figure(go.Pie(
+                labels=["Fine","Premium","Commercial"],
+                values=totals.values,
+                marker_colors=["#1B5E20","#66BB6A","#C8E6C9"],
+                hole=0.35, textinfo="label+percent+value",
+                hovertemplate="%{label}<br>%{value:.2f} kg<br>%{percent}"))
+            fig2.update_layout(title=f"Overall Grade Mix — Total {totals.sum():,.1f} kg")
+            return fig2
+        st.plotly_chart(memo.figure("grade_pie", grade_pie), use_container_width=True)
 
     with tab3:
-        fig3 = px.histogram(filtered.dropna(subset=["fine_grade_pct"]),
-                             x="fine_grade_pct", nbins=25,
-                             title="Fine Grade % Distribution",
-                             labels={"fine_grade_pct":"Fine Grade %"},
-                             color_discrete_sequence=["#4A7C59"])
-        med_f = filtered["fine_grade_pct"].median()
-        fig3.add_vline(x=med_f, line_dash="dash", line_color="red",
-                       annotation_text=f"Median {med_f:.1f}%",
-                       annotation_position="top right")
-        st.plotly_chart(fig3, use_container_width=True)
+        def fine_hist():
+            fig3 = px.histogram(filtered.dropna(subset=["fine_grade_pct"]),
+                                 x="fine_grade_pct", nbins=25,
+                                 title="Fine Grade % Distribution",
+                                 labels={"fine_grade_pct":"Fine Grade %"},
+                                 color_discrete_sequence=["#4A7C59"])
+            med_f = filtered["fine_grade_pct"].median()
+            fig3.add_vline(x=med_f, line_dash="dash", line_color="red",
+                           annotation_text=f"Median {med_f:.1f}%",
+                           annotation_position="top right")
+            return fig3
+        st.plotly_chart(memo.figure("fine_hist", fine_hist), use_container_width=True)
 
     with tab4:
-        fig4 = px.histogram(filtered.dropna(subset=["bean_moisture"]),
-                             x="bean_moisture", nbins=20,
-                             title="Bean Moisture % Distribution",
-                             labels={"bean_moisture":"Moisture %"},
-                             color_discrete_sequence=["#6B8E6B"])
-        med_m = filtered["bean_moisture"].median()
-        fig4.add_vline(x=med_m, line_dash="dash", line_color="red",
-                       annotation_text=f"Median {med_m:.1f}%",
-                       annotation_position="top right")
-        fig4.add_vrect(x0=10.5, x1=12.5, fillcolor="green", opacity=0.1,
-                       annotation_text="Ideal 10.5–12.5%", annotation_position="top left")
-        st.plotly_chart(fig4, use_container_width=True)
+        def moisture_hist():
+            fig4 = px.histogram(filtered.dropna(subset=["bean_moisture"]),
+                                 x="bean_moisture", nbins=20,
+                                 title="Bean Moisture % Distribution",
+                                 labels={"bean_moisture":"Moisture %"},
+                                 color_discrete_sequence=["#6B8E6B"])
+            med_m = filtered["bean_moisture"].median()
+            fig4.add_vline(x=med_m, line_dash="dash", line_color="red",
+                           annotation_text=f"Median {med_m:.1f}%",
+                           annotation_position="top right")
+            fig4.add_vrect(x0=10.5, x1=12.5, fillcolor="green", opacity=0.1,
+                           annotation_text="Ideal 10.5–12.5%", annotation_position="top left")
+            return fig4
+        st.plotly_chart(memo.figure("moisture_hist", moisture_hist), use_container_width=True)
 
     st.markdown("### Grade Summary by Season")
-    grade_tbl = (filtered.groupby("season")
+    grade_tbl = memo.frame("grade_tbl", lambda:
+                 filtered.groupby("season")
                  .agg(fine_kg=("grade_fine","sum"),
                       premium_kg=("grade_premium","sum"),
                       commercial_kg=("grade_commercial","sum"),
@@ -614,34 +546,40 @@ elif page == "🔗 Correlation Analysis":
     ]
     TARGET_COLS = ["yield_kg","fine_grade_pct","premium_grade_pct","commercial_grade_pct"]
 
-    corr_df = filtered[[c for c in FEATURE_COLS+TARGET_COLS if c in filtered.columns]]
-    corr_df = corr_df.apply(pd.to_numeric, errors="coerce")
-    corr_mat = corr_df.corr().round(3)
+    def correlations():
+        corr_df = filtered[[c for c in FEATURE_COLS+TARGET_COLS if c in filtered.columns]]
+        corr_df = corr_df.apply(pd.to_numeric, errors="coerce")
+        return corr_df.corr().round(3)
+    corr_mat = memo.frame("corr_mat", correlations)
 
     tab1, tab2 = st.tabs(["Heatmap", "Feature → Yield Ranking"])
 
     with tab1:
-        fig = px.imshow(corr_mat, text_auto=".2f", aspect="auto",
-                        color_continuous_scale="RdYlGn",
-                        color_continuous_midpoint=0,
-                        title="Full Correlation Matrix")
-        fig.update_layout(height=600)
-        st.plotly_chart(fig, use_container_width=True)
+        def heatmap():
+            fig = px.imshow(corr_mat, text_auto=".2f", aspect="auto",
+                            color_continuous_scale="RdYlGn",
+                            color_continuous_midpoint=0,
+                            title="Full Correlation Matrix")
+            fig.update_layout(height=600)
+            return fig
+        st.plotly_chart(memo.figure("heatmap", heatmap), use_container_width=True)
 
     with tab2:
         target_sel = st.selectbox("Target variable", TARGET_COLS)
         if target_sel in corr_mat.columns:
-            yc = corr_mat[target_sel].drop(TARGET_COLS, errors="ignore").sort_values(key=abs, ascending=True)
-            colors = ["#1B5E20" if v > 0 else "#B71C1C" for v in yc.values]
-            fig2 = go.Figure(go.Bar(x=yc.values, y=yc.index, orientation="h",
-                                    marker_color=colors,
-                                    text=[f"{v:.3f}" for v in yc.values],
-                                    textposition="outside"))
-            fig2.add_vline(x=0, line_color="black", line_width=1)
-            fig2.update_layout(title=f"Feature Correlation with {target_sel}",
-                                xaxis_title="Pearson r", yaxis_title="",
-                                height=500)
-            st.plotly_chart(fig2, use_container_width=True)
+            def target_bars():
+                yc = corr_mat[target_sel].drop(TARGET_COLS, errors="ignore").sort_values(key=abs, ascending=True)
+                colors = ["#1B5E20" if v > 0 else "#B71C1C" for v in yc.values]
+                fig2 = go.Figure(go.Bar(x=yc.values, y=yc.index, orientation="h",
+                                        marker_color=colors,
+                                        text=[f"{v:.3f}" for v in yc.values],
+                                        textposition="outside"))
+                fig2.add_vline(x=0, line_color="black", line_width=1)
+                fig2.update_layout(title=f"Feature Correlation with {target_sel}",
+                                    xaxis_title="Pearson r", yaxis_title="",
+                                    height=500)
+                return fig2
+            st.plotly_chart(memo.figure("target_bars", target_bars, target_sel=target_sel), use_container_width=True)
 
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: ML MODELS
@@ -650,14 +588,48 @@ elif page == "🤖 ML Models":
     st.title("🤖 ML Models")
     st.markdown("Yield regression (GBR, RF, Ridge) and grade proportion models (GBR) with cross-validated metrics.")
 
-    result = train_models(filtered)
+    # Training runs in the background; until it lands, serve the last finished model
+    trainer = get_trainer()
+    job, drift = model_job(filtered, filtered_drift, source.digest)
+    serving = job
+    if not job.done:
+        serving = trainer.latest(source.digest)
+
+        @st.fragment(run_every=1.0)
+        def training_status():
+            if job.done:
+                st.rerun()
+            st.progress(job.progress, text=f"🤖 Training ML models in the background — {job.stage}")
+        training_status()
+
+        if serving is None:
+            st.info("No earlier model to show yet — results appear here when training finishes. Other pages remain usable meanwhile.")
+            st.stop()
+        age_min = (datetime.now().timestamp() - serving.finished) / 60
+        st.warning(f"⏳ **Stale results** — showing a model trained {age_min:.0f} min ago on a different filter selection. "
+                   "They will be replaced automatically when the new model is ready.")
+
+    if serving.error is not None:
+        st.error(f"❌ Model training failed: {serving.error}")
+        st.stop()
+    result = serving.result
     if result is None or result[0] is None:
         st.warning("⚠️ Not enough ML-ready rows to train models. Check filters — ensure at least 10 complete rows with all features.")
         st.stop()
 
     results, grade_models, grade_metrics, imp, best_name, ml_clean = result
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Yield Model Comparison", "Actual vs Predicted", "Feature Importance", "Grade Models"])
+    fp = data_fingerprint(filtered, source.digest)
+    if serving.fingerprint != fp and drift is not None and not drift[1]["retrain"]:
+        n1, n2 = st.columns([4, 1])
+        n1.info(f"♻️ Reusing the latest model — the current rows show no major drift from its training data "
+                f"(max PSI {drift[1]['max_psi']:.2f} < {PSI_RETRAIN}), so no retrain was started. See the Drift tab.")
+        if n2.button("🔁 Retrain anyway"):
+            st.session_state["force_retrain"] = fp
+            st.rerun()
+
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Yield Model Comparison", "Actual vs Predicted", "Feature Importance",
+                                                  "Grade Models", "Hyperparameter Tuning", "📉 Drift"])
 
     with tab1:
         metric_rows = [{"Model":n,"MAE (kg)":r["MAE"],"RMSE (kg)":r["RMSE"],
@@ -726,6 +698,117 @@ elif page == "🤖 ML Models":
         fig5.update_layout(yaxis=dict(autorange="reversed"), showlegend=False, height=400)
         st.plotly_chart(fig5, use_container_width=True)
 
+    with tab5:
+        st.caption("Successive halving: random configurations race on growing row subsets; the weakest two-thirds "
+                   "are dropped each rung, scored in parallel across cores, within a fixed compute budget. "
+                   "Winners are saved and used by every later training run.")
+        c1, c2 = st.columns(2)
+        budget = c1.slider("Compute budget (seconds)", 30, 900, 120, 30)
+        n_cand = c2.slider("Candidates per model", 9, 81, 27, 9)
+        # The search runs on the training executor; this tab only polls it
+        search = trainer.tuning
+        searching = search is not None and not search.done
+        b1, b2 = st.columns(2)
+        if b1.button("🔎 Tune on current filters", type="primary", disabled=searching):
+            trainer.submit_tuning(filtered, budget, n_cand)
+            st.rerun()
+        if b2.button("↩️ Reset to default hyperparameters",
+                     disabled=searching or not os.path.exists(TUNED_PARAMS_PATH)):
+            os.remove(TUNED_PARAMS_PATH)
+            st.rerun()
+        if searching:
+            @st.fragment(run_every=1.0)
+            def tuning_status():
+                if search.done:
+                    st.rerun()
+                st.progress(search.progress, text=f"🔎 Tuning in the background — {search.stage}")
+            tuning_status()
+        elif search is not None and search.error is not None:
+            st.error(f"❌ Tuning failed: {search.error}")
+        elif search is not None and search.result is None:
+            st.warning("⚠️ Not enough ML-ready rows to tune.")
+
+        tuned = load_tuned()
+        if not tuned:
+            st.info("Using hand-picked default hyperparameters — no tuning run saved yet.")
+        else:
+            k1, k2, k3 = st.columns(3)
+            k1.metric("Time spent", f"{tuned['elapsed_s']:.0f} s", f"budget {tuned['budget_s']} s", delta_color="off")
+            k2.metric("Rows searched", tuned["rows"])
+            k3.metric("Tuned at", tuned["tuned_at"].replace("T", " "))
+            trace = pd.DataFrame(tuned["trace"])
+            outcome = trace.dropna(subset=["outcome"]).set_index("model")["outcome"] if "outcome" in trace else {}
+            st.dataframe(pd.DataFrame([{"Model":k, "CV R²":r2, "Outcome":outcome.get(k, "tuned"),
+                                        "Tuned":str(tuned["params"].get(k, "—")),
+                                        "Default":str(DEFAULT_PARAMS["grade" if k.startswith("grade") else k])}
+                                       for k, r2 in tuned["cv_r2"].items()]),
+                         use_container_width=True, hide_index=True)
+            fig6 = px.line(trace, x="rung", y="best_r2", color="model", markers=True,
+                           hover_data=["candidates","rows","seconds"],
+                           title="Search Trace — Best CV R² per Rung",
+                           labels={"rung":"Rung","best_r2":"Best CV R²","model":"Model"})
+            st.plotly_chart(fig6, use_container_width=True)
+            st.dataframe(trace.assign(best_params=trace["best_params"].astype(str)),
+                         use_container_width=True, hide_index=True)
+
+    with tab6:
+        # Scored from the model's training profile and merged per-partition
+        # summaries only; no raw rows are rescanned here
+        if serving.profile is None:
+            st.info("This model was trained before drift profiles were recorded.")
+        else:
+            table, verdict = drift or filtered_drift(serving)
+            d1, d2, d3, d4 = st.columns(4)
+            d1.metric("Max PSI", f"{verdict['max_psi']:.3f}")
+            d2.metric("Features drifting", verdict["drifted"], help=f"PSI ≥ {PSI_WARN} or major drift")
+            d3.metric("Rows (train → current)", f"{verdict['ref_rows']} → {verdict['cur_rows']}")
+            d4.metric("Retrain", "Recommended" if verdict["retrain"] else "Not needed")
+            if verdict["retrain"]:
+                st.warning("⚠️ Major drift from the model's training data: " + "; ".join(verdict["reasons"]))
+            else:
+                st.success("✅ Current rows are within the drift thresholds of the model's training data.")
+
+            fig_d = px.bar(table, x="psi", y="feature", orientation="h", color="status",
+                           color_discrete_map={"Major drift":"#d62728","Moderate drift":"#ff7f0e","Stable":"#2ca02c"},
+                           title="Population Stability Index per Feature (current vs training)",
+                           labels={"psi":"PSI","feature":"","status":"Status"})
+            fig_d.add_vline(x=PSI_WARN, line_dash="dot", line_color="#ff7f0e")
+            fig_d.add_vline(x=PSI_RETRAIN, line_dash="dash", line_color="#d62728")
+            fig_d.update_layout(yaxis=dict(autorange="reversed"), height=550)
+            st.plotly_chart(fig_d, use_container_width=True)
+            st.dataframe(table.rename(columns={"feature":"Feature","kind":"Kind","psi":"PSI","ks":"KS",
+                                               "ref_median":"Train Median","cur_median":"Current Median",
+                                               "new_share":"Unseen Share","status":"Status"}).round(3),
+                         use_container_width=True, hide_index=True)
+
+            dc1, dc2 = st.columns(2)
+            with dc1:
+                season_psi = pd.DataFrame([
+                    {"season": s_, **filtered_drift(serving, s_)[1]}
+                    for s_ in season_order if (filtered["season"] == s_).any()])
+                if not season_psi.empty:
+                    fig_sp = px.bar(season_psi, x="season", y="max_psi", color="retrain",
+                                    color_discrete_map={True:"#d62728", False:"#4A7C59"},
+                                    title="Max PSI by Season vs Training Data",
+                                    labels={"season":"Season","max_psi":"Max PSI","retrain":"Retrain"})
+                    fig_sp.add_hline(y=PSI_RETRAIN, line_dash="dash", line_color="#d62728")
+                    st.plotly_chart(fig_sp, use_container_width=True)
+            with dc2:
+                num = table.loc[table["kind"] == "numeric", "feature"].tolist()
+                if num:
+                    feat = st.selectbox("Quantiles of", num, key="drift_feature")
+                    qs = np.linspace(0.05, 0.95, 19)
+                    cur_prof = filtered_profile()
+                    q_df = pd.DataFrame({"quantile": np.tile(qs, 2),
+                                         "value": np.concatenate([serving.profile.hists[feat].quantile(qs),
+                                                                  cur_prof.hists[feat].quantile(qs)]),
+                                         "data": ["Training"] * len(qs) + ["Current"] * len(qs)})
+                    fig_q = px.line(q_df, x="quantile", y="value", color="data", markers=True,
+                                    color_discrete_map={"Training":"#4A7C59","Current":"#ff7f0e"},
+                                    title=f"{feat} — Quantile Sketch Comparison",
+                                    labels={"quantile":"Quantile","value":feat,"data":""})
+                    st.plotly_chart(fig_q, use_container_width=True)
+
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: YIELD DROP DETECTION
 # ═════════════════════════════════════════════════════════════════════════════
@@ -733,7 +816,7 @@ elif page == "⚠️ Yield Drop Detection":
     st.title("⚠️ Yield Drop Detection")
     st.markdown("Season-over-season comparison flags clusters with critical or moderate yield decline.")
 
-    drop_df = filtered.dropna(subset=["yield_kg","pre_yield_kg"]).copy()
+    drop_df = memo.frame("drop_df", lambda: filtered.dropna(subset=["yield_kg","pre_yield_kg"]))
     if drop_df.empty:
         st.warning("No rows with both current and previous yield data available.")
         st.stop()
@@ -741,72 +824,72 @@ elif page == "⚠️ Yield Drop Detection":
     tab1, tab2, tab3, tab4 = st.tabs(["Status Overview", "Δ% Distribution", "Scatter: Prev vs Current", "Critical Clusters"])
 
     with tab1:
-        sc = drop_df["yield_status"].value_counts().reset_index()
-        sc.columns = ["Status","Count"]
-        sc["Color"] = sc["Status"].astype(str).map(STATUS_COLORS).fillna("grey")
-        fig = go.Figure(go.Bar(x=sc["Status"], y=sc["Count"],
-                               marker_color=sc["Color"],
-                               text=sc["Count"], textposition="outside"))
-        fig.update_layout(title="Cluster-Season Yield Status", xaxis_title="Status", yaxis_title="Count")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(memo.figure("status_bar", lambda: yield_status_bar(drop_df)), use_container_width=True)
 
-        col1, col2, col3, col4 = st.columns(4)
-        for col, status in [(col1,"Critical Drop (>20%)"),(col2,"Moderate Drop (5-20%)"),
-                            (col3,"Stable (±5%)"),(col4,"Improvement (>5%)")]:
-            cnt = (drop_df["yield_status"]==status).sum()
-            col.metric(status, cnt)
+        STATUSES = ["Critical Drop (>20%)","Moderate Drop (5-20%)","Stable (±5%)","Improvement (>5%)"]
+        counts = memo.frame("status_counts", lambda: {s: int((drop_df["yield_status"]==s).sum()) for s in STATUSES})
+        for col, status in zip(st.columns(4), STATUSES):
+            col.metric(status, counts[status])
 
     with tab2:
-        fig2 = px.histogram(drop_df.dropna(subset=["yield_delta_pct"]),
-                             x="yield_delta_pct", nbins=30,
-                             title="Yield Δ% Distribution (Current vs Previous Season)",
-                             labels={"yield_delta_pct":"Δ% Yield"},
-                             color_discrete_sequence=["#6B8E6B"])
-        fig2.add_vline(x=0, line_dash="dash", line_color="red", annotation_text="No change")
-        mean_d = drop_df["yield_delta_pct"].mean()
-        fig2.add_vline(x=mean_d, line_dash="dot", line_color="orange",
-                       annotation_text=f"Mean {mean_d:.1f}%")
-        st.plotly_chart(fig2, use_container_width=True)
+        def delta_hist():
+            fig2 = px.histogram(drop_df.dropna(subset=["yield_delta_pct"]),
+                                 x="yield_delta_pct", nbins=30,
+                                 title="Yield Δ% Distribution (Current vs Previous Season)",
+                                 labels={"yield_delta_pct":"Δ% Yield"},
+                                 color_discrete_sequence=["#6B8E6B"])
+            fig2.add_vline(x=0, line_dash="dash", line_color="red", annotation_text="No change")
+            mean_d = drop_df["yield_delta_pct"].mean()
+            fig2.add_vline(x=mean_d, line_dash="dot", line_color="orange",
+                           annotation_text=f"Mean {mean_d:.1f}%")
+            return fig2
+        st.plotly_chart(memo.figure("delta_hist", delta_hist), use_container_width=True)
 
     with tab3:
-        hover_cols = [c for c in ["cluster_name","farm_name","season","yield_status"] if c in drop_df.columns]
-        fig3 = px.scatter(drop_df.dropna(subset=["pre_yield_kg","yield_kg"]),
-                          x="pre_yield_kg", y="yield_kg",
-                          color="yield_status",
-                          color_discrete_map=STATUS_COLORS,
-                          hover_data=hover_cols,
-                          title="Previous vs Current Yield",
-                          labels={"pre_yield_kg":"Previous Yield (kg)","yield_kg":"Current Yield (kg)"},
-                          opacity=0.75)
-        lim = max(drop_df[["pre_yield_kg","yield_kg"]].max()) * 1.05
-        fig3.add_trace(go.Scatter(x=[0,lim],y=[0,lim],mode="lines",
-                                   line=dict(color="black",dash="dash"),
-                                   showlegend=False, name="No change"))
-        st.plotly_chart(fig3, use_container_width=True)
+        def prev_vs_current():
+            hover_cols = [c for c in ["cluster_name","farm_name","season","yield_status"] if c in drop_df.columns]
+            fig3 = px.scatter(drop_df.dropna(subset=["pre_yield_kg","yield_kg"]),
+                              x="pre_yield_kg", y="yield_kg",
+                              color="yield_status",
+                              color_discrete_map=STATUS_COLORS,
+                              hover_data=hover_cols,
+                              title="Previous vs Current Yield",
+                              labels={"pre_yield_kg":"Previous Yield (kg)","yield_kg":"Current Yield (kg)"},
+                              opacity=0.75)
+            lim = max(drop_df[["pre_yield_kg","yield_kg"]].max()) * 1.05
+            fig3.add_trace(go.Scatter(x=[0,lim],y=[0,lim],mode="lines",
+                                       line=dict(color="black",dash="dash"),
+                                       showlegend=False, name="No change"))
+            return fig3
+        st.plotly_chart(memo.figure("prev_vs_current", prev_vs_current), use_container_width=True)
 
     with tab4:
-        critical = drop_df[drop_df["yield_status"]=="Critical Drop (>20%)"].copy()
+        def critical_table():
+            critical = drop_df[drop_df["yield_status"]=="Critical Drop (>20%)"]
+            show_cols = [c for c in ["cluster_name","farm_name","season","yield_kg","pre_yield_kg",
+                                      "yield_delta_pct","avg_temp_c","soil_ph",
+                                      "pruning_interval_months","fertilizer_frequency"] if c in critical.columns]
+            return critical[show_cols].sort_values("yield_delta_pct").round(2)
+        critical = memo.frame("critical", critical_table)
         if critical.empty:
             st.success("✅ No critical yield drops detected in the selected filters.")
         else:
             st.warning(f"⚠️ {len(critical)} critical drop records found.")
-            show_cols = [c for c in ["cluster_name","farm_name","season","yield_kg","pre_yield_kg",
-                                      "yield_delta_pct","avg_temp_c","soil_ph",
-                                      "pruning_interval_months","fertilizer_frequency"] if c in critical.columns]
-            st.dataframe(critical[show_cols].sort_values("yield_delta_pct").round(2),
-                         use_container_width=True, hide_index=True)
+            st.dataframe(critical, use_container_width=True, hide_index=True)
 
     # Stacked by season
     st.markdown("### Yield Status by Season")
     if "yield_status" in drop_df.columns:
-        ss = (drop_df.groupby(["season","yield_status"], observed=False)
-              .size().reset_index(name="count").sort_values("season"))
-        fig4 = px.bar(ss, x="season", y="count", color="yield_status",
-                      color_discrete_map=STATUS_COLORS,
-                      title="Yield Status Distribution per Season",
-                      labels={"count":"Count","season":"Season","yield_status":"Status"})
-        fig4.update_layout(barmode="stack")
-        st.plotly_chart(fig4, use_container_width=True)
+        def status_by_season():
+            ss = (drop_df.groupby(["season","yield_status"], observed=False)
+                  .size().reset_index(name="count").sort_values("season"))
+            fig4 = px.bar(ss, x="season", y="count", color="yield_status",
+                          color_discrete_map=STATUS_COLORS,
+                          title="Yield Status Distribution per Season",
+                          labels={"count":"Count","season":"Season","yield_status":"Status"})
+            fig4.update_layout(barmode="stack")
+            return fig4
+        st.plotly_chart(memo.figure("status_by_season", status_by_season), use_container_width=True)
 
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: HARVEST DATE ESTIMATOR
@@ -815,8 +898,10 @@ elif page == "🌸 Harvest Date Estimator":
     st.title("🌸 Harvest Date Estimator")
     st.markdown("Estimates harvest date from observed flowering date using historical flowering→harvest intervals.")
 
-    int_df = filtered.dropna(subset=["flowering_to_harvest_days"]).copy()
-    int_df = int_df[int_df["flowering_to_harvest_days"].between(30, 450)]
+    int_df = memo.frame("int_df", lambda:
+        filtered.dropna(subset=["flowering_to_harvest_days"])
+        .loc[lambda d: d["flowering_to_harvest_days"].between(30, 450)])
+    med_i = memo.frame("med_interval", lambda: int_df["flowering_to_harvest_days"].median())
 
     tab1, tab2, tab3 = st.tabs(["Interval Distribution", "Interval vs Climate", "📅 Estimate Date"])
 
@@ -824,16 +909,17 @@ elif page == "🌸 Harvest Date Estimator":
         if int_df.empty:
             st.info("No flowering-to-harvest interval data available.")
         else:
-            med_i = int_df["flowering_to_harvest_days"].median()
-            fig = px.histogram(int_df, x="flowering_to_harvest_days", nbins=25,
-                               title="Flowering → Harvest Interval (days)",
-                               labels={"flowering_to_harvest_days":"Days"},
-                               color_discrete_sequence=["#4A7C59"])
-            fig.add_vline(x=med_i, line_dash="dash", line_color="red",
-                          annotation_text=f"Median {med_i:.0f} d ({med_i/30.44:.1f} mo)")
-            fig.add_vrect(x0=150, x1=200, fillcolor="orange", opacity=0.1, annotation_text="5–7 mo")
-            fig.add_vrect(x0=200, x1=270, fillcolor="blue", opacity=0.07, annotation_text="7–9 mo")
-            st.plotly_chart(fig, use_container_width=True)
+            def interval_hist():
+                fig = px.histogram(int_df, x="flowering_to_harvest_days", nbins=25,
+                                   title="Flowering → Harvest Interval (days)",
+                                   labels={"flowering_to_harvest_days":"Days"},
+                                   color_discrete_sequence=["#4A7C59"])
+                fig.add_vline(x=med_i, line_dash="dash", line_color="red",
+                              annotation_text=f"Median {med_i:.0f} d ({med_i/30.44:.1f} mo)")
+                fig.add_vrect(x0=150, x1=200, fillcolor="orange", opacity=0.1, annotation_text="5–7 mo")
+                fig.add_vrect(x0=200, x1=270, fillcolor="blue", opacity=0.07, annotation_text="7–9 mo")
+                return fig
+            st.plotly_chart(memo.figure("interval_hist", interval_hist), use_container_width=True)
             st.metric("Median interval", f"{med_i:.0f} days ({med_i/30.44:.1f} months)")
 
     with tab2:
@@ -841,21 +927,25 @@ elif page == "🌸 Harvest Date Estimator":
             st.info("Climate data not available for selected filters.")
         else:
             color_col = st.selectbox("Color by", ["elevation_m","avg_rainfall_mm","soil_ph"])
-            fig2 = px.scatter(int_df.dropna(subset=[color_col,"avg_temp_c"]),
-                              x="avg_temp_c", y="flowering_to_harvest_days",
-                              color=color_col, color_continuous_scale="Greens",
-                              hover_data=[c for c in ["cluster_name","season"] if c in int_df.columns],
-                              title="Flowering→Harvest Interval vs Temperature",
-                              labels={"avg_temp_c":"Avg Temp (°C)",
-                                      "flowering_to_harvest_days":"Interval (days)"})
-            st.plotly_chart(fig2, use_container_width=True)
-
-            fig3 = px.box(int_df, x="season", y="flowering_to_harvest_days",
-                          title="Interval Distribution by Season",
-                          color="season",
-                          labels={"flowering_to_harvest_days":"Days"})
-            fig3.update_layout(showlegend=False)
-            st.plotly_chart(fig3, use_container_width=True)
+            def interval_scatter():
+                return px.scatter(int_df.dropna(subset=[color_col,"avg_temp_c"]),
+                                  x="avg_temp_c", y="flowering_to_harvest_days",
+                                  color=color_col, color_continuous_scale="Greens",
+                                  hover_data=[c for c in ["cluster_name","season"] if c in int_df.columns],
+                                  title="Flowering→Harvest Interval vs Temperature",
+                                  labels={"avg_temp_c":"Avg Temp (°C)",
+                                          "flowering_to_harvest_days":"Interval (days)"})
+            st.plotly_chart(memo.figure("interval_scatter", interval_scatter, color_col=color_col),
+                            use_container_width=True)
+
+            def interval_box():
+                fig3 = px.box(int_df, x="season", y="flowering_to_harvest_days",
+                              title="Interval Distribution by Season",
+                              color="season",
+                              labels={"flowering_to_harvest_days":"Days"})
+                fig3.update_layout(showlegend=False)
+                return fig3
+            st.plotly_chart(memo.figure("interval_box", interval_box), use_container_width=True)
 
     with tab3:
         st.subheader("📅 Estimate Your Harvest Date")
@@ -871,7 +961,7 @@ elif page == "🌸 Harvest Date Estimator":
             shade = st.checkbox("Shade trees present", value=True)
 
         if not int_df.empty:
-            base = int_df["flowering_to_harvest_days"].median()
+            base = med_i
         else:
             base = 210
 
@@ -890,6 +980,122 @@ elif page == "🌸 Harvest Date Estimator":
         col_b.metric("Adjustment", f"{adj:+.0f} days")
         col_c.metric("Estimated interval", f"{estimated_days} days")
 
+# ═════════════════════════════════════════════════════════════════════════════
+# PAGE: HARVEST CURVES
+# ═════════════════════════════════════════════════════════════════════════════
+elif page == "🧺 Harvest Curves":
+    st.title("🧺 Harvest Curves")
+    st.markdown("How each season's harvest accumulates pick by pick: ramp-up, peak pick, time to 50% / 90% "
+                "of season yield and Fine-grade drift between early and late picks.")
+
+    # Pick arrays stay flat (values + offsets); the filtered subset and every
+    # aggregate below are segmented reductions, cached per filter combination
+    sub = memo.frame("picks", lambda: picks.subset(filtered["id"]))
+    if len(sub.ids) == 0 or sub.counts.max() <= 1:
+        st.info("This dump stores one harvest total per season. Pick curves need the per-pick arrays of the "
+                "new `harvest_records` schema (`yield_kg`, `grade_fine`, … as arrays).")
+        st.stop()
+
+    def metrics():
+        info = filtered.drop_duplicates("id").set_index("id")[["farm_name","cluster_name","season","province"]]
+        return curve_metrics(sub).join(info)
+    cm = memo.frame("curve_metrics", metrics)
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Harvest Records", f"{len(cm):,}")
+    c2.metric("Median Picks / Season", f"{cm['picks'].median():.0f}")
+    c3.metric("Median Time to 50%", f"{cm['t50_frac'].median():.0%} of picks")
+    c4.metric("Median Time to 90%", f"{cm['t90_frac'].median():.0%} of picks")
+    c5.metric("Late Quality Drops", int((cm["pattern"] == "Late quality drop").sum()))
+
+    tab1, tab2, tab3, tab4 = st.tabs(["Cumulative Curves", "Pick Profile", "Timing", "Per-Cluster Seasons"])
+
+    with tab1:
+        grp = st.selectbox("Compare by", ["season","province","farm_name"], key="curve_group")
+        def curves():
+            labels = cm[grp].reindex(sub.ids).to_numpy()
+            return season_curves(sub, labels)
+        curve_df = memo.frame("season_curves", curves, group=grp)
+        st.caption(f"Seasons with fewer than {FEW_PICKS} picks have no curve shape and are left out.")
+        if curve_df.empty:
+            st.info(f"No harvest record in the current filters has {FEW_PICKS} or more picks.")
+        else:
+            def curve_line():
+                fig = px.line(curve_df, x="progress", y="cum_share", color="group",
+                              title="Mean Cumulative Share of Season Yield vs Season Progress",
+                              labels={"progress":"Share of picks done","cum_share":"Share of season yield",
+                                      "group":grp.replace("_"," ").title()})
+                fig.add_trace(go.Scatter(x=[0,1], y=[0,1], mode="lines", name="Even picking",
+                                         line=dict(color="grey", dash="dot")))
+                fig.update_layout(xaxis_tickformat=".0%", yaxis_tickformat=".0%")
+                return fig
+            st.plotly_chart(memo.figure("curve_line", curve_line, group=grp), use_container_width=True)
+            def fine_line():
+                return px.line(curve_df.dropna(subset=["fine_pct"]), x="progress", y="fine_pct", color="group",
+                               title="Fine % of Picked Yield over the Season",
+                               labels={"progress":"Share of picks done","fine_pct":"Fine %",
+                                       "group":grp.replace("_"," ").title()}).update_layout(xaxis_tickformat=".0%")
+            st.plotly_chart(memo.figure("fine_line", fine_line, group=grp), use_container_width=True)
+
+    with tab2:
+        prof = memo.frame("pick_profile", lambda: pick_profile(sub))
+        def profile_fig():
+            fig = make_subplots(specs=[[{"secondary_y": True}]])
+            fig.add_trace(go.Bar(x=prof["pick"], y=prof["mean_yield_kg"], name="Mean yield per pick (kg)",
+                                 marker_color="#4A7C59", customdata=prof["records"],
+                                 hovertemplate="Pick %{x}: %{y:.2f} kg (%{customdata} seasons)<extra></extra>"))
+            fig.add_trace(go.Scatter(x=prof["pick"], y=prof["fine_pct"], name="Fine %",
+                                     mode="lines", line=dict(color="#C62828")), secondary_y=True)
+            fig.update_layout(title="Mean Yield and Fine % by Pick Number", xaxis_title="Pick")
+            fig.update_yaxes(title_text="Yield (kg)", secondary_y=False)
+            fig.update_yaxes(title_text="Fine %", secondary_y=True)
+            return fig
+        st.plotly_chart(memo.figure("pick_profile_fig", profile_fig), use_container_width=True)
+
+    with tab3:
+        col1, col2 = st.columns(2)
+        with col1:
+            def timing_hist():
+                t = cm[["peak_frac","t50_frac","t90_frac"]].melt(var_name="milestone", value_name="frac")
+                t["milestone"] = t["milestone"].map({"peak_frac":"Peak pick","t50_frac":"50% of yield",
+                                                     "t90_frac":"90% of yield"})
+                return px.histogram(t, x="frac", color="milestone", barmode="overlay", nbins=20, opacity=0.6,
+                                    title="When Seasons Reach Each Milestone",
+                                    labels={"frac":"Share of picks done","milestone":""}).update_layout(
+                                        xaxis_tickformat=".0%")
+            st.plotly_chart(memo.figure("timing_hist", timing_hist), use_container_width=True)
+        with col2:
+            def pattern_bar():
+                pc = cm["pattern"].value_counts().reset_index()
+                pc.columns = ["Pattern","Count"]
+                return px.bar(pc, x="Pattern", y="Count", color="Pattern", text_auto=True,
+                              title="Harvest Patterns").update_layout(showlegend=False)
+            st.plotly_chart(memo.figure("pattern_bar", pattern_bar), use_container_width=True)
+        def drift_scatter():
+            return px.scatter(cm.dropna(subset=["fine_drift_pp"]), x="t50_frac", y="fine_drift_pp",
+                              color="pattern", hover_data=["farm_name","cluster_name","season","picks"],
+                              title="Ramp Speed vs Late-Season Fine % Drift",
+                              labels={"t50_frac":"Time to 50% of yield (share of picks)",
+                                      "fine_drift_pp":"Late − early Fine % (pp)","pattern":"Pattern"}
+                              ).update_layout(xaxis_tickformat=".0%")
+        st.plotly_chart(memo.figure("drift_scatter", drift_scatter), use_container_width=True)
+
+    with tab4:
+        patterns = st.multiselect("Pattern", sorted(cm["pattern"].unique()), default=sorted(cm["pattern"].unique()),
+                                  key="curve_patterns")
+        show = cm[cm["pattern"].isin(patterns)]
+        st.dataframe(show[["farm_name","cluster_name","season","picks","total_yield_kg","peak_pick",
+                           "peak_yield_kg","t50_pick","t90_pick","fine_pct_early","fine_pct_late",
+                           "fine_drift_pp","pattern"]]
+                     .rename(columns={"farm_name":"Farm","cluster_name":"Cluster","season":"Season",
+                                      "picks":"Picks","total_yield_kg":"Season Yield (kg)",
+                                      "peak_pick":"Peak Pick","peak_yield_kg":"Peak Yield (kg)",
+                                      "t50_pick":"Pick @50%","t90_pick":"Pick @90%",
+                                      "fine_pct_early":"Early Fine %","fine_pct_late":"Late Fine %",
+                                      "fine_drift_pp":"Fine Drift (pp)","pattern":"Pattern"})
+                     .sort_values("Fine Drift (pp)"),
+                     use_container_width=True, hide_index=True)
+
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: RECOMMENDATIONS
 # ═════════════════════════════════════════════════════════════════════════════
@@ -898,64 +1104,52 @@ elif page == "💡 Recommendations":
     st.markdown("Rule-based engine aligned to Robusta ideal ranges. Flags deviations per cluster-season.")
 
     latest_s = st.selectbox("Season", season_order[::-1])
-    current = filtered[filtered["season"] == latest_s].copy()
+    current = memo.frame("current", lambda: filtered[filtered["season"] == latest_s], season=latest_s)
 
     if current.empty:
         st.warning("No data for selected season.")
         st.stop()
 
-    all_recs = []
-    for _, row in current.iterrows():
-        recs = get_recommendations(row)
-        for r in recs:
-            r["cluster_name"] = row.get("cluster_name","")
-            r["farm_name"]    = row.get("farm_name","")
-            r["season"]       = row.get("season","")
-            r["yield_kg"]     = row.get("yield_kg")
-            all_recs.append(r)
-
-    if not all_recs:
+    rec_df = memo.frame("rec_df", lambda: recommendations_table(current), season=latest_s)
+
+    if rec_df.empty:
         st.success("✅ All clusters within Robusta ideal ranges for this season.")
         st.stop()
 
-    rec_df = pd.DataFrame(all_recs)
-    PRIORITY_RANK = {"High":0,"Medium":1,"Low":2}
-    rec_df["p_rank"] = rec_df["priority"].map(PRIORITY_RANK)
-    rec_df = rec_df.sort_values(["p_rank","farm_name","cluster_name"]).reset_index(drop=True)
-    rec_df.drop(columns=["p_rank"], inplace=True)
+    PRIORITY_ICONS = {"High":"🔴","Medium":"🟠","Low":"🟢"}
 
-    PRIORITY_COLORS = {"High":"🔴","Medium":"🟠","Low":"🟢"}
+    # Peer index is built once per dataset over every cluster's latest season
+    peers = get_store().artifact(("peers", source.digest), lambda: build_peer_index(flat))
 
-    tab1, tab2, tab3 = st.tabs(["Summary Charts", "Full Recommendations", "Ideal Ranges"])
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Summary Charts", "Full Recommendations", "Ideal Ranges",
+                                                  "🔍 Why Low? (Model)", "🧪 What-If Scenarios", "👥 Peer Benchmark"])
 
     with tab1:
         c1, c2, c3 = st.columns(3)
-        c1.metric("🔴 High Priority",   (rec_df["priority"]=="High").sum())
-        c2.metric("🟠 Medium Priority", (rec_df["priority"]=="Medium").sum())
-        c3.metric("🟢 Low Priority",    (rec_df["priority"]=="Low").sum())
-
-        rec_ct = rec_df.groupby(["factor","priority"]).size().reset_index(name="count")
-        fig = px.bar(rec_ct, x="factor", y="count", color="priority",
-                     color_discrete_map={"High":"#d62728","Medium":"#ff7f0e","Low":"#2ca02c"},
-                     title=f"Recommendations by Factor — {latest_s}",
-                     labels={"factor":"Factor","count":"Clusters Affected","priority":"Priority"})
-        fig.update_layout(xaxis_tickangle=-30)
-        st.plotly_chart(fig, use_container_width=True)
-
-        p_ct = rec_df["priority"].value_counts().reset_index()
-        p_ct.columns = ["Priority","Count"]
-        fig2 = px.pie(p_ct, names="Priority", values="Count",
-                      color="Priority",
-                      color_discrete_map={"High":"#d62728","Medium":"#ff7f0e","Low":"#2ca02c"},
-                      title="Priority Distribution")
-        st.plotly_chart(fig2, use_container_width=True)
+        p_counts = memo.frame("priority_counts", lambda: rec_df["priority"].value_counts().to_dict(), season=latest_s)
+        c1.metric("🔴 High Priority",   p_counts.get("High", 0))
+        c2.metric("🟠 Medium Priority", p_counts.get("Medium", 0))
+        c3.metric("🟢 Low Priority",    p_counts.get("Low", 0))
+
+        st.plotly_chart(memo.figure("recs_by_factor", lambda: recommendations_by_factor(rec_df, latest_s), season=latest_s),
+                        use_container_width=True)
+
+        def priority_pie():
+            p_ct = rec_df["priority"].value_counts().reset_index()
+            p_ct.columns = ["Priority","Count"]
+            return px.pie(p_ct, names="Priority", values="Count",
+                          color="Priority",
+                          color_discrete_map=PRIORITY_COLORS,
+                          title="Priority Distribution")
+        st.plotly_chart(memo.figure("priority_pie", priority_pie, season=latest_s), use_container_width=True)
 
     with tab2:
         priority_filter = st.multiselect("Filter by priority", ["High","Medium","Low"],
                                           default=["High","Medium","Low"])
-        show = rec_df[rec_df["priority"].isin(priority_filter)].copy()
+        show = memo.frame("rec_show", lambda: rec_df[rec_df["priority"].isin(priority_filter)],
+                          season=latest_s, priorities=sorted(priority_filter))
         for _, row in show.iterrows():
-            icon = PRIORITY_COLORS.get(row["priority"],"⚪")
+            icon = PRIORITY_ICONS.get(row["priority"],"⚪")
             with st.expander(f"{icon} [{row['priority']}] {row.get('farm_name','')} — {row.get('cluster_name','')} | {row['factor']} = {row['value']} (ideal: {row['ideal']})"):
                 st.write(row["recommendation"])
 
@@ -982,6 +1176,14 @@ elif page == "💡 Recommendations":
                                                  theta=radar_features+[radar_features[0]],
                                                  fill="toself", name="Ideal (midpoint)",
                                                  line_color="#2ca02c", opacity=0.4))
+                cid = row.get("cluster_id")
+                if cid in peers.table.index:
+                    peer_med = peers.peers(cid)[radar_features].median()
+                    norm_peer = [(v-l)/(h-l) if h!=l else 0.5 for v,l,h in zip(peer_med,lo_n,hi_n)]
+                    fig_r.add_trace(go.Scatterpolar(r=norm_peer+[norm_peer[0]],
+                                                     theta=radar_features+[radar_features[0]],
+                                                     name="Peer median", line_color="#ff7f0e",
+                                                     line_dash="dash"))
                 fig_r.add_trace(go.Scatterpolar(r=norm_vals+[norm_vals[0]],
                                                  theta=radar_features+[radar_features[0]],
                                                  fill="toself", name=cluster_sel,
@@ -991,6 +1193,160 @@ elif page == "💡 Recommendations":
                                      showlegend=True)
                 st.plotly_chart(fig_r, use_container_width=True)
 
+    with tab4:
+        # TreeSHAP attributions are precomputed by the training job, so every
+        # cluster below is a keyed lookup rather than a computation on click.
+        trainer = get_trainer()
+        job = model_job(filtered, filtered_drift, source.digest)[0]
+        if not job.done or job.attributions is None:
+            job = trainer.latest(source.digest)
+            if job is not None:
+                st.caption("⏳ Using attributions from the most recent model — the model for the current filters is still training.")
+        # Attributions are keyed by harvest record id, and only valid for the dump they were computed on
+        attr = job.attributions if job is not None and job.digest == source.digest else None
+        by_id = current.set_index("id", drop=False)
+        ids = by_id.index.intersection(attr["yield_kg"]["phi"].index) if attr else []
+        if len(ids) == 0:
+            st.info("Model explanations appear here once the ML models for these clusters have been trained.")
+        else:
+            y_attr = attr["yield_kg"]
+            pred = y_attr["pred"].loc[ids].sort_values()
+            labels = {f"{by_id.at[i,'farm_name']} — {by_id.at[i,'cluster_name']} "
+                      f"(predicted {pred[i]:.1f} kg)": i for i in pred.index}
+            sel = labels[st.selectbox("Cluster (lowest predicted yield first)", list(labels))]
+            phi = y_attr["phi"].loc[sel]
+            k1, k2, k3 = st.columns(3)
+            k1.metric("Predicted yield", f"{pred[sel]:.1f} kg", f"{pred[sel]-y_attr['base']:+.1f} kg vs average")
+            k2.metric("Model baseline", f"{y_attr['base']:.1f} kg")
+            k3.metric("Actual yield", f"{by_id.at[sel,'yield_kg']:.1f} kg" if pd.notna(by_id.at[sel,"yield_kg"]) else "—")
+
+            top = phi.reindex(phi.abs().sort_values(ascending=False).index)
+            shown, rest = top.head(8), top.iloc[8:].sum()
+            fig_w = go.Figure(go.Waterfall(
+                orientation="h",
+                measure=["absolute"] + ["relative"]*(len(shown)+1) + ["total"],
+                y=["Baseline"] + [f"{f} = {by_id.at[sel,f]:.4g}" for f in shown.index] + ["Other features", "Predicted"],
+                x=[y_attr["base"]] + list(shown.values) + [rest, 0],
+                decreasing=dict(marker_color="#B71C1C"), increasing=dict(marker_color="#1B5E20"),
+                totals=dict(marker_color="#4A7C59")))
+            fig_w.update_layout(title="Why is this cluster's predicted yield where it is? (TreeSHAP, kg)",
+                                yaxis=dict(autorange="reversed"), height=500, showlegend=False)
+            st.plotly_chart(fig_w, use_container_width=True)
+
+            drags = shown[shown < 0]
+            if not drags.empty:
+                st.markdown("**Biggest drags on predicted yield:** " +
+                            ", ".join(f"`{f}` ({v:+.1f} kg)" for f, v in drags.items()))
+
+            g_rows = []
+            for target in ["fine_grade_pct","premium_grade_pct","commercial_grade_pct"]:
+                g = attr[target]
+                g_phi = g["phi"].loc[sel]
+                worst = g_phi.sort_values().head(3)
+                g_rows.append({"Grade": target.replace("_grade_pct","").title(),
+                               "Predicted %": round(g["pred"].loc[sel], 2),
+                               "Baseline %": round(g["base"], 2),
+                               "Top negative drivers": ", ".join(f"{f} ({v:+.2f})" for f, v in worst.items() if v < 0) or "—"})
+            st.dataframe(pd.DataFrame(g_rows), use_container_width=True, hide_index=True)
+
+    with tab5:
+        # Every scenario × cluster is scored in batched predict() calls and the
+        # result cached by (model version, scenario grid + clusters)
+        st.markdown(f"Predicted effect of management changes on the **{latest_s}** clusters, "
+                    "relative to the model's prediction for current practice.")
+        job = model_job(filtered, filtered_drift, source.digest)[0]
+        if not job.done or job.result is None or job.result[0] is None:
+            job = get_trainer().latest(source.digest)
+        if job is None:
+            st.info("Scenarios can be simulated once the ML models for these clusters have been trained.")
+        else:
+            defaults = {"fert_freq_enc": ["Often"], "shade_binary": ["Present"], "pruning_interval_months": ["12 months"]}
+            lever_cols = st.columns(len(LEVERS))
+            choices = {}
+            for lc, (feat, (label, opts)) in zip(lever_cols, LEVERS.items()):
+                picked = lc.multiselect(label, list(opts), default=defaults.get(feat, []), key=f"whatif_{feat}")
+                choices[feat] = [opts[p] for p in picked]
+            grid = scenario_grid(choices)
+            results_j, grade_models_j, _, _, best_j, _ = job.result
+            summary, per_row = get_store().artifact(
+                ("scenarios", source.digest, job.fingerprint, grid_key(grid, current)),
+                lambda: simulate(current, grid, results_j[best_j]["model"], grade_models_j["fine_grade_pct"]))
+            if summary.empty:
+                st.info("No ML-ready clusters in this season.")
+            elif len(grid) == 1:
+                st.info("Pick at least one intervention above.")
+            else:
+                st.caption(f"{len(grid):,} scenarios × {len(per_row)//len(grid):,} clusters = {len(per_row):,} "
+                           f"predictions · yield model: {best_j}")
+                ranked = summary.iloc[1:].sort_values("yield_uplift_kg", ascending=False)
+                top_sc = ranked.head(15).iloc[::-1]
+                fig_s = px.bar(top_sc, x="yield_uplift_kg", y="scenario", orientation="h",
+                               color="fine_uplift_pp", color_continuous_scale="RdYlGn",
+                               title="Top Scenarios by Predicted Yield Uplift (mean kg per cluster)",
+                               labels={"yield_uplift_kg":"Yield uplift (kg)","scenario":"",
+                                       "fine_uplift_pp":"Fine % Δ (pp)"})
+                st.plotly_chart(fig_s, use_container_width=True)
+                st.dataframe(ranked.rename(columns={
+                                 "scenario":"Scenario","changes":"Changes","pred_yield_kg":"Pred. Yield (kg)",
+                                 "yield_uplift_kg":"Yield Uplift (kg)","yield_uplift_pct":"Yield Uplift (%)",
+                                 "clusters_improved":"Clusters Improved","pred_fine_pct":"Pred. Fine %",
+                                 "fine_uplift_pp":"Fine % Uplift (pp)"}).round(2),
+                             use_container_width=True, hide_index=True)
+
+                sc_sel = st.selectbox("Per-cluster breakdown", ranked["scenario"].tolist(), key="whatif_detail")
+                base = per_row[per_row["scenario"] == summary["scenario"].iloc[0]].set_index("row")
+                alt = per_row[per_row["scenario"] == sc_sel].set_index("row")
+                detail = pd.DataFrame({"Farm": current.loc[alt.index, "farm_name"],
+                                       "Cluster": current.loc[alt.index, "cluster_name"],
+                                       "Current Pred. (kg)": base["pred_yield_kg"],
+                                       "Scenario Pred. (kg)": alt["pred_yield_kg"],
+                                       "Yield Uplift (kg)": alt["pred_yield_kg"] - base["pred_yield_kg"],
+                                       "Fine % Uplift (pp)": alt["pred_fine_pct"] - base["pred_fine_pct"]})
+                st.dataframe(detail.sort_values("Yield Uplift (kg)", ascending=False).round(2),
+                             use_container_width=True, hide_index=True)
+
+    with tab6:
+        # Peers are matched on growing conditions only, so differences in yield
+        # among them point at practice rather than setting
+        st.markdown("Clusters with the most similar growing conditions (" +
+                    ", ".join(f"`{f}`" for f in PEER_FEATURES) + "). Every cluster is profiled on its latest "
+                    "season only, and peers are drawn from all farms.")
+        in_idx = current[current["cluster_id"].isin(peers.table.index)]
+        if in_idx.empty:
+            st.info("No clusters of this season are in the peer index.")
+        else:
+            opts = dict(zip(in_idx["farm_name"].astype(str) + " — " + in_idx["cluster_name"].astype(str),
+                            in_idx["cluster_id"]))
+            pc1, pc2 = st.columns([3, 1])
+            cid = opts[pc1.selectbox("Cluster", list(opts), key="peer_cluster")]
+            k_peers = pc2.slider("Peers", 3, 20, 10, key="peer_k")
+            me, nbrs = peers.table.loc[cid], peers.peers(cid, k_peers)
+            pct = peers.peer_percentiles(cid, k_peers)
+            m1, m2, m3, m4 = st.columns(4)
+            m1.metric("Peer cohort", f"#{me['cohort'] + 1}", help=f"{peers.cohorts.at[me['cohort'], 'clusters']} clusters")
+            m2.metric("Yield vs peers", f"P{pct['yield_pctile']:.0f}" if pd.notna(pct["yield_pctile"]) else "—",
+                      f"{me['yield_kg'] - nbrs['yield_kg'].median():+.1f} kg vs peer median")
+            m3.metric("Fine % vs peers", f"P{pct['fine_pctile']:.0f}" if pd.notna(pct["fine_pctile"]) else "—",
+                      f"{me['fine_grade_pct'] - nbrs['fine_grade_pct'].median():+.1f} pp vs peer median")
+            m4.metric("Yield (all clusters)", f"P{me['yield_pctile']:.0f}")
+
+            st.dataframe(nbrs[["distance","farm_name","cluster_name","municipality","season","yield_kg",
+                               "yield_pctile","fine_grade_pct","fine_pctile","pruning_interval_months",
+                               "fertilizer_frequency"]]
+                         .rename(columns={"distance":"Distance","farm_name":"Farm","cluster_name":"Cluster",
+                                          "municipality":"Municipality","season":"Season","yield_kg":"Yield (kg)",
+                                          "yield_pctile":"Yield Pctile","fine_grade_pct":"Fine %",
+                                          "fine_pctile":"Fine Pctile","pruning_interval_months":"Pruning (mo)",
+                                          "fertilizer_frequency":"Fertilizer Freq."}).round(2),
+                         use_container_width=True, hide_index=True)
+
+            insights = peers.cohort_insights(me["cohort"])
+            st.markdown(f"**What top-quartile peers in cohort #{me['cohort'] + 1} do differently**")
+            if insights:
+                st.markdown("\n".join(f"- {line}" for line in insights))
+            else:
+                st.caption("Top-quartile peers follow the same practices as the rest of the cohort.")
+
 # ═════════════════════════════════════════════════════════════════════════════
 # PAGE: RAW DATA
 # ═════════════════════════════════════════════════════════════════════════════
@@ -999,10 +1355,10 @@ elif page == "🗃️ Raw Data":
     st.caption("Filtered flat analytics table — all pipeline-derived columns.")
 
     search = st.text_input("🔍 Search cluster / farm name")
-    show_df = filtered.copy()
+    show_df, show_ids = filtered, row_ids
     if search:
-        mask = show_df.apply(lambda col: col.astype(str).str.contains(search, case=False, na=False)).any(axis=1)
-        show_df = show_df[mask]
+        hit = filtered.apply(lambda col: col.astype(str).str.contains(search, case=False, na=False)).any(axis=1).to_numpy()
+        show_df, show_ids = filtered[hit], row_ids[hit]
 
     cols_to_show = st.multiselect(
         "Select columns to display",
@@ -1015,11 +1371,15 @@ elif page == "🗃️ Raw Data":
     )
     st.dataframe(show_df[cols_to_show].reset_index(drop=True), use_container_width=True)
 
-    @st.cache_data
-    def to_csv(df):
-        return df.to_csv(index=False).encode("utf-8")
-
-    st.download_button("⬇️ Download filtered table as CSV",
-                        data=to_csv(show_df[cols_to_show]),
-                        file_name="coffee_analytics_filtered.csv",
-                        mime="text/csv")
\ No newline at end of file
+    # Export streams chunks straight from the shared table by row id; it only
+    # runs when the button is clicked, on Streamlit's download thread.
+    st.markdown("### ⬇️ Export")
+    e1, e2 = st.columns(2)
+    fmt = e1.selectbox("Format", available_formats(),
+                       format_func={"csv":"CSV","parquet":"Parquet","arrow":"Arrow IPC"}.get)
+    compression = e2.selectbox("Compression", FORMATS[fmt][2])
+    export_cols = cols_to_show or list(flat.columns)
+    st.download_button(f"⬇️ Download {len(show_ids):,} filtered rows",
+                        data=lambda: export_file(flat, show_ids, export_cols, fmt, compression),
+                        file_name=file_name("coffee_analytics_filtered", fmt, compression),
+                        mime="application/gzip" if fmt == "csv" and compression == "gzip" else FORMATS[fmt][1])
@@ -0,0 +1,58 @@
+# ============================================================
+# ☕ Shared Charts
+# Plotly figure builders used by both the dashboard pages and the
+# headless per-farm reports
+# ============================================================
+
+import plotly.express as px
+import plotly.graph_objects as go
+
+STATUS_COLORS = {
+    "Critical Drop (>20%)":  "#d62728",
+    "Moderate Drop (5-20%)": "#ff7f0e",
+    "Stable (±5%)":          "#2ca02c",
+    "Improvement (>5%)":     "#1f77b4",
+}
+PRIORITY_COLORS = {"High": "#d62728", "Medium": "#ff7f0e", "Low": "#2ca02c"}
+
+def season_yield_bar(df, title="Total Yield per Season (kg)"):
+    s_agg = df.groupby("season")["yield_kg"].agg(["sum","mean"]).reset_index().sort_values("season")
+    fig = px.bar(s_agg, x="season", y="sum",
+                 title=title,
+                 labels={"sum":"Total Yield (kg)","season":"Season"},
+                 color_discrete_sequence=["#4A7C59"],
+                 text_auto=".0f")
+    fig.update_traces(textposition="outside")
+    fig.update_layout(showlegend=False)
+    return fig
+
+def grade_donut(df, title="Overall Grade Composition (kg)"):
+    totals = df[["grade_fine","grade_premium","grade_commercial"]].sum()
+    fig = go.Figure(go.Pie(
+        labels=["Fine","Premium","Commercial"],
+        values=totals.values,
+        marker_colors=["#1B5E20","#66BB6A","#C8E6C9"],
+        hole=0.4,
+        textinfo="label+percent"
+    ))
+    fig.update_layout(title=title)
+    return fig
+
+def yield_status_bar(drop_df, title="Cluster-Season Yield Status"):
+    sc = drop_df["yield_status"].value_counts().reset_index()
+    sc.columns = ["Status","Count"]
+    sc["Color"] = sc["Status"].astype(str).map(STATUS_COLORS).fillna("grey")
+    fig = go.Figure(go.Bar(x=sc["Status"], y=sc["Count"],
+                           marker_color=sc["Color"],
+                           text=sc["Count"], textposition="outside"))
+    fig.update_layout(title=title, xaxis_title="Status", yaxis_title="Count")
+    return fig
+
+def recommendations_by_factor(rec_df, season):
+    rec_ct = rec_df.groupby(["factor","priority"]).size().reset_index(name="count")
+    fig = px.bar(rec_ct, x="factor", y="count", color="priority",
+                 color_discrete_map=PRIORITY_COLORS,
+                 title=f"Recommendations by Factor — {season}",
+                 labels={"factor":"Factor","count":"Clusters Affected","priority":"Priority"})
+    fig.update_layout(xaxis_tickangle=-30)
+    return fig
@@ -0,0 +1,327 @@
+# ============================================================
+# ☕ Drift Monitoring
+# Mergeable per-feature summaries (streaming histograms that double
+# as quantile sketches) kept per model version and per ingested
+# (farm, season) partition; PSI / KS drift is scored from the
+# summaries alone, never from a rescan of the rows
+# ============================================================
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+MAX_BINS   = 64    # centroids kept per feature summary
+PSI_BINS   = 10    # reference-quantile bins PSI is scored on
+PSI_WARN   = 0.10  # moderate shift
+PSI_RETRAIN = 0.25 # major shift: retraining recommended
+KS_RETRAIN = 0.30
+NEW_CATEGORY_RETRAIN = 0.10  # share of rows in categories the model never saw
+
+DRIFT_EXEMPT = {"season_idx"}  # moves every season by construction
+CATEGORICAL  = ["province"]
+PARTITION_BY = ["farm_id", "season"]
+LIBRARY_BYTES = 64 << 20  # centroid bytes of partition profiles kept for reuse across dumps
+
+class StreamingHistogram:
+    """Ben-Haim & Tom-Tov style histogram: at most ``max_bins`` (mean, count) centroids.
+
+    Batches are folded in with :meth:`update` and whole summaries combined
+    with :meth:`merge`; the closest centroids are merged when over budget.
+    While nothing has been merged (e.g. encoded categorical features) the
+    centroids are the exact distinct values and the CDF is exact.
+    """
+
+    __slots__ = ("means", "counts", "max_bins", "exact")
+
+    def __init__(self, max_bins=MAX_BINS):
+        self.means, self.counts = np.empty(0), np.empty(0)
+        self.max_bins, self.exact = max_bins, True
+
+    @property
+    def n(self):
+        return float(self.counts.sum())
+
+    @property
+    def nbytes(self):
+        return self.means.nbytes + self.counts.nbytes
+
+    def update(self, values):
+        v = np.asarray(values, dtype=np.float64)
+        v = np.sort(v[~np.isnan(v)])
+        if not len(v):
+            return self
+        first = np.flatnonzero(np.concatenate(([True], v[1:] != v[:-1])))   # runs of equal sorted values
+        means, counts = v[first], np.diff(np.append(first, len(v)))
+        if not len(self.means) and len(means) <= self.max_bins:
+            # Fresh summary of few distinct values: exact as is
+            self.means, self.counts = means, counts.astype(np.float64)
+            return self
+        if len(means) > 4 * self.max_bins:
+            # Pre-bin large batches into equal-count chunks before the exact merge pass
+            chunks = np.array_split(v, 4 * self.max_bins)
+            means = np.array([c.mean() for c in chunks])
+            counts = np.array([len(c) for c in chunks])
+            self.exact = False
+        return self._absorb(means, counts.astype(np.float64))
+
+    def merge(self, other):
+        return StreamingHistogram.merge_all([self, other], self.max_bins)
+
+    @classmethod
+    def merge_all(cls, hists, max_bins=None):
+        """Merge any number of summaries with one sort and one compression pass.
+
+        The result keeps the smallest ``max_bins`` of the inputs unless given.
+        """
+        hists = list(hists)
+        out = cls(max_bins or min((h.max_bins for h in hists), default=MAX_BINS))
+        if not hists:
+            return out
+        out.exact = all(h.exact for h in hists)
+        return out._absorb(np.concatenate([h.means for h in hists]), np.concatenate([h.counts for h in hists]))
+
+    def _absorb(self, means, counts):
+        m = np.concatenate([self.means, means])
+        c = np.concatenate([self.counts, counts])
+        # Identical values collapse without losing exactness
+        uniq, inv = np.unique(m, return_inverse=True)
+        m, c = uniq, np.bincount(inv, weights=c)
+        if len(m) > 4 * self.max_bins:
+            # Bulk merges: pre-bin into equal-count buckets so the exact pass below stays short
+            k = 4 * self.max_bins
+            b = np.minimum(((np.cumsum(c) - c / 2) / c.sum() * k).astype(np.int64), k - 1)
+            w = np.bincount(b, weights=c, minlength=k)
+            m, c = (np.bincount(b, weights=m * c, minlength=k) / np.where(w > 0, w, 1))[w > 0], w[w > 0]
+            self.exact = False
+        while len(m) > self.max_bins:
+            i = int(np.argmin(np.diff(m)))
+            total = c[i] + c[i + 1]
+            m[i] = (m[i] * c[i] + m[i + 1] * c[i + 1]) / total
+            c[i] = total
+            m, c = np.delete(m, i + 1), np.delete(c, i + 1)
+            self.exact = False
+        self.means, self.counts = m, c
+        return self
+
+    def cdf(self, x):
+        """Share of values ``<= x``."""
+        x = np.asarray(x, dtype=np.float64)
+        if not len(self.means):
+            return np.full(x.shape, np.nan)
+        cum = np.cumsum(self.counts)
+        if self.exact:
+            idx = np.searchsorted(self.means, x, side="right")
+            return np.where(idx > 0, cum[np.clip(idx - 1, 0, None)], 0.0) / cum[-1]
+        # Each centroid's mass is centred on its mean
+        return np.interp(x, self.means, cum - self.counts / 2, left=0.0, right=cum[-1]) / cum[-1]
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=np.float64)
+        if not len(self.means):
+            return np.full(q.shape, np.nan)
+        cum = np.cumsum(self.counts)
+        if self.exact:
+            return self.means[np.clip(np.searchsorted(cum, q * cum[-1], side="left"), 0, len(cum) - 1)]
+        return np.interp(q * cum[-1], cum - self.counts / 2, self.means)
+
+class DriftProfile:
+    """Per-feature :class:`StreamingHistogram`s plus category counts for one row set."""
+
+    def __init__(self, features, categorical=CATEGORICAL, max_bins=MAX_BINS):
+        self.features    = list(features)
+        self.categorical = list(categorical)
+        self.hists   = {f: StreamingHistogram(max_bins) for f in self.features}
+        self.missing = dict.fromkeys(self.features, 0)
+        self.cats    = {c: {} for c in self.categorical}
+        self.n_rows  = 0
+
+    @classmethod
+    def from_frame(cls, df, features, categorical=CATEGORICAL):
+        return cls(features, categorical).update(df)
+
+    @property
+    def nbytes(self):
+        return sum(h.nbytes for h in self.hists.values())
+
+    def update(self, df):
+        """Fold a batch of rows into the profile (incremental ingest)."""
+        num = {f: pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+               for f in self.features if f in df.columns}
+        cat = {c: df[c].astype(str).to_numpy() for c in self.categorical if c in df.columns}
+        return self._fold(len(df), num, cat)
+
+    def _fold(self, n_rows, num, cat):
+        # ``num``: feature -> float array, ``cat``: column -> str array, all of the same rows
+        self.n_rows += n_rows
+        for f, vals in num.items():
+            self.missing[f] += int(np.isnan(vals).sum())
+            self.hists[f].update(vals)
+        for c, vals in cat.items():
+            for k, v in zip(*np.unique(vals, return_counts=True)):
+                self.cats[c][k] = self.cats[c].get(k, 0) + int(v)
+        return self
+
+    def merge(self, other):
+        return DriftProfile.merge_all([self, other], self.features, self.categorical)
+
+    @classmethod
+    def merge_all(cls, profiles, features, categorical=CATEGORICAL):
+        """One profile of many: each feature's summaries are merged in a single pass."""
+        profiles = list(profiles)
+        out = cls(features, categorical)
+        out.n_rows = sum(p.n_rows for p in profiles)
+        for f in out.features:
+            out.hists[f] = StreamingHistogram.merge_all([p.hists[f] for p in profiles])
+            out.missing[f] = sum(p.missing[f] for p in profiles)
+        for c in out.categorical:
+            for p in profiles:
+                for k, v in p.cats[c].items():
+                    out.cats[c][k] = out.cats[c].get(k, 0) + v
+        return out
+
+class ProfileLibrary:
+    """Partition content hash -> :class:`DriftProfile`, shared across dumps.
+
+    Bounded by ``budget_bytes`` of summaries; the least recently used
+    profiles are dropped first (a dump still holding one keeps it alive).
+    """
+
+    def __init__(self, budget_bytes=LIBRARY_BYTES):
+        self.budget_bytes = budget_bytes
+        self.nbytes    = 0
+        self._lock     = threading.Lock()
+        self._profiles = OrderedDict()
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, key):
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is not None:
+                self._profiles.move_to_end(key)
+            return profile
+
+    def put(self, key, profile):
+        with self._lock:
+            if key not in self._profiles:
+                self.nbytes += profile.nbytes
+            self._profiles[key] = profile
+            while self.nbytes > self.budget_bytes and len(self._profiles) > 1:
+                self.nbytes -= self._profiles.popitem(last=False)[1].nbytes
+
+class PartitionedProfiles:
+    """Ingest-time profiles per ``PARTITION_BY`` key, merged on demand for any filter.
+
+    ``library`` (a :class:`ProfileLibrary`) is shared across dumps: a partition
+    whose rows are unchanged in a new dump reuses its profile instead of
+    being re-summarised, so only new or changed partitions cost anything.
+    """
+
+    def __init__(self, df, features, by=PARTITION_BY, library=None):
+        self.by, self.features = list(by), list(features)
+        cols = [c for c in self.features + CATEGORICAL if c in df.columns]
+        row_hash = pd.util.hash_pandas_object(df[cols], index=False)
+        part_hash = row_hash.groupby([df[c] for c in self.by], sort=False, observed=True).agg(["sum", "size"])
+        library = ProfileLibrary() if library is None else library
+        self.parts, self.reused = {}, 0
+        # Columns are converted once; partitions are then numpy slices of one sort
+        num = {f: pd.to_numeric(df[f], errors="coerce").to_numpy(dtype=np.float64)
+               for f in self.features if f in df.columns}
+        cat = {c: df[c].astype(str).to_numpy() for c in CATEGORICAL if c in df.columns}
+        codes = df.groupby(self.by, sort=False, observed=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(part_hash) + 1))
+        for i, (k, h) in enumerate(zip(part_hash.index, part_hash.itertuples(index=False, name=None))):
+            h = tuple(int(x) for x in h)
+            profile = library.get(h)
+            if profile is not None:
+                self.reused += 1
+            else:
+                idx = order[bounds[i]:bounds[i + 1]]
+                profile = DriftProfile(self.features)._fold(
+                    len(idx), {f: v[idx] for f, v in num.items()}, {c: v[idx] for c, v in cat.items()})
+                library.put(h, profile)
+            self.parts[k] = profile
+        self.nbytes = sum(p.nbytes for p in self.parts.values())
+
+    def merged(self, keys=None):
+        """Profile of the given partition keys (all partitions if ``None``)."""
+        keys = self.parts if keys is None else keys
+        return DriftProfile.merge_all([self.parts[k] for k in keys if k in self.parts], self.features)
+
+    def for_rows(self, rows):
+        """Profile of the partitions ``rows`` falls in; only the key columns are read."""
+        keys = rows[self.by].drop_duplicates().itertuples(index=False, name=None)
+        return self.merged(list(keys))
+
+# ═════════════════════════════════════════════════════════════════════════════
+# DRIFT SCORES
+# ═════════════════════════════════════════════════════════════════════════════
+
+def _psi(ref_p, cur_p, ref_n, cur_n, alpha=0.5):
+    # Additive smoothing of the bin counts keeps empty bins of small samples finite
+    k = len(ref_p)
+    ref_p = (ref_p * ref_n + alpha) / (ref_n + alpha * k)
+    cur_p = (cur_p * cur_n + alpha) / (cur_n + alpha * k)
+    return float(((cur_p - ref_p) * np.log(cur_p / ref_p)).sum())
+
+def feature_drift(ref, cur, n_bins=PSI_BINS):
+    """``(psi, ks)`` between two :class:`StreamingHistogram`s.
+
+    PSI uses bins at the reference deciles; KS is the largest CDF gap over
+    every centroid of either summary.
+    """
+    if not ref.n or not cur.n:
+        return np.nan, np.nan
+    edges = np.unique(ref.quantile(np.linspace(0, 1, n_bins + 1)[1:-1]))
+    cuts = lambda h: np.diff(np.concatenate([[0.0], h.cdf(edges), [1.0]]))
+    grid = np.union1d(ref.means, cur.means)
+    return _psi(cuts(ref), cuts(cur), ref.n, cur.n), float(np.abs(ref.cdf(grid) - cur.cdf(grid)).max())
+
+def category_drift(ref_counts, cur_counts):
+    """``(psi, share of current rows in categories absent from the reference)``."""
+    keys = sorted(set(ref_counts) | set(cur_counts))
+    r = np.array([ref_counts.get(k, 0) for k in keys], dtype=np.float64)
+    c = np.array([cur_counts.get(k, 0) for k in keys], dtype=np.float64)
+    if not r.sum() or not c.sum():
+        return np.nan, np.nan
+    new = sum(v for k, v in cur_counts.items() if k not in ref_counts) / c.sum()
+    return _psi(r / r.sum(), c / c.sum(), r.sum(), c.sum()), float(new)
+
+def drift_report(ref, cur):
+    """Per-feature drift of profile ``cur`` against ``ref`` and a retrain verdict.
+
+    Returns ``(table, verdict)``: ``table`` has psi / ks / medians / status per
+    feature, ``verdict`` is ``{"retrain": bool, "reasons": [...], ...}``.
+    """
+    rows = []
+    for f in ref.features:
+        if f in DRIFT_EXEMPT or f not in cur.hists:
+            continue
+        h_ref, h_cur = ref.hists[f], cur.hists[f]
+        psi, ks = feature_drift(h_ref, h_cur)
+        rows.append({"feature": f, "kind": "numeric", "psi": psi, "ks": ks,
+                     "ref_median": float(h_ref.quantile(0.5)), "cur_median": float(h_cur.quantile(0.5)),
+                     "new_share": np.nan})
+    for c in ref.categorical:
+        psi, new = category_drift(ref.cats.get(c, {}), cur.cats.get(c, {}))
+        rows.append({"feature": c, "kind": "category", "psi": psi, "ks": np.nan,
+                     "ref_median": np.nan, "cur_median": np.nan, "new_share": new})
+    table = pd.DataFrame(rows)
+    table["status"] = np.select(
+        [(table["psi"] >= PSI_RETRAIN) | (table["ks"] >= KS_RETRAIN) | (table["new_share"] >= NEW_CATEGORY_RETRAIN),
+         table["psi"] >= PSI_WARN],
+        ["Major drift", "Moderate drift"], "Stable")
+    table = table.sort_values("psi", ascending=False, na_position="last").reset_index(drop=True)
+
+    major = table[table["status"] == "Major drift"]
+    reasons = [f"{r.feature}: " + (f"{r.new_share:.0%} of rows in unseen categories" if r.kind == "category" and
+                                   r.new_share >= NEW_CATEGORY_RETRAIN else f"PSI {r.psi:.2f}, KS {r.ks:.2f}")
+               for r in major.itertuples()]
+    verdict = {"retrain": bool(len(major)), "reasons": reasons,
+               "max_psi": float(table["psi"].max()) if len(table) else 0.0,
+               "drifted": int((table["status"] != "Stable").sum()),
+               "ref_rows": ref.n_rows, "cur_rows": cur.n_rows}
+    return table, verdict
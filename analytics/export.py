@@ -0,0 +1,130 @@
+# ============================================================
+# ☕ Streaming Export
+# Chunked CSV / Parquet / Arrow IPC export of selected rows of the
+# flat analytics table — used by the Raw Data page and headlessly:
+#   python export.py coffee_bean_quality_dataset.sql -o extract.parquet
+# ============================================================
+
+import argparse, gzip, io, sys, time
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV export still works without pyarrow
+    pa = pq = None
+
+CHUNK_ROWS = 50_000
+
+# format -> (file extension, mime type, compression choices; first is default)
+FORMATS = {
+    "csv":     (".csv",     "text/csv",                                ["none", "gzip"]),
+    "parquet": (".parquet", "application/vnd.apache.parquet",          ["zstd", "snappy", "gzip", "none"]),
+    "arrow":   (".arrow",   "application/vnd.apache.arrow.file",       ["lz4", "zstd", "none"]),
+}
+
+def available_formats():
+    return [f for f in FORMATS if f == "csv" or pa is not None]
+
+def file_name(stem, fmt, compression):
+    ext = FORMATS[fmt][0]
+    return stem + ext + (".gz" if fmt == "csv" and compression == "gzip" else "")
+
+def _iter_chunks(flat, row_ids, columns, chunk_rows):
+    """Yield column-selected slices of ``flat`` for consecutive row-id batches."""
+    cols = [flat.columns.get_loc(c) for c in columns]
+    for start in range(0, len(row_ids), chunk_rows):
+        yield flat.iloc[row_ids[start:start + chunk_rows], cols]
+
+def _arrow_schema(flat, columns):
+    # Infer from the full columns' dtypes; all-null object columns become strings
+    schema = pa.Schema.from_pandas(flat[columns].iloc[:0], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema
+
+def write_export(out, flat, row_ids, columns, fmt="csv", compression=None, chunk_rows=CHUNK_ROWS):
+    """Stream ``flat.iloc[row_ids][columns]`` to the binary file ``out``.
+
+    Rows are gathered and encoded ``chunk_rows`` at a time, so peak memory is
+    one chunk rather than the whole selection. Returns the number of rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    if fmt != "csv" and pa is None:
+        raise RuntimeError(f"{fmt} export requires pyarrow")
+    compression = compression or FORMATS[fmt][2][0]
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    chunks = _iter_chunks(flat, row_ids, columns, chunk_rows)
+
+    if fmt == "csv":
+        raw = gzip.GzipFile(fileobj=out, mode="wb") if compression == "gzip" else out
+        text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        pd.DataFrame(columns=columns).to_csv(text, index=False)
+        for chunk in chunks:
+            chunk.to_csv(text, index=False, header=False)
+        text.flush()
+        text.detach()
+        if raw is not out:
+            raw.close()
+        return len(row_ids)
+
+    schema = _arrow_schema(flat, columns)
+    codec = None if compression == "none" else compression
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(out, schema, compression=codec or "none")
+    else:
+        writer = pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+    with writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    return len(row_ids)
+
+def export_file(flat, row_ids, columns, fmt="csv", compression=None, chunk_rows=CHUNK_ROWS):
+    """Export into memory and return the encoded file as ``bytes``.
+
+    ``bytes`` is what ``st.download_button`` accepts from a deferred ``data``
+    callable; the rows are still gathered and encoded one chunk at a time.
+    """
+    out = io.BytesIO()
+    write_export(out, flat, row_ids, columns, fmt, compression, chunk_rows)
+    return out.getvalue()
+
+# ═════════════════════════════════════════════════════════════════════════════
+# HEADLESS ENTRY POINT
+# ═════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    from loader import DumpSource, filter_mask, load_source
+
+    ap = argparse.ArgumentParser(description="Export the flat analytics table from a SQL dump.")
+    ap.add_argument("dump", help="SQL dump, e.g. coffee_bean_quality_dataset.sql")
+    ap.add_argument("-o", "--output", required=True)
+    ap.add_argument("--format", choices=list(FORMATS), help="default: from the output extension, else csv")
+    ap.add_argument("--compression")
+    ap.add_argument("--columns", help="comma-separated columns (default: all)")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    for flag in ("province", "municipality", "farm", "season"):
+        ap.add_argument(f"--{flag}", action="append", default=[], help="repeatable filter")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or next((f for f, spec in FORMATS.items() if args.output.endswith(spec[0])), "csv")
+    if args.compression and args.compression not in FORMATS[fmt][2]:
+        ap.error(f"--compression for {fmt} must be one of {FORMATS[fmt][2]}")
+
+    t0 = time.time()
+    flat = load_source(DumpSource.from_path(args.dump))[0]
+    mask = filter_mask(flat, args.province, args.municipality, args.farm, args.season)
+    columns = args.columns.split(",") if args.columns else list(flat.columns)
+    missing = [c for c in columns if c not in flat.columns]
+    if missing:
+        ap.error(f"unknown columns: {', '.join(missing)}")
+    with open(args.output, "wb") as out:
+        n = write_export(out, flat, np.flatnonzero(mask), columns, fmt, args.compression, args.chunk_rows)
+    print(f"Exported {n:,} rows × {len(columns)} columns to {args.output} ({fmt}) in {time.time()-t0:.1f}s",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+# ============================================================
+# ☕ SQL Dump Loader
+# Memory-mapped, bytes-level parsing of the coffee dataset dump
+# and assembly of the flat analytics table used by app.py
+# ============================================================
+
+import csv, hashlib, mmap, os, re, tempfile, weakref
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from picks import PickArrays
+
+FERT_FREQ_MAP = {"never": 0, "rarely": 1, "sometimes": 2, "often": 3}
+PEST_FREQ_MAP = {"never": 0, "rarely": 1, "sometimes": 2, "often": 3}
+FERT_TYPE_MAP = {"none": 0, "organic": 1, "non-organic": 2, "both": 3}
+PEST_TYPE_MAP = {"none": 0, "organic": 1, "non-organic": 2, "both": 3}
+MGMT_WEIGHTS  = {"fert_freq_enc": 0.30, "fert_type_enc": 0.15, "pest_freq_enc": 0.40, "pest_type_enc": 0.15}
+
+CHUNK_SIZE = 1 << 20  # 1 MiB reads for hashing and spooling
+
+# How duplicate (cluster_id, season) stage rows are resolved: "latest", "aggregate" or "reject"
+DUP_POLICIES = ("latest", "aggregate", "reject")
+CSD_DUP_POLICY = os.environ.get("KAPE_CSD_DUP_POLICY", "latest")
+
+# ═════════════════════════════════════════════════════════════════════════════
+# DUMP SOURCES
+# ═════════════════════════════════════════════════════════════════════════════
+
+_digest_cache = {}  # (path, size, mtime_ns) -> digest, so reruns skip rehashing
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+def file_digest(path):
+    st_ = os.stat(path)
+    key = (os.path.abspath(path), st_.st_size, st_.st_mtime_ns)
+    if key not in _digest_cache:
+        h = _new_hash()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        _digest_cache[key] = h.hexdigest()
+    return _digest_cache[key]
+
+class DumpSource:
+    """A SQL dump on disk, identified by a streaming content digest.
+
+    Parsing maps the file read-only instead of reading it into a ``str``;
+    only the tuple slices that are actually parsed get decoded.
+    """
+
+    def __init__(self, path, name=None, digest=None, owned=False):
+        self.path   = path
+        self.name   = name or os.path.basename(path)
+        self.digest = digest or file_digest(path)
+        self.size   = os.path.getsize(path)
+        # Spooled uploads are ours to delete once the source is dropped
+        self._finalizer = weakref.finalize(self, _unlink_quietly, path) if owned else None
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(path)
+
+    @classmethod
+    def from_upload(cls, uploaded, suffix=".sql"):
+        """Spool a file-like upload to a temp file, hashing while copying."""
+        h = _new_hash()
+        fd, path = tempfile.mkstemp(prefix="kape_dump_", suffix=suffix)
+        try:
+            uploaded.seek(0)
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: uploaded.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            _unlink_quietly(path)
+            raise
+        return cls(path, name=getattr(uploaded, "name", None), digest=h.hexdigest(), owned=True)
+
+    @contextmanager
+    def open(self):
+        """Yield a read-only buffer (``mmap`` or ``b""``) over the dump."""
+        if self.size == 0:
+            yield b""
+            return
+        with open(self.path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield buf
+            finally:
+                try:
+                    buf.close()
+                except BufferError:
+                    # A live match object (e.g. in a traceback) still pins the map;
+                    # it is released when that reference goes away.
+                    pass
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+# ═════════════════════════════════════════════════════════════════════════════
+# BYTES-LEVEL PARSING
+# ═════════════════════════════════════════════════════════════════════════════
+
+_BLOCK_END = re.compile(rb"INSERT\s+INTO|--\s*VERIF", re.IGNORECASE)
+# Allow one level of nesting to handle SQL functions like NOW()
+_TUPLE = re.compile(rb"\(((?:[^()]*|\([^()]*\))*)\)")
+_NULLS = {"NULL": None, "null": None, "": None}
+# ARRAY[...] constructors are rewritten to quoted '{...}' literals before CSV splitting
+_ARRAY_CTOR = re.compile(r"ARRAY\s*\[([^\]]*)\]", re.IGNORECASE)
+
+def _array_literal(m):
+    items = m.group(1).replace("''", "\0").replace("'", '"').replace("\0", "''")
+    return "'{" + items + "}'"
+
+def _header_re(table_name):
+    return re.compile(
+        rb"INSERT\s+INTO\s+(?:public\.)?" + re.escape(table_name.encode()) +
+        rb"\s*\(([^)]+)\)\s*VALUES", re.IGNORECASE)
+
+def _iter_blocks(buf, table_name):
+    """Yield ``(cols, rows)`` per INSERT block; rows are decoded tuple slices."""
+    for hdr in _header_re(table_name).finditer(buf):
+        cols = [c.strip() for c in hdr.group(1).decode("utf-8").split(",")]
+        end = _BLOCK_END.search(buf, hdr.end())
+        stop = end.start() if end else len(buf)
+        yield cols, (m.group(1).decode("utf-8") for m in _TUPLE.finditer(buf, hdr.end(), stop))
+
+def parse_table(buf, table_name):
+    """Parse ``INSERT INTO <table_name> (...) VALUES (...)`` rows from a buffer.
+
+    ``buf`` may be ``bytes``, an ``mmap`` or a ``str``. Values are split by the
+    C ``csv`` reader using SQL single-quote rules.
+    """
+    if isinstance(buf, str):
+        buf = buf.encode("utf-8")
+    rows, cols = [], None
+    for bcols, texts in _iter_blocks(buf, table_name):
+        cols = cols or bcols
+        reorder = None if bcols == cols else [bcols.index(c) if c in bcols else None for c in cols]
+        for text in texts:
+            if "ARRAY" in text or "array" in text:
+                text = _ARRAY_CTOR.sub(_array_literal, text)
+            # One reader per tuple so a stray quote cannot swallow later rows
+            try:
+                vals = next(csv.reader((text.replace("\n", " "),), quotechar="'", skipinitialspace=True), [])
+            except csv.Error:
+                continue
+            if len(vals) != len(bcols):
+                continue
+            rows.append(vals if reorder is None else [vals[i] if i is not None else None for i in reorder])
+    df = pd.DataFrame(rows, columns=cols) if cols else pd.DataFrame()
+    df.replace(_NULLS, inplace=True)
+    return df
+
+# ═════════════════════════════════════════════════════════════════════════════
+# KEYED JOIN
+# ═════════════════════════════════════════════════════════════════════════════
+
+class DuplicateKeyError(ValueError):
+    pass
+
+def resolve_duplicates(right, on, policy="latest", order_by=None):
+    """Collapse ``right`` to one row per ``on`` key.
+
+    ``latest`` keeps the row with the greatest ``order_by`` (dump order breaks
+    ties, so a later re-submission wins); ``aggregate`` averages numeric
+    columns, takes the latest date and the latest non-null value otherwise;
+    ``reject`` raises :class:`DuplicateKeyError`. Returns ``(unique, n_keys)``
+    with ``n_keys`` the number of keys that had duplicates.
+    """
+    if policy not in DUP_POLICIES:
+        raise ValueError(f"Unknown duplicate policy: {policy!r} (expected one of {DUP_POLICIES})")
+    dup = right.duplicated(on, keep=False).to_numpy()
+    if not dup.any():
+        return right, 0
+    n_keys = int(right.loc[dup, on].drop_duplicates().shape[0])
+    if policy == "reject":
+        sample = right.loc[dup, on].drop_duplicates().head(3).to_dict("records")
+        raise DuplicateKeyError(f"{n_keys} duplicate {tuple(on)} keys ({int(dup.sum())} rows), e.g. {sample}")
+    ts = (pd.to_datetime(right[order_by], errors="coerce", utc=True) if order_by in right
+          else pd.Series(pd.NaT, index=right.index, dtype="datetime64[ns, UTC]"))
+    # Oldest first (missing timestamps oldest of all), dump order within ties
+    order = np.lexsort((np.arange(len(right)), ts.notna().to_numpy(), ts.fillna(pd.Timestamp(0, tz="UTC")).to_numpy()))
+    ordered = right.iloc[order]
+    if policy == "latest":
+        return ordered.drop_duplicates(on, keep="last"), n_keys
+    spec = {}
+    for c in right.columns.difference(on, sort=False):
+        if pd.api.types.is_numeric_dtype(right[c]) and not pd.api.types.is_bool_dtype(right[c]):
+            spec[c] = "mean"
+        elif pd.api.types.is_datetime64_any_dtype(right[c]):
+            spec[c] = "max"
+        else:
+            spec[c] = "last"  # groupby "last" skips nulls
+    agg = ordered.groupby(on, sort=False, dropna=False).agg(spec).reset_index()
+    return agg[right.columns], n_keys
+
+def keyed_join(left, right, on, policy="latest", order_by=None, suffix="_csd"):
+    """Left join ``right`` onto ``left`` with at most one match per row.
+
+    ``right`` is de-duplicated per ``policy`` (see :func:`resolve_duplicates`;
+    ``order_by`` is only used for that and not joined), indexed once by its
+    key (a hash index), and every left row is probed in one vectorised
+    ``get_indexer`` pass. Overlapping columns from ``right`` get ``suffix``.
+    Returns ``(joined, stats)``; the row count of ``left`` is preserved.
+    """
+    unique, dup_keys = resolve_duplicates(right, on, policy, order_by)
+    index = pd.MultiIndex.from_frame(unique[on])
+    pos = index.get_indexer(pd.MultiIndex.from_frame(left[on]))
+    payload = unique.drop(columns=on + ([order_by] if order_by in unique else [])).reset_index(drop=True)
+    payload.columns = [c + suffix if c in left.columns else c for c in payload.columns]
+    joined = pd.concat([left.reset_index(drop=True), payload.reindex(pos).reset_index(drop=True)], axis=1)
+    joined.index = left.index
+    stats = {"policy":         policy,
+             "left_rows":      len(left),
+             "right_rows":     len(right),
+             "right_unique":   len(unique),
+             "duplicate_keys": dup_keys,
+             "duplicate_rows": len(right) - len(unique),
+             "matched_rows":   int((pos >= 0).sum()),
+             "unmatched_rows": int((pos < 0).sum()),
+             "out_rows":       len(joined)}
+    if stats["out_rows"] != stats["left_rows"]:
+        raise AssertionError(f"keyed_join changed the row count: {stats}")
+    return joined, stats
+
+# ═════════════════════════════════════════════════════════════════════════════
+# FLAT ANALYTICS TABLE
+# ═════════════════════════════════════════════════════════════════════════════
+
+def build_flat(buf, dup_policy=None):
+    """Assemble the flat analytics table.
+
+    Returns ``(flat, df_users, df_farms, df_clusters, df_csd, join_stats, picks)``;
+    duplicate stage rows are resolved per ``dup_policy`` (default
+    ``CSD_DUP_POLICY``). ``picks`` holds the per-pick harvest arrays; their
+    season totals fill the scalar harvest columns of ``flat``.
+    """
+    df_users    = parse_table(buf, "users")
+    df_farms    = parse_table(buf, "farms")
+    df_clusters = parse_table(buf, "clusters")
+    df_csd      = parse_table(buf, "cluster_stage_data")
+    df_hr       = parse_table(buf, "harvest_records")
+    if df_hr.empty:
+        df_hr = pd.DataFrame(columns=["id", "cluster_id", "season", "actual_harvest_date", "yield_kg", "grade_fine", "grade_premium", "grade_commercial", "notes", "recorded_at"])
+
+    def to_num(s): return pd.to_numeric(s, errors="coerce")
+    def to_dt(s):  return pd.to_datetime(s, errors="coerce")
+
+    # Harvest columns may be per-pick arrays (new schema) or scalars (old dumps)
+    picks = PickArrays.from_records(df_hr)
+    for c, total in picks.totals().items():
+        df_hr[c] = total
+    df_hr["total_picks"] = picks.counts
+
+    for c in ["farm_area", "elevation_m", "overall_tree_count"]:
+        if c in df_farms.columns: df_farms[c] = to_num(df_farms[c])
+    for c in ["area_size_sqm", "plant_count"]:
+        if c in df_clusters.columns: df_clusters[c] = to_num(df_clusters[c])
+
+    num_csd = ["plant_age_months","number_of_plants","pruning_interval_months",
+               "soil_ph","avg_temp_c","avg_rainfall_mm","avg_humidity_pct",
+               "pre_yield_kg","pre_grade_fine","pre_grade_premium","pre_grade_commercial",
+               "previous_fine_pct","previous_premium_pct","previous_commercial_pct",
+               "defect_count","bean_moisture","predicted_yield","pre_total_trees"]
+    date_csd = ["date_planted","last_pruned_date","previous_pruned_date",
+                "actual_flowering_date","estimated_flowering_date",
+                "estimated_harvest_date","actual_harvest_date","pre_last_harvest_date"]
+    for c in num_csd:
+        if c in df_csd.columns: df_csd[c] = to_num(df_csd[c])
+    for c in date_csd:
+        if c in df_csd.columns: df_csd[c] = to_dt(df_csd[c])
+    for c in ["yield_kg","grade_fine","grade_premium","grade_commercial"]:
+        if c in df_hr.columns: df_hr[c] = to_num(df_hr[c])
+    df_hr["actual_harvest_date"] = to_dt(df_hr.get("actual_harvest_date"))
+
+    # Ensure df_hr has cluster_id
+    if not df_hr.empty and "cluster_id" not in df_hr.columns:
+        possible = [c for c in df_hr.columns if "cluster" in c.lower()]
+        if possible:
+            df_hr = df_hr.rename(columns={possible[0]:"cluster_id"})
+        elif len(df_hr.columns) > 1:
+            df_hr = df_hr.rename(columns={df_hr.columns[1]:"cluster_id"})
+
+    # Rename columns for indexing
+    if not df_farms.empty:
+        if "id" in df_farms.columns:
+            df_farms = df_farms.rename(columns={"id":"farm_id"})
+        elif "farm_id" not in df_farms.columns:
+            df_farms = df_farms.rename(columns={df_farms.columns[0]:"farm_id"})
+        farm_lu = df_farms.set_index("farm_id")[ ["elevation_m","farm_area","overall_tree_count","farm_name"] ].to_dict("index")
+        farm_user_lu = df_farms.set_index("farm_id")[["user_id"]].to_dict("index")
+    else:
+        farm_lu = {}
+        farm_user_lu = {}
+
+    if not df_clusters.empty:
+        if "id" in df_clusters.columns:
+            df_clusters = df_clusters.rename(columns={"id":"cluster_id"})
+        elif "cluster_id" not in df_clusters.columns:
+            df_clusters = df_clusters.rename(columns={df_clusters.columns[0]:"cluster_id"})
+        cluster_lu = df_clusters.set_index("cluster_id")[ ["farm_id","cluster_name","area_size_sqm","plant_count","variety","plant_stage"] ].to_dict("index")
+    else:
+        cluster_lu = {}
+
+    # Build farmer name map via users->farms
+    if not df_users.empty:
+        if "id" in df_users.columns:
+            df_users = df_users.rename(columns={"id":"user_id"})
+        elif "user_id" not in df_users.columns:
+            df_users = df_users.rename(columns={df_users.columns[0]:"user_id"})
+        user_lu = df_users.set_index("user_id")[ ["first_name","last_name","municipality","province"] ].to_dict("index")
+    else:
+        user_lu = {}
+
+    hr = df_hr.copy()
+    hr["farm_id"]          = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("farm_id"))
+    hr["cluster_name"]     = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("cluster_name"))
+    hr["area_size_sqm"]    = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("area_size_sqm"))
+    hr["plant_count"]      = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("plant_count"))
+    hr["variety"]          = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("variety","Robusta"))
+    hr["plant_stage"]      = hr["cluster_id"].map(lambda x: cluster_lu.get(x,{}).get("plant_stage"))
+    hr["elevation_m"]      = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("elevation_m") if x else None)
+    hr["farm_area"]        = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("farm_area") if x else None)
+    hr["farm_name"]        = hr["farm_id"].map(lambda x: farm_lu.get(x,{}).get("farm_name","") if x else "")
+    hr["user_id"]          = hr["farm_id"].map(lambda x: farm_user_lu.get(x,{}).get("user_id") if x else None)
+    hr["farmer_name"]      = hr["user_id"].map(lambda x: f"{user_lu.get(x,{}).get('first_name','')} {user_lu.get(x,{}).get('last_name','')}".strip() if x else "")
+    hr["municipality"]     = hr["user_id"].map(lambda x: user_lu.get(x,{}).get("municipality","") if x else "")
+    hr["province"]         = hr["user_id"].map(lambda x: user_lu.get(x,{}).get("province","") if x else "")
+
+    csd_cols = ["cluster_id","season"] + num_csd + date_csd + [
+        "fertilizer_type","fertilizer_frequency","pesticide_type","pesticide_frequency",
+        "shade_tree_present","shade_tree_species","updated_at"]
+    # Re-submitted stage forms duplicate (cluster_id, season): resolve before joining
+    flat, join_stats = keyed_join(hr, df_csd[[c for c in csd_cols if c in df_csd.columns]],
+                                  ["cluster_id","season"], policy=dup_policy or CSD_DUP_POLICY,
+                                  order_by="updated_at")
+
+    flat["plant_age_months"] = flat["plant_age_months"].fillna(
+        ((flat["actual_harvest_date"] - flat["date_planted"]).dt.days / 30.44).round(0))
+    flat["flowering_to_harvest_days"] = (
+        flat["actual_harvest_date"] - flat["actual_flowering_date"]).dt.days
+    flat["shade_binary"] = (
+        flat["shade_tree_present"].astype(str).str.lower()
+        .map({"true":1,"1":1,"false":0,"0":0}).fillna(0).astype(int))
+    flat["yield_per_tree"] = (flat["yield_kg"] / flat["plant_count"].replace(0, np.nan)).round(3)
+    flat["fine_grade_pct"]       = (flat["grade_fine"]       / flat["yield_kg"].replace(0,np.nan)*100).round(2)
+    flat["premium_grade_pct"]    = (flat["grade_premium"]     / flat["yield_kg"].replace(0,np.nan)*100).round(2)
+    flat["commercial_grade_pct"] = (flat["grade_commercial"]  / flat["yield_kg"].replace(0,np.nan)*100).round(2)
+    flat["yield_delta_kg"]  = (flat["yield_kg"] - flat["pre_yield_kg"]).round(2)
+    flat["yield_delta_pct"] = (flat["yield_delta_kg"] / flat["pre_yield_kg"].replace(0,np.nan)*100).round(2)
+    flat["yield_drop"] = (flat["yield_delta_kg"] < 0).astype(int)
+    flat["planting_density"] = (flat["plant_count"] / flat["area_size_sqm"].replace(0,np.nan)).round(4)
+    flat["fert_type_enc"] = flat["fertilizer_type"].astype(str).str.lower().str.strip().map(FERT_TYPE_MAP).fillna(0)
+    flat["fert_freq_enc"] = flat["fertilizer_frequency"].astype(str).str.lower().str.strip().map(FERT_FREQ_MAP).fillna(0)
+    flat["pest_type_enc"] = flat["pesticide_type"].astype(str).str.lower().str.strip().map(PEST_TYPE_MAP).fillna(0)
+    flat["pest_freq_enc"] = flat["pesticide_frequency"].astype(str).str.lower().str.strip().map(PEST_FREQ_MAP).fillna(0)
+    flat["mgmt_score"] = mgmt_score(flat)
+    flat["climate_stress"] = (
+        (flat["avg_temp_c"]-22).abs()*0.3 +
+        (flat["avg_rainfall_mm"]-200).abs()*0.005 +
+        (flat["soil_ph"]-6.05).abs()*3.0 +
+        (flat["avg_humidity_pct"]-80).abs()*0.1)
+    season_order = sorted(flat["season"].dropna().unique())
+    flat["season_idx"] = flat["season"].map({s:i for i,s in enumerate(season_order)})
+
+    flat["yield_status"] = pd.cut(
+        flat["yield_delta_pct"],
+        bins=[-np.inf, -20, -5, 5, np.inf],
+        labels=["Critical Drop (>20%)","Moderate Drop (5-20%)","Stable (±5%)","Improvement (>5%)"])
+
+    return flat, df_users, df_farms, df_clusters, df_csd, join_stats, picks
+
+def mgmt_score(enc):
+    """Weighted management score from the four ``*_enc`` columns (frame or dict of arrays)."""
+    return sum(enc[c] * w for c, w in MGMT_WEIGHTS.items())
+
+def filter_mask(flat, provinces=None, municipalities=None, farms=None, seasons=None):
+    """Boolean row mask for the sidebar filters; empty selections don't filter."""
+    mask = np.ones(len(flat), dtype=bool)
+    if provinces:      mask &= flat["province"].isin(provinces).to_numpy()
+    if municipalities: mask &= flat["municipality"].isin(municipalities).to_numpy()
+    if farms and "farm_name" in flat.columns:
+        mask &= flat["farm_name"].isin(farms).to_numpy()
+    if seasons:        mask &= flat["season"].isin(seasons).to_numpy()
+    return mask
+
+def load_source(source, dup_policy=None):
+    """Parse a :class:`DumpSource` into the flat table, raw frames, join stats and pick arrays."""
+    with source.open() as buf:
+        return build_flat(buf, dup_policy)
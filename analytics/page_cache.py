@@ -0,0 +1,95 @@
+# ============================================================
+# ☕ Page Cache
+# Memoised per-page derived frames and serialised Plotly figures,
+# keyed by dataset digest, normalised filter signature, page and
+# the page-local widget values they depend on
+# ============================================================
+
+import hashlib, json, threading
+from collections import OrderedDict
+import plotly.io as pio
+
+from shared_store import frame_nbytes, read_only_view
+
+def filter_signature(**selections):
+    """Normalised hash of the sidebar filters.
+
+    Each value is ``(selected, options)``. An empty selection filters
+    nothing (``None``); selecting every option still drops rows whose value
+    is missing or not an option, so it gets its own ``"*"``. Otherwise the
+    selection is order-insensitive. Equivalent filter states share one signature.
+    """
+    norm = {}
+    for name, (selected, options) in sorted(selections.items()):
+        sel = sorted(map(str, selected or []))
+        norm[name] = None if not sel else "*" if sel == sorted(map(str, options)) else sel
+    return hashlib.blake2b(json.dumps(norm).encode(), digest_size=10).hexdigest()
+
+def _nbytes(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    return frame_nbytes(value)
+
+class PageCache:
+    """Thread-safe LRU of derived values, bounded by total size in bytes."""
+
+    def __init__(self, budget_bytes=256 << 20):
+        self.budget_bytes = budget_bytes
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._bytes = self._hits = self._misses = self._evictions = 0
+
+    def get(self, key, compute_fn):
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return hit[0]
+            self._misses += 1
+        # Computed outside the lock: values may be built from other entries
+        value = compute_fn()
+        size = _nbytes(value)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._bytes += size
+            while self._bytes > self.budget_bytes and len(self._entries) > 1:
+                _, (_, old) = self._entries.popitem(last=False)
+                self._bytes -= old
+                self._evictions += 1
+        return value
+
+    def page(self, *prefix):
+        return PageMemo(self, prefix)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"entries": len(self._entries), "bytes": self._bytes, "budget_bytes": self.budget_bytes,
+                    "hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+                    "hit_rate": self._hits / lookups if lookups else 0.0}
+
+class PageMemo:
+    """A :class:`PageCache` view bound to one (digest, filters, page) prefix.
+
+    Widget values are passed as keyword ``params`` and only become part of
+    their own entry's key, so changing one widget leaves the rest cached.
+    """
+
+    def __init__(self, cache, prefix):
+        self._cache, self._prefix = cache, tuple(prefix)
+
+    def _key(self, name, params):
+        return self._prefix + (name, tuple(sorted((k, repr(v)) for k, v in params.items())))
+
+    def frame(self, name, compute_fn, **params):
+        """Derived frame / value; frames come back as copy-on-write views."""
+        return read_only_view(self._cache.get(self._key(name, params), compute_fn))
+
+    def figure(self, name, build_fn, **params):
+        """Figure rebuilt from its cached JSON, so cache hits skip all pandas work."""
+        js = self._cache.get(self._key(name, params), lambda: build_fn().to_json())
+        return pio.from_json(js, skip_invalid=True)
@@ -0,0 +1,133 @@
+# ============================================================
+# ☕ Peer Benchmarking
+# Nearest-neighbour index over standardised agronomic profiles:
+# k most similar clusters with their yield / grade percentiles,
+# and mini-batch k-means peer cohorts with the practices of each
+# cohort's top-quartile performers
+# ============================================================
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import StandardScaler
+
+from training import ML_FEATURES
+
+# Growing conditions only: peers share a setting, so their practices can differ
+PEER_FEATURES = ["elevation_m", "avg_temp_c", "avg_rainfall_mm", "avg_humidity_pct", "soil_ph",
+                 "climate_stress", "plant_age_months", "planting_density"]
+if not set(PEER_FEATURES) <= set(ML_FEATURES):
+    raise ValueError(f"PEER_FEATURES must be model features; not in ML_FEATURES: "
+                     f"{sorted(set(PEER_FEATURES) - set(ML_FEATURES))}")
+
+K_MAX = 20  # neighbours precomputed per cluster
+
+# practice column -> (label, how top-quartile vs other peers are summarised)
+PRACTICES = {
+    "pruning_interval_months": ("prune every",          "median"),
+    "fertilizer_frequency":    ("fertilize",            "mode"),
+    "fertilizer_type":         ("use fertilizer",       "mode"),
+    "pesticide_frequency":     ("apply pesticide",      "mode"),
+    "shade_binary":            ("keep shade trees",     "share"),
+}
+
+def _summarise(s, how):
+    s = s.dropna()
+    if s.empty:
+        return None
+    if how == "median":
+        return float(s.median())
+    if how == "share":
+        return round(float(s.mean()) * 100, 1)
+    return str(s.mode().iloc[0])
+
+class PeerIndex:
+    """k-NN peers and cohorts for one cluster profile table.
+
+    ``profiles`` holds one row per cluster (its latest season) indexed by
+    ``cluster_id``. Neighbours for every cluster are found once at build
+    time, so :meth:`peers` is a slice and two lookups.
+    """
+
+    def __init__(self, profiles, k_max=K_MAX, n_cohorts=None, random_state=0):
+        X = profiles[PEER_FEATURES].astype(np.float64)
+        X = X.fillna(X.median()).fillna(0.0)
+        self.scaler = StandardScaler().fit(X)
+        Z = self.scaler.transform(X)
+        n = len(Z)
+
+        k = min(k_max + 1, n)
+        self.nn = NearestNeighbors(n_neighbors=k).fit(Z)
+        dist, idx = self.nn.kneighbors(Z)
+        # Drop each cluster from its own neighbour list (ties may reorder it)
+        keep = idx != np.arange(n)[:, None]
+        self._nbr  = np.stack([r[m][:k - 1] for r, m in zip(idx, keep)]) if n > 1 else np.empty((n, 0), int)
+        self._dist = np.stack([r[m][:k - 1] for r, m in zip(dist, keep)]) if n > 1 else np.empty((n, 0))
+
+        n_cohorts = n_cohorts or int(np.clip(round(np.sqrt(n / 2)), 1, 12))
+        km = MiniBatchKMeans(n_clusters=min(n_cohorts, n), batch_size=1024, n_init=3,
+                             random_state=random_state).fit(Z)
+        t = profiles.copy()
+        t["cohort"] = km.labels_
+        t["yield_pctile"] = (t["yield_kg"].rank(pct=True) * 100).round(1)
+        t["fine_pctile"]  = (t["fine_grade_pct"].rank(pct=True) * 100).round(1)
+        cq = t.groupby("cohort")["yield_kg"].transform(lambda s: s.quantile(0.75))
+        t["top_quartile"] = t["yield_kg"] >= cq
+        self.table = t
+        self._pos = pd.Series(np.arange(n), index=t.index)
+        self.cohorts = self._cohort_practices()
+        self.nbytes = int(t.memory_usage(deep=True).sum() + self._nbr.nbytes + self._dist.nbytes)
+
+    def _cohort_practices(self):
+        rows = []
+        for c, g in self.table.groupby("cohort"):
+            top, rest = g[g["top_quartile"]], g[~g["top_quartile"]]
+            row = {"cohort": c, "clusters": len(g), "median_yield_kg": round(g["yield_kg"].median(), 2),
+                   "top_quartile_yield_kg": round(top["yield_kg"].median(), 2)}
+            for col, (_, how) in PRACTICES.items():
+                if col in g.columns:
+                    row[f"{col}_top"], row[f"{col}_rest"] = _summarise(top[col], how), _summarise(rest[col], how)
+            rows.append(row)
+        return pd.DataFrame(rows).set_index("cohort")
+
+    def peers(self, cluster_id, k=10):
+        """The ``k`` most similar clusters, nearest first, with a ``distance`` column."""
+        p = self._pos[cluster_id]
+        nbr = self._nbr[p, :k]
+        out = self.table.iloc[nbr].copy()
+        out.insert(0, "distance", self._dist[p, :k].round(3))
+        return out
+
+    def peer_percentiles(self, cluster_id, k=10):
+        """Where the cluster's yield and Fine % fall among its ``k`` peers (0–100)."""
+        row, peers = self.table.loc[cluster_id], self.peers(cluster_id, k)
+        pct = lambda col: (float((peers[col] < row[col]).mean() * 100)
+                           if len(peers) and pd.notna(row[col]) else np.nan)
+        return {"yield_pctile": pct("yield_kg"), "fine_pctile": pct("fine_grade_pct")}
+
+    def cohort_insights(self, cohort):
+        """Plain-language practices where a cohort's top quartile differs from the rest."""
+        c, out = self.cohorts.loc[cohort], []
+        for col, (label, how) in PRACTICES.items():
+            top, rest = c.get(f"{col}_top"), c.get(f"{col}_rest")
+            if top is None or rest is None or pd.isna(top) or pd.isna(rest) or top == rest:
+                continue
+            if how == "median":
+                out.append(f"Top-quartile peers {label} {top:g} months (others: {rest:g}).")
+            elif how == "share":
+                out.append(f"{top:g}% of top-quartile peers {label} (others: {rest:g}%).")
+            else:
+                out.append(f"Top-quartile peers {label} '{top}' (others: '{rest}').")
+        return out
+
+def build_peer_index(flat, k_max=K_MAX, n_cohorts=None):
+    """One profile per cluster (latest season) → :class:`PeerIndex`."""
+    latest = (flat.dropna(subset=["cluster_id", "season_idx"])
+              .sort_values("season_idx", kind="stable")
+              .drop_duplicates("cluster_id", keep="last")
+              .set_index("cluster_id", drop=False))
+    latest.index.name = None
+    cols = [c for c in ["cluster_id", "cluster_name", "farm_id", "farm_name", "municipality", "province",
+                        "season", "yield_kg", "fine_grade_pct", *PEER_FEATURES, *PRACTICES] if c in latest.columns]
+    return PeerIndex(latest[list(dict.fromkeys(cols))], k_max, n_cohorts)
@@ -0,0 +1,250 @@
+# ============================================================
+# ☕ Harvest Pick Curves
+# Pick-level harvest arrays (new harvest_records schema) held as
+# flat value + offset arrays, with per-season curves, peak picks,
+# time-to-50 / 90 % and grade drift from segmented reductions
+# ============================================================
+
+import os
+import numpy as np
+import pandas as pd
+
+PICK_COLUMNS = ["yield_kg", "grade_fine", "grade_premium", "grade_commercial"]
+# Whether array elements are running season totals (as written by the
+# scalar-to-monthly migration: the final pick equals the old scalar) or per-pick amounts
+PICK_MODES = ("cumulative", "increments")
+PICK_MODE = os.environ.get("KAPE_PICK_ARRAYS", "cumulative")
+
+CURVE_POINTS = 21        # season-progress grid for the averaged curves
+FEW_PICKS = 3            # fewer picks than this have no curve shape to speak of
+EARLY_PEAK_FRAC = 0.25   # peak pick within the first quarter of picks
+SLOW_RAMP_FRAC  = 0.60   # half the yield only after 60 % of picks
+QUALITY_DROP_PP = 2.0    # late-season Fine % this far below early-season
+
+def parse_arrays(texts):
+    """Postgres array literals (``{1,2,3}``) or scalars → ``(values, offsets)``.
+
+    Scalars become one-element arrays and NULL / empty literals empty ones,
+    so old scalar dumps and new array dumps share one representation.
+    Parsing is done with vectorised string operations over the whole column.
+    """
+    s = pd.Series(texts, dtype=object)
+    body = s.where(s.notna(), "").astype(str).str.strip().str.strip("{}[]").str.replace('"', "", regex=False)
+    body = body.where(~body.str.upper().isin(["", "NULL", "NAN", "NONE"]), "")
+    counts = np.where(body == "", 0, body.str.count(",").to_numpy() + 1).astype(np.int64)
+    joined = ",".join(body[body != ""])
+    values = (pd.to_numeric(pd.Series(joined.split(",")).str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+              if joined else np.empty(0))
+    return values, np.concatenate([[0], np.cumsum(counts)])
+
+def _seg_ids(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+def _seg_reduce(ufunc, values, offsets, empty=np.nan):
+    """``ufunc.reduceat`` per segment, with ``empty`` for zero-length segments."""
+    out = np.full(len(offsets) - 1, empty, dtype=np.float64)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+def _first_true(mask, offsets):
+    """Position within each segment of its first ``True`` (-1 if none)."""
+    seg = _seg_ids(offsets)
+    hit = np.flatnonzero(mask)
+    out = np.full(len(offsets) - 1, -1, dtype=np.int64)
+    segs, first = np.unique(seg[hit], return_index=True)
+    out[segs] = hit[first] - offsets[segs]
+    return out
+
+class PickArrays:
+    """Ragged per-pick arrays for every harvest record.
+
+    Record ``i`` owns ``values[col][offsets[i]:offsets[i+1]]``; values are
+    always stored as per-pick amounts whatever the dump's array mode.
+    """
+
+    def __init__(self, ids, offsets, values):
+        self.ids     = np.asarray(ids, dtype=object)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.values  = values
+        self._row    = pd.Series(np.arange(len(self.ids)), index=self.ids)
+        self.nbytes  = int(self.offsets.nbytes + sum(v.nbytes for v in values.values()))
+
+    @classmethod
+    def from_records(cls, df_hr, mode=PICK_MODE):
+        """Parse the harvest array columns; records keep the row order of ``df_hr``."""
+        if mode not in PICK_MODES:
+            raise ValueError(f"Unknown pick array mode {mode!r}; expected one of {PICK_MODES}")
+        ids = df_hr["id"].to_numpy() if "id" in df_hr.columns else np.arange(len(df_hr))
+        values, offsets = {}, None
+        for col in PICK_COLUMNS:
+            if col not in df_hr.columns:
+                continue
+            v, off = parse_arrays(df_hr[col].to_numpy())
+            if offsets is None:
+                offsets = off
+            elif not np.array_equal(off, offsets):
+                # Grade arrays must line up with yield picks; pad / trim per record if not
+                v = _align(v, off, offsets)
+            if mode == "cumulative" and len(v):
+                inc = np.diff(v, prepend=0.0)
+                starts = offsets[:-1][np.diff(offsets) > 0]
+                inc[starts] = v[starts]
+                v = inc
+            values[col] = v
+        if offsets is None:
+            offsets = np.zeros(len(df_hr) + 1, dtype=np.int64)
+        return cls(ids, offsets, values)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def totals(self):
+        """Season total per record and column (segment sums)."""
+        return {c: _seg_reduce(np.add, v, self.offsets) for c, v in self.values.items()}
+
+    def subset(self, ids):
+        """Records ``ids`` (missing ones skipped) as a new compact :class:`PickArrays`."""
+        rows = self._row.reindex(pd.Index(ids).unique()).dropna().to_numpy(dtype=np.int64)
+        lens = self.counts[rows]
+        offsets = np.concatenate([[0], np.cumsum(lens)])
+        take = np.repeat(self.offsets[rows] - offsets[:-1], lens) + np.arange(offsets[-1])
+        return PickArrays(self.ids[rows], offsets, {c: v[take] for c, v in self.values.items()})
+
+def _align(v, off, target):
+    """Re-lay ragged ``v`` (offsets ``off``) onto ``target`` offsets, NaN-padding short records."""
+    n_t, n_s = np.diff(target), np.diff(off)
+    pos = np.arange(target[-1]) - np.repeat(target[:-1], n_t)
+    seg = _seg_ids(target)
+    ok = pos < n_s[seg]
+    out = np.full(target[-1], np.nan)
+    out[ok] = v[off[:-1][seg[ok]] + pos[ok]]
+    return out
+
+# ═════════════════════════════════════════════════════════════════════════════
+# CURVE METRICS
+# ═════════════════════════════════════════════════════════════════════════════
+
+def _graded(picks, y):
+    """Fine kg and the yield it was graded on, per pick.
+
+    Picks without a Fine value (NULL elements, or padding where the grade
+    array is shorter than the yield array) drop out of both, so Fine % is
+    only ever taken over graded yield.
+    """
+    fine = picks.values.get("grade_fine", np.full(len(y), np.nan))
+    ok = ~np.isnan(fine)
+    return np.where(ok, fine, 0.0), np.where(ok, y, 0.0)
+
+def curve_metrics(picks):
+    """One row per harvest record: picks, peak pick, time to 50 / 90 % and grade drift.
+
+    Pick positions are 1-based; ``*_frac`` columns are the same positions as a
+    share of the record's picks so seasons of different length compare.
+    """
+    off, n = picks.offsets, picks.counts
+    y = np.nan_to_num(picks.values.get("yield_kg", np.zeros(off[-1])))
+    seg = _seg_ids(off)
+    pos = np.arange(off[-1]) - off[seg]                    # 0-based pick index in its season
+    total = _seg_reduce(np.add, y, off, 0.0)
+    cum = np.cumsum(y) - np.repeat(np.cumsum(y)[off[:-1][n > 0]] - y[off[:-1][n > 0]], n[n > 0])
+
+    peak_val = _seg_reduce(np.maximum, y, off)
+    peak = _first_true(y == np.repeat(peak_val, n), off)
+    t50 = _first_true(cum >= 0.5 * np.repeat(total, n), off)
+    t90 = _first_true(cum >= 0.9 * np.repeat(total, n), off)
+
+    out = pd.DataFrame({"picks": n, "total_yield_kg": total.round(2), "peak_pick": peak + 1,
+                        "peak_yield_kg": np.round(peak_val, 2), "t50_pick": t50 + 1, "t90_pick": t90 + 1},
+                       index=pd.Index(picks.ids, name="id"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for c in ["peak_pick", "t50_pick", "t90_pick"]:
+            out[c.replace("_pick", "_frac")] = (out[c] / n).round(3)
+        out.loc[n == 0, ["peak_pick", "t50_pick", "t90_pick"]] = np.nan
+
+        # Yield-weighted Fine % over the first vs last third of each season's picks
+        if "grade_fine" in picks.values:
+            fine, graded = _graded(picks, y)
+            third = pos * 3 // np.maximum(n[seg], 1)               # 0, 1, 2
+            sums = lambda w, k: np.bincount(seg, weights=np.where(third == k, w, 0), minlength=len(n))
+            early = sums(fine, 0) / sums(graded, 0) * 100
+            late = sums(fine, 2) / sums(graded, 2) * 100
+            out["fine_pct_early"], out["fine_pct_late"] = early.round(2), late.round(2)
+            out["fine_drift_pp"] = np.where(n >= FEW_PICKS, late - early, np.nan).round(2) + 0.0
+
+    out["pattern"] = np.select(
+        [out["picks"] < FEW_PICKS,
+         out.get("fine_drift_pp", pd.Series(np.nan, index=out.index)) <= -QUALITY_DROP_PP,
+         out["peak_frac"] <= EARLY_PEAK_FRAC,
+         out["t50_frac"] >= SLOW_RAMP_FRAC],
+        ["Single / few picks", "Late quality drop", "Early peak", "Slow ramp"], "Even")
+    return out
+
+def season_curves(picks, groups=None, points=CURVE_POINTS):
+    """Averaged cumulative-yield and Fine % curves over season progress.
+
+    Each record's cumulative share is sampled on ``points`` steps of season
+    progress (0–1) by pick position; records are averaged per ``groups``
+    label (array aligned with ``picks.ids``; one ``"All"`` group if ``None``).
+    Records with fewer than ``FEW_PICKS`` picks (including old scalar ones)
+    are left out. Returns long-format ``group, progress, cum_share, fine_pct, records``.
+    """
+    off, n = picks.offsets, picks.counts
+    keep, nonempty = n >= FEW_PICKS, n > 0
+    if not keep.any():
+        return pd.DataFrame(columns=["group", "progress", "cum_share", "fine_pct", "records"])
+    y = np.nan_to_num(picks.values.get("yield_kg", np.zeros(off[-1])))
+    fine, graded = _graded(picks, y)
+    seg = _seg_ids(off)
+    pos = np.arange(off[-1]) - off[seg]
+    total = _seg_reduce(np.add, y, off, 0.0)
+    cum = np.cumsum(y) - np.repeat(np.cumsum(y)[off[:-1][nonempty]] - y[off[:-1][nonempty]], n[nonempty])
+    share = np.where(np.repeat(total, n) > 0, cum / np.repeat(total, n), np.nan)
+
+    # Bin each pick by where it ends in its season; the last pick in a bin carries the share
+    grid = np.linspace(0, 1, points)
+    b = np.clip(np.ceil((pos + 1) / n[seg] * (points - 1)).astype(np.int64), 0, points - 1)
+    flat_bin = seg * points + b
+    M = np.full(len(n) * points, np.nan)
+    order = np.lexsort((pos, flat_bin))
+    last = np.r_[flat_bin[order][1:] != flat_bin[order][:-1], True]
+    M[flat_bin[order][last]] = share[order][last]
+    M = M.reshape(len(n), points)
+    M[:, 0] = np.where(keep, 0.0, np.nan)
+    M = pd.DataFrame(M).ffill(axis=1).to_numpy()           # carry the share through empty bins
+    Fb = np.bincount(flat_bin, weights=fine, minlength=len(n) * points).reshape(len(n), points)
+    Gb = np.bincount(flat_bin, weights=graded, minlength=len(n) * points).reshape(len(n), points)
+
+    labels = np.asarray(groups if groups is not None else np.full(len(n), "All"), dtype=object)[keep]
+    codes, names = pd.factorize(labels)
+    M, Fb, Gb = M[keep], Fb[keep], Gb[keep]
+    rows = []
+    for g, name in enumerate(names):
+        sel = codes == g
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fine_pct = Fb[sel].sum(0) / Gb[sel].sum(0) * 100
+        rows.append(pd.DataFrame({"group": name, "progress": grid, "cum_share": np.nanmean(M[sel], 0),
+                                  "fine_pct": np.where(Gb[sel].sum(0) > 0, fine_pct, np.nan),
+                                  "records": int(sel.sum())}))
+    return pd.concat(rows, ignore_index=True)
+
+def pick_profile(picks, max_picks=None):
+    """Mean yield and Fine % by pick number (1-based) across records."""
+    off = picks.offsets
+    if off[-1] == 0:
+        return pd.DataFrame(columns=["pick", "mean_yield_kg", "fine_pct", "records"])
+    seg = _seg_ids(off)
+    pos = np.arange(off[-1]) - off[seg]
+    y = np.nan_to_num(picks.values.get("yield_kg", np.zeros(off[-1])))
+    fine, graded = _graded(picks, y)
+    size = int(pos.max()) + 1
+    cnt = np.bincount(pos, minlength=size)
+    ysum = np.bincount(pos, weights=y, minlength=size)
+    fsum = np.bincount(pos, weights=fine, minlength=size)
+    gsum = np.bincount(pos, weights=graded, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = pd.DataFrame({"pick": np.arange(1, size + 1), "mean_yield_kg": (ysum / cnt).round(3),
+                            "fine_pct": np.where(gsum > 0, fsum / gsum * 100, np.nan).round(2), "records": cnt})
+    return out.iloc[:max_picks] if max_picks else out
@@ -0,0 +1,76 @@
+# ============================================================
+# ☕ Agronomic Recommendations
+# Rule table aligned to Robusta ideal ranges and the per-row /
+# per-season recommendation builders shared by the dashboard and
+# the batch reports
+# ============================================================
+
+import pandas as pd
+
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+
+RECOMMENDATIONS = [
+    ("soil_ph", 5.6, 6.5,
+     "Soil pH too low → apply agricultural lime to raise pH toward 5.6–6.5.",
+     "Soil pH too high → apply sulfur amendments to lower pH toward 5.6–6.5.", "High"),
+    ("avg_temp_c", 13, 26,
+     "Temperature below optimum → consider windbreaks; monitor frost risk.",
+     "Temperature above optimum → increase shade tree cover to cool canopy.", "Medium"),
+    ("avg_rainfall_mm", 150, 250,
+     "Rainfall below optimum → supplement with irrigation during dry months.",
+     "Rainfall above optimum → improve drainage; monitor fungal disease risk.", "Medium"),
+    ("avg_humidity_pct", 75, 85,
+     "Humidity too low → mulch around base; add shade trees.",
+     "Humidity too high → improve airflow; apply preventive fungicide.", "Medium"),
+    ("elevation_m", 600, 1200,
+     "Elevation below Robusta ideal → consider Excelsa or lower-altitude variety.",
+     "Elevation above Robusta ideal → assess suitability; may suit Arabica instead.", "Low"),
+    ("pruning_interval_months", 10, 18,
+     "Pruning overdue (> 18 months) → prune immediately after harvest for vigour.",
+     "Pruning too frequent (< 10 months) → allow full recovery between cycles.", "High"),
+    ("fert_freq_enc", 2, 3,
+     "Fertilizer too infrequent → increase to at least 1×/year (sometimes).",
+     None, "High"),
+    ("pest_freq_enc", 1, 3,
+     "Pesticide never applied → establish a pest monitoring schedule.",
+     None, "Low"),
+    ("bean_moisture", 10.5, 12.5,
+     "Bean moisture too low → review drying duration; risk of brittle beans.",
+     "Bean moisture too high → extend drying; risk of mould and grade downgrade.", "High"),
+]
+
+
+def get_recommendations(row):
+    recs = []
+    for col, lo, hi, lo_msg, hi_msg, priority in RECOMMENDATIONS:
+        val = pd.to_numeric(row.get(col), errors="coerce")
+        if pd.isna(val): continue
+        if val < lo and lo_msg:
+            recs.append({"factor":col,"value":round(val,2),"ideal":f"{lo}–{hi}","recommendation":lo_msg,"priority":priority})
+        elif val > hi and hi_msg:
+            recs.append({"factor":col,"value":round(val,2),"ideal":f"{lo}–{hi}","recommendation":hi_msg,"priority":priority})
+    if str(row.get("shade_tree_present","")).lower() in ("false","0","no","none"):
+        recs.append({"factor":"shade_tree_present","value":"absent","ideal":"present",
+                     "recommendation":"No shade trees → plant Madre de Cacao or banana to improve grade quality and moisture retention.",
+                     "priority":"Medium"})
+    return recs
+
+def recommendations_table(rows):
+    """All recommendations for ``rows`` (one per triggered rule), High first.
+
+    Empty frame if every row is within the ideal ranges.
+    """
+    all_recs = []
+    for _, row in rows.iterrows():
+        for r in get_recommendations(row):
+            r["cluster_name"] = row.get("cluster_name","")
+            r["farm_name"]    = row.get("farm_name","")
+            r["season"]       = row.get("season","")
+            r["yield_kg"]     = row.get("yield_kg")
+            all_recs.append(r)
+    if not all_recs:
+        return pd.DataFrame()
+    rec_df = pd.DataFrame(all_recs)
+    rec_df["p_rank"] = rec_df["priority"].map(PRIORITY_RANK)
+    rec_df = rec_df.sort_values(["p_rank","farm_name","cluster_name"]).reset_index(drop=True)
+    return rec_df.drop(columns=["p_rank"])
@@ -0,0 +1,196 @@
+# ============================================================
+# ☕ Per-Farm Reports
+# Headless batch generation of one self-contained HTML report per
+# farm and season, built from the same charts and recommendation
+# tables as the dashboard and rendered by a process pool:
+#   python reports.py coffee_bean_quality_dataset.sql -o reports/ --workers 4
+# ============================================================
+
+import argparse, base64, html, multiprocessing as mp, os, re, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import plotly.io as pio
+
+from charts import grade_donut, season_yield_bar, yield_status_bar
+from recommendations import recommendations_table
+
+try:
+    import kaleido  # noqa: F401  (static images are optional)
+except ImportError:
+    kaleido = None
+
+CLUSTER_COLUMNS = ["cluster_name", "yield_kg", "pre_yield_kg", "yield_delta_pct", "yield_status",
+                   "fine_grade_pct", "forecast_yield_kg", "forecast_lo", "forecast_hi"]
+REC_COLUMNS = ["priority", "cluster_name", "factor", "value", "ideal", "recommendation"]
+
+# Read-only farm_id -> that farm's rows, grouped once per run and shared by the
+# workers: set in the parent before the pool forks (inherited copy-on-write) or
+# by ``_init_worker`` under spawn
+_FARMS = None
+
+STYLE = """
+body{font-family:system-ui,sans-serif;margin:2rem auto;max-width:1100px;color:#222}
+h1{color:#4A7C59;margin-bottom:0}.sub{color:#666;margin-top:.2rem}
+.kpis{display:flex;gap:1rem;flex-wrap:wrap;margin:1rem 0}
+.kpi{border:1px solid #ddd;border-radius:8px;padding:.6rem 1rem;min-width:130px}
+.kpi b{display:block;font-size:1.3rem}
+table{border-collapse:collapse;width:100%;font-size:.85rem;margin:.5rem 0 1.5rem}
+th,td{border-bottom:1px solid #eee;padding:.3rem .5rem;text-align:left}th{background:#f4f7f4}
+.grid{display:grid;grid-template-columns:1fr 1fr;gap:1rem}img{max-width:100%}
+"""
+
+def _init_worker(farms):
+    global _FARMS
+    _FARMS = farms
+
+def _group_farms(flat, farm_ids):
+    """``{farm_id: rows}`` for ``farm_ids`` in one grouping pass over ``flat``."""
+    wanted = set(farm_ids)
+    return {fid: flat.take(ix) for fid, ix in flat.groupby("farm_id", sort=False).indices.items() if fid in wanted}
+
+def report_name(farm_name, farm_id, season):
+    stem = re.sub(r"[^A-Za-z0-9]+", "_", f"{farm_name}_{season}").strip("_") or "farm"
+    return f"{stem}_{str(farm_id)[:8]}.html"
+
+def _figure_html(fig, images, plotlyjs):
+    if images:
+        png = base64.b64encode(fig.to_image(format="png", width=900, height=450)).decode()
+        return f'<img alt="{html.escape(fig.layout.title.text or "")}" src="data:image/png;base64,{png}">'
+    return pio.to_html(fig, full_html=False, include_plotlyjs=True if plotlyjs == "inline" else plotlyjs)
+
+def _table_html(df, columns):
+    cols = [c for c in columns if c in df.columns]
+    if df.empty or not cols:
+        return "<p>None.</p>"
+    return df[cols].round(2).to_html(index=False, na_rep="—", border=0)
+
+def farm_report(flat, farm_id, season, images=False, plotlyjs="cdn"):
+    """HTML for one farm's report on ``season``; ``None`` if it has no rows then.
+
+    ``plotlyjs`` is ``"inline"`` (self-contained, plotly.js embedded once),
+    ``"cdn"`` or ``False``; with ``images`` the charts are static PNGs instead.
+    """
+    farm = flat[flat["farm_id"] == farm_id]
+    current = farm[farm["season"] == season]
+    if current.empty:
+        return None
+    name = str(current["farm_name"].iloc[0])
+    where = ", ".join(str(current[c].iloc[0]) for c in ("municipality", "province") if c in current.columns)
+    drop = current.dropna(subset=["yield_kg", "pre_yield_kg"])
+    recs = recommendations_table(current)
+
+    kpis = {
+        "Total Yield (kg)": f"{current['yield_kg'].sum():,.1f}",
+        "Clusters":         current["cluster_id"].nunique(),
+        "Avg Fine %":       f"{current['fine_grade_pct'].mean():.1f}%" if current["fine_grade_pct"].notna().any() else "—",
+        "Yield Drop Rate":  f"{current['yield_drop'].mean() * 100:.1f}%",
+        "High Priority":    int((recs["priority"] == "High").sum()) if not recs.empty else 0,
+    }
+    if "forecast_yield_kg" in current.columns:
+        kpis["Next-Season Forecast (kg)"] = f"{current.drop_duplicates('cluster_id')['forecast_yield_kg'].sum():,.1f}"
+
+    figs = [season_yield_bar(farm, title="Yield per Season (kg)"), grade_donut(current, title=f"Grade Composition — {season}")]
+    if not drop.empty:
+        figs.append(yield_status_bar(drop, title=f"Cluster Yield Status — {season}"))
+    charts = [_figure_html(f, images, plotlyjs if i == 0 else False) for i, f in enumerate(figs)]
+
+    esc = html.escape
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{esc(name)} — {esc(str(season))}</title><style>{STYLE}</style></head>
+<body>
+<h1>☕ {esc(name)}</h1><p class="sub">{esc(where)} · Season {esc(str(season))}</p>
+<div class="kpis">{"".join(f'<div class="kpi">{esc(k)}<b>{esc(str(v))}</b></div>' for k, v in kpis.items())}</div>
+<div class="grid">{"".join(f"<div>{c}</div>" for c in charts)}</div>
+<h2>Clusters</h2>{_table_html(current.sort_values("cluster_name"), CLUSTER_COLUMNS)}
+<h2>Recommendations</h2>{_table_html(recs, REC_COLUMNS)}
+</body></html>"""
+
+def _render(job):
+    farm_id, season, out_dir, images, plotlyjs = job
+    farm = _FARMS.get(farm_id)
+    page = None if farm is None else farm_report(farm, farm_id, season, images, plotlyjs)
+    if page is None:
+        return None
+    row = farm.iloc[0]
+    path = os.path.join(out_dir, report_name(row["farm_name"], farm_id, season))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(page)
+    return farm_id, str(row["farm_name"]), os.path.basename(path)
+
+def render_reports(flat, farm_ids, season, out_dir, workers=None, images=False, plotlyjs="cdn"):
+    """Write one report per farm into ``out_dir`` and an ``index.html``.
+
+    Farms are rendered in a process pool; with the ``fork`` start method the
+    workers share the per-farm slices of ``flat`` (grouped once, here)
+    copy-on-write instead of receiving a pickled copy.
+    Returns ``[(farm_id, farm_name, file name)]`` for the farms with data.
+    """
+    global _FARMS
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(fid, season, out_dir, images, plotlyjs) for fid in farm_ids]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    farms = _group_farms(flat, farm_ids)
+    if workers == 1:
+        _FARMS = farms
+        done = list(map(_render, jobs))
+    else:
+        fork = "fork" in mp.get_all_start_methods()
+        if fork:
+            _FARMS = farms
+        ctx = mp.get_context("fork" if fork else "spawn")
+        init = {} if fork else {"initializer": _init_worker, "initargs": (farms,)}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, **init) as pool:
+            done = list(pool.map(_render, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    done = [d for d in done if d is not None]
+
+    links = "".join(f'<li><a href="{html.escape(f)}">{html.escape(n)}</a></li>'
+                    for _, n, f in sorted(done, key=lambda d: d[1]))
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Farm reports — {html.escape(str(season))}'
+                f'</title><style>{STYLE}</style></head><body><h1>☕ Farm reports</h1>'
+                f'<p class="sub">Season {html.escape(str(season))} · {len(done)} farms</p><ul>{links}</ul></body></html>')
+    return done
+
+# ═════════════════════════════════════════════════════════════════════════════
+# HEADLESS ENTRY POINT
+# ═════════════════════════════════════════════════════════════════════════════
+
+def main(argv=None):
+    from forecasting import forecast_clusters
+    from loader import DumpSource, filter_mask, load_source
+
+    ap = argparse.ArgumentParser(description="Render per-farm HTML reports from a SQL dump.")
+    ap.add_argument("dump", help="SQL dump, e.g. coffee_bean_quality_dataset.sql")
+    ap.add_argument("-o", "--output", required=True, help="output directory")
+    ap.add_argument("--season", help="default: latest season")
+    ap.add_argument("--workers", type=int, help="default: CPU count")
+    ap.add_argument("--images", action="store_true", help="embed static PNG charts (needs kaleido)")
+    ap.add_argument("--plotlyjs", choices=["inline", "cdn"], default="inline",
+                    help="inline = fully self-contained (default); cdn = smaller files")
+    for flag in ("province", "municipality", "farm"):
+        ap.add_argument(f"--{flag}", action="append", default=[], help="repeatable filter")
+    args = ap.parse_args(argv)
+    if args.images and kaleido is None:
+        ap.error("--images requires the kaleido package")
+
+    t0 = time.time()
+    flat = load_source(DumpSource.from_path(args.dump))[0]
+    fc = forecast_clusters(flat)
+    flat = flat.join(fc, on="cluster_id") if len(fc) else flat
+    seasons = list(pd.unique(flat.sort_values("season_idx")["season"].dropna()))
+    season = args.season or (seasons[-1] if seasons else None)
+    if season not in seasons:
+        ap.error(f"unknown season {season!r}; choose from {', '.join(map(str, seasons))}")
+    mask = filter_mask(flat, args.province, args.municipality, args.farm, [season])
+    farm_ids = list(pd.unique(flat.loc[mask, "farm_id"].dropna()))
+    t_load = time.time()
+
+    done = render_reports(flat, farm_ids, season, args.output, args.workers,
+                          args.images, args.plotlyjs)
+    elapsed = time.time() - t_load
+    rate = len(done) / elapsed * 60 if elapsed > 0 else float("inf")
+    print(f"Rendered {len(done):,} farm reports for {season} to {args.output} in {elapsed:.1f}s "
+          f"({rate:,.0f} farms/min; load {t_load-t0:.1f}s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# ============================================================
+# ☕ Risk-Priority Index
+# "Farms requiring immediate attention": one materialised,
+# pre-sorted per-cluster priority table per dataset and forecast
+# model, with top-K queries by location and keyed drill-downs
+# ============================================================
+
+import heapq
+from itertools import islice
+import numpy as np
+import pandas as pd
+
+# Component -> weight; each component is a 0–1 percentile rank across clusters
+RISK_WEIGHTS = {
+    "climate_stress":        0.20,
+    "mgmt_gap":              0.15,
+    "yield_decline_pct":     0.25,
+    "predicted_decline_pct": 0.25,
+    "high_priority_recs":    0.15,
+}
+RISK_LEVELS = [(75, "Critical"), (55, "High"), (35, "Moderate"), (-np.inf, "Low")]
+GROUP_COLUMNS = ["province", "municipality", "farm_name"]
+
+def high_priority_counts(df, rules):
+    """Vectorised count of triggered ``"High"`` rules per row of ``df``.
+
+    ``rules`` uses the ``(col, lo, hi, lo_msg, hi_msg, priority)`` layout of
+    the dashboard's recommendation table; a side only counts if it has a message.
+    """
+    count = np.zeros(len(df), dtype=np.int64)
+    for col, lo, hi, lo_msg, hi_msg, priority in rules:
+        if priority != "High" or col not in df.columns:
+            continue
+        val = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            count += ((val < lo) & bool(lo_msg)) | ((val > hi) & bool(hi_msg))
+    return count
+
+def _pct_rank(s):
+    # Missing components count as median risk rather than none
+    return s.rank(pct=True).fillna(0.5)
+
+class RiskIndex:
+    """Per-cluster priority scores, sorted once, with O(k) top-K queries.
+
+    ``table`` holds one row per cluster (its latest season), ordered by
+    descending ``priority_score``. Positions into it are pre-grouped by
+    province / municipality / farm name (for top-K) and by farm id (for
+    drill-down), so queries never rescan or re-score the data.
+    """
+
+    def __init__(self, table):
+        self.table = table.sort_values("priority_score", ascending=False, kind="stable")
+        self._groups = {col: self._positions(col) for col in GROUP_COLUMNS if col in table.columns}
+        self._by_farm = self._positions("farm_id")
+        self._farm_ids = self.table["farm_id"].to_numpy()
+        self.nbytes = int(self.table.memory_usage(deep=True).sum())
+
+    def _positions(self, col):
+        # Table is sorted, so each group's positions are already in score order
+        codes, keys = pd.factorize(self.table[col])
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+        return {k: order[bounds[i]:bounds[i + 1]] for i, k in enumerate(keys)}
+
+    def _merged(self, col, keys):
+        # k-way merge of the groups' ascending position lists: the table is
+        # sorted, so position order is score order with ties as in the table
+        return heapq.merge(*(self._groups[col].get(k, ()) for k in keys))
+
+    def _first_per_farm(self, positions):
+        # Positions arrive in score order, so a farm's first one is its riskiest cluster
+        seen = set()
+        for p in positions:
+            if self._farm_ids[p] not in seen:
+                seen.add(self._farm_ids[p])
+                yield p
+
+    def top_k(self, k=10, province=None, municipality=None, farm_name=None, per_farm=False):
+        """The ``k`` highest-priority clusters, optionally within locations.
+
+        Each location argument takes a list of values (an empty list or
+        ``None`` doesn't filter). The most specific filter drives a merge of
+        its pre-sorted groups; the coarser ones are checked per candidate.
+        With ``per_farm`` only each farm's riskiest cluster is kept, so ``k``
+        farms come back, with their cluster count in ``clusters``.
+        """
+        filters = [(c, set(v)) for c, v in
+                   (("farm_name", farm_name), ("municipality", municipality), ("province", province)) if v]
+        cand = iter(range(len(self.table)))
+        if filters:
+            (col, keys), rest = filters[0], filters[1:]
+            cand = self._merged(col, keys)
+            if rest:
+                cols = {c: self.table[c].to_numpy() for c, _ in rest}
+                cand = (p for p in cand if all(cols[c][p] in v for c, v in rest))
+        if not per_farm:
+            return self.table.iloc[list(islice(cand, k))]
+        out = self.table.iloc[list(islice(self._first_per_farm(cand), k))]
+        return out.assign(clusters=[len(self._by_farm[f]) for f in out["farm_id"]])
+
+    def clusters(self, farm_id):
+        """Drill-down: one farm's clusters in priority order (keyed lookup)."""
+        return self.table.iloc[self._by_farm.get(farm_id, np.empty(0, dtype=np.int64))]
+
+def build_risk_index(flat, rules, forecasts=None):
+    """Score every cluster on its latest season and materialise a :class:`RiskIndex`.
+
+    ``forecasts`` (indexed by ``cluster_id``, with ``forecast_yield_kg``)
+    supplies the predicted next-season decline relative to the latest yield.
+    """
+    latest = (flat.dropna(subset=["cluster_id", "season_idx"])
+              .sort_values("season_idx", kind="stable")
+              .drop_duplicates("cluster_id", keep="last")
+              .set_index("cluster_id", drop=False))
+    latest.index.name = None
+    t = latest[[c for c in ["cluster_id", "cluster_name", "farm_id", "farm_name", "municipality",
+                            "province", "season", "yield_kg", "climate_stress", "mgmt_score"]
+                if c in latest.columns]].copy()
+    t["yield_decline_pct"] = (0 - latest["yield_delta_pct"]).clip(lower=0)
+    if forecasts is not None and len(forecasts):
+        fc = t["cluster_id"].map(forecasts["forecast_yield_kg"])
+        t["forecast_yield_kg"] = fc
+        t["predicted_decline_pct"] = ((latest["yield_kg"] - fc) /
+                                      latest["yield_kg"].replace(0, np.nan) * 100).clip(lower=0).round(2)
+    else:
+        t["forecast_yield_kg"] = t["predicted_decline_pct"] = np.nan
+    t["high_priority_recs"] = high_priority_counts(latest, rules)
+
+    comps = {
+        "climate_stress":        _pct_rank(t["climate_stress"]),
+        "mgmt_gap":              _pct_rank(-t["mgmt_score"]),
+        "yield_decline_pct":     _pct_rank(t["yield_decline_pct"]),
+        "predicted_decline_pct": _pct_rank(t["predicted_decline_pct"]),
+        "high_priority_recs":    _pct_rank(t["high_priority_recs"]),
+    }
+    t["priority_score"] = (100 * sum(w * comps[c] for c, w in RISK_WEIGHTS.items())).round(1)
+    t["risk_level"] = "Low"
+    for cut, label in reversed(RISK_LEVELS[:-1]):
+        t.loc[t["priority_score"] >= cut, "risk_level"] = label
+    return RiskIndex(t)
@@ -0,0 +1,187 @@
+# ============================================================
+# ☕ Shared Store
+# Process-wide, cross-session store for parsed datasets and other
+# expensive shared artifacts, with per-key locks and ref-counting
+# ============================================================
+
+import threading, time
+from collections import OrderedDict
+import pandas as pd
+
+SESSION_TTL_S = 30 * 60  # sessions idle this long no longer pin anything
+
+def frame_nbytes(obj):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, (tuple, list)):
+        return sum(frame_nbytes(o) for o in obj)
+    return int(getattr(obj, "nbytes", 0))
+
+def read_only_view(obj):
+    """Zero-copy view of a shared frame.
+
+    With copy-on-write enabled, a shallow copy shares the column buffers but
+    any write — even ``view["x"] = ...`` — lands in the caller's own copy.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy(deep=False)
+    if isinstance(obj, tuple):
+        return tuple(read_only_view(o) for o in obj)
+    return obj
+
+class _KeyedLocks:
+    """One lock per key, dropped again once nobody holds or waits on it."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}  # key -> [lock, users]
+
+    def __call__(self, key):
+        return _KeyedLock(self, key)
+
+    def _enter(self, key):
+        with self._guard:
+            slot = self._locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        slot[0].acquire()
+
+    def _exit(self, key):
+        with self._guard:
+            slot = self._locks[key]
+            slot[0].release()
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[key]
+
+class _KeyedLock:
+    def __init__(self, owner, key):
+        self._owner, self._key = owner, key
+
+    def __enter__(self):
+        self._owner._enter(self._key)
+
+    def __exit__(self, *exc):
+        self._owner._exit(self._key)
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "sessions", "last_used")
+
+    def __init__(self, value):
+        self.value     = value
+        self.nbytes    = frame_nbytes(value)
+        self.sessions  = set()
+        self.last_used = time.time()
+
+class SharedStore:
+    """Deduplicates datasets by content digest and derived artifacts by key.
+
+    Entries referenced by a live session are never evicted. Unreferenced
+    entries are dropped least-recently-used first once the store grows past
+    ``budget_bytes``.
+    """
+
+    def __init__(self, budget_bytes=2 << 30, session_ttl=SESSION_TTL_S):
+        self.budget_bytes = budget_bytes
+        self.session_ttl  = session_ttl
+        self._lock     = threading.RLock()
+        self._keys     = _KeyedLocks()
+        self._entries  = OrderedDict()  # key -> _Entry
+        self._sessions = {}             # session_id -> (dataset key, last_seen)
+        self._hits = self._misses = self._evictions = 0
+        self._peak_sessions = 0
+
+    # ── Datasets ──────────────────────────────────────────────────────────────
+    def dataset(self, digest, session_id, load_fn):
+        """Return read-only views of the dataset for ``digest``, loading it once.
+
+        The calling session takes a reference on the dataset (and drops the
+        one it held on a previous dataset).
+        """
+        key = ("dataset", digest)
+        value = self._get_or_compute(key, load_fn)
+        with self._lock:
+            prev = self._sessions.get(session_id, (None, 0))[0]
+            if prev is not None and prev != key and prev in self._entries:
+                self._entries[prev].sessions.discard(session_id)
+            if key in self._entries:
+                self._entries[key].sessions.add(session_id)
+            self._sessions[session_id] = (key, time.time())
+            self._peak_sessions = max(self._peak_sessions, len(self._sessions))
+            self._expire_sessions()
+            self._evict(keep=key)
+        return read_only_view(value)
+
+    def release(self, session_id):
+        """Drop the session's dataset reference (e.g. its upload was replaced or removed)."""
+        with self._lock:
+            key = self._sessions.pop(session_id, (None, 0))[0]
+            if key in self._entries:
+                self._entries[key].sessions.discard(session_id)
+            self._evict()
+
+    # ── Derived artifacts ─────────────────────────────────────────────────────
+    def artifact(self, key, compute_fn):
+        """Compute-once cache for shared derived values (models, indexes, ...)."""
+        return read_only_view(self._get_or_compute(("artifact",) + tuple(key), compute_fn))
+
+    def _get_or_compute(self, key, compute_fn):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._hits += 1
+                entry.last_used = time.time()
+                self._entries.move_to_end(key)
+                return entry.value
+        # Per-key lock: concurrent sessions asking for the same key wait for
+        # the first one instead of computing it again.
+        with self._keys(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._hits += 1
+                    return entry.value
+                self._misses += 1
+            entry = _Entry(compute_fn())
+            with self._lock:
+                self._entries[key] = entry
+                self._evict(keep=key)
+            return entry.value
+
+    # ── Housekeeping ──────────────────────────────────────────────────────────
+    def _expire_sessions(self):
+        cutoff = time.time() - self.session_ttl
+        for sid, (key, seen) in list(self._sessions.items()):
+            if seen < cutoff:
+                del self._sessions[sid]
+                if key in self._entries:
+                    self._entries[key].sessions.discard(sid)
+
+    def _evict(self, keep=None):
+        total = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.sessions or key == keep:
+                continue
+            total -= entry.nbytes
+            del self._entries[key]
+            self._evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "datasets":        sum(1 for k in self._entries if k[0] == "dataset"),
+                "artifacts":       sum(1 for k in self._entries if k[0] == "artifact"),
+                "bytes":           sum(e.nbytes for e in self._entries.values()),
+                "budget_bytes":    self.budget_bytes,
+                "hits":            self._hits,
+                "misses":          self._misses,
+                "hit_rate":        self._hits / lookups if lookups else 0.0,
+                "evictions":       self._evictions,
+                "active_sessions": len(self._sessions),
+                "peak_sessions":   self._peak_sessions,
+            }
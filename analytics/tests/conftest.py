@@ -0,0 +1,4 @@
+import os, sys
+
+# The analytics modules are flat scripts imported by name (``from loader import ...``)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
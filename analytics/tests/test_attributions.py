@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+
+from attributions import explain_models, tree_shap
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(120, 3)) * [1.0, 10.0, 0.1]
+    df = pd.DataFrame(X, columns=["a", "b", "c"])
+    df["y"] = 2 * df["a"] - 0.3 * df["b"] + rng.normal(scale=0.1, size=len(df))
+    df["id"] = [f"hr-{i}" for i in range(len(df))]
+    return df
+
+@pytest.mark.parametrize("model", [GradientBoostingRegressor(n_estimators=30, subsample=0.8, random_state=0),
+                                   RandomForestRegressor(n_estimators=20, random_state=0)])
+def test_attributions_sum_to_prediction(frame, model):
+    X = frame[["a", "b", "c"]].to_numpy()
+    model.fit(X, frame["y"])
+    phi, base = tree_shap(model, X, n_jobs=1)
+    np.testing.assert_allclose(phi.sum(1) + base, model.predict(X), atol=1e-9)
+
+def test_attributions_follow_record_ids_not_positions(frame):
+    feats = ["a", "b", "c"]
+    model = GradientBoostingRegressor(n_estimators=30, random_state=0).fit(frame[feats], frame["y"])
+    attr = explain_models(frame, feats, {"yield_kg": model}, n_jobs=1)["yield_kg"]
+    # Same records in another order, with a fresh RangeIndex
+    other = frame.sample(frac=1, random_state=1).reset_index(drop=True).set_index("id")
+    np.testing.assert_allclose(attr["pred"].loc[other.index], model.predict(other[feats]), atol=1e-9)
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import ks_2samp
+
+from drift import (DriftProfile, PartitionedProfiles, ProfileLibrary, StreamingHistogram,
+                   category_drift, drift_report, feature_drift)
+
+def _hist(values, max_bins=64):
+    return StreamingHistogram(max_bins).update(values)
+
+def test_merging_few_distinct_values_stays_exact():
+    rng = np.random.default_rng(0)
+    batches = [rng.integers(0, 12, size=n).astype(float) for n in (5, 300, 40, 1000)]
+    batches[1][:7] = np.nan
+    merged = StreamingHistogram.merge_all(_hist(b) for b in batches)
+    pairwise = _hist(batches[0]).merge(_hist(batches[1])).merge(_hist(batches[2])).merge(_hist(batches[3]))
+    values = np.concatenate(batches)
+    values = values[~np.isnan(values)]
+    grid = np.arange(-1, 13) + 0.5
+    for h in (merged, pairwise):
+        assert h.exact and h.n == len(values)
+        np.testing.assert_array_equal(h.cdf(grid), (values[:, None] <= grid).mean(axis=0))
+        assert h.quantile(0.5) == np.quantile(values, 0.5, method="inverted_cdf")
+
+def test_continuous_merges_respect_the_bin_budget():
+    rng = np.random.default_rng(1)
+    batches = [rng.normal(10, 3, size=2000) for _ in range(20)]
+    merged = StreamingHistogram.merge_all(_hist(b, max_bins=32) for b in batches)
+    values = np.concatenate(batches)
+    assert not merged.exact and len(merged.means) <= 32 and merged.n == len(values)
+    q = np.array([0.1, 0.25, 0.5, 0.75, 0.9])
+    np.testing.assert_allclose(merged.quantile(q), np.quantile(values, q), atol=0.15)
+
+def test_empty_summaries():
+    empty = StreamingHistogram()
+    assert empty.n == 0 and np.isnan(empty.cdf(1.0)) and np.isnan(empty.quantile(0.5))
+    assert StreamingHistogram.merge_all([]).n == 0
+    assert np.isnan(feature_drift(empty, _hist([1.0, 2.0]))).all()
+
+def test_ks_matches_scipy_on_exact_summaries():
+    rng = np.random.default_rng(2)
+    ref, cur = rng.integers(0, 20, 500).astype(float), rng.integers(3, 25, 300).astype(float)
+    _, ks = feature_drift(_hist(ref), _hist(cur))
+    assert ks == pytest.approx(ks_2samp(ref, cur).statistic)
+
+def test_psi_is_near_zero_for_the_same_distribution_and_grows_with_shift():
+    rng = np.random.default_rng(3)
+    ref = _hist(rng.normal(0, 1, 5000))
+    same = feature_drift(ref, _hist(rng.normal(0, 1, 5000)))
+    small = feature_drift(ref, _hist(rng.normal(0.3, 1, 5000)))
+    large = feature_drift(ref, _hist(rng.normal(1.5, 1, 5000)))
+    assert same[0] < 0.02 and same[1] < 0.05
+    assert same[0] < small[0] < large[0] and large[0] > 0.25
+    assert same[1] < small[1] < large[1]
+
+def test_category_drift_reports_unseen_share():
+    psi, new = category_drift({"A": 50, "B": 50}, {"A": 40, "B": 40, "C": 20})
+    assert new == pytest.approx(0.2) and psi > 0
+    assert category_drift({"A": 5}, {"A": 10}) == (0.0, 0.0)
+    assert np.isnan(category_drift({}, {"A": 1})).all()
+
+# ═════════════════════════════════════════════════════════════════════════════
+# PROFILES
+# ═════════════════════════════════════════════════════════════════════════════
+
+FEATURES = ["soil_ph", "trees"]
+
+def _rows(seed, n=600, shift=0.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "farm_id":  rng.choice(["f1", "f2", "f3", "f4"], n),
+        "season":   rng.choice(["2023", "2024"], n),
+        "province": rng.choice(["Bukidnon", "Davao"], n),
+        "soil_ph":  rng.normal(6 + shift, 0.5, n),
+        "trees":    rng.integers(10, 20, n).astype(float),
+    })
+
+def test_partition_merge_equals_a_profile_of_all_rows():
+    df = _rows(0)
+    parts = PartitionedProfiles(df, FEATURES)
+    whole, merged = DriftProfile.from_frame(df, FEATURES), parts.merged()
+    assert merged.n_rows == whole.n_rows == len(df) and len(parts.parts) == 8
+    assert merged.cats == whole.cats
+    # Few distinct tree counts: exact either way
+    np.testing.assert_array_equal(merged.hists["trees"].means, whole.hists["trees"].means)
+    np.testing.assert_array_equal(merged.hists["trees"].counts, whole.hists["trees"].counts)
+    assert drift_report(whole, merged)[1]["retrain"] is False
+
+def test_for_rows_merges_only_the_partitions_touched():
+    df = _rows(0)
+    parts = PartitionedProfiles(df, FEATURES)
+    rows = df[(df["farm_id"] == "f2") & (df["season"] == "2024")].head(3)
+    assert parts.for_rows(rows).n_rows == len(df[(df["farm_id"] == "f2") & (df["season"] == "2024")])
+    assert parts.merged([("f9", "2024")]).n_rows == 0
+
+def test_library_reuses_unchanged_partitions_across_dumps():
+    library = ProfileLibrary()
+    df = _rows(0)
+    first = PartitionedProfiles(df, FEATURES, library=library)
+    assert first.reused == 0 and len(library) == 8
+    # Same rows in another order: every partition is reused
+    assert PartitionedProfiles(df.sample(frac=1, random_state=1), FEATURES, library=library).reused == 8
+    changed = df.copy()
+    changed.loc[(changed["farm_id"] == "f1") & (changed["season"] == "2023"), "soil_ph"] += 1
+    again = PartitionedProfiles(changed, FEATURES, library=library)
+    assert again.reused == 7 and len(library) == 9
+    assert again.parts[("f1", "2023")] is not first.parts[("f1", "2023")]
+
+def test_library_evicts_least_recently_used_within_budget():
+    profiles = [DriftProfile.from_frame(_rows(s, n=50), FEATURES) for s in range(4)]
+    library = ProfileLibrary(budget_bytes=profiles[0].nbytes * 2 + 1)
+    library.put("a", profiles[0])
+    library.put("b", profiles[1])
+    assert library.get("a") is profiles[0]
+    library.put("c", profiles[2])
+    assert library.get("b") is None and library.get("a") is profiles[0] and len(library) == 2
+    assert library.nbytes <= library.budget_bytes
+    # A single profile over budget is still kept
+    tiny = ProfileLibrary(budget_bytes=1)
+    tiny.put("a", profiles[0])
+    assert len(tiny) == 1
+
+def test_drift_report_flags_shifted_features():
+    ref = DriftProfile.from_frame(_rows(0), FEATURES)
+    table, verdict = drift_report(ref, DriftProfile.from_frame(_rows(1, shift=1.0), FEATURES))
+    status = table.set_index("feature")["status"]
+    assert verdict["retrain"] and status["soil_ph"] == "Major drift"
+    assert status["trees"] == "Stable" and status["province"] == "Stable"
+    assert verdict["reasons"][0].startswith("soil_ph: PSI")
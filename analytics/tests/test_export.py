@@ -0,0 +1,36 @@
+import gzip, io
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from export import FORMATS, available_formats, export_file
+
+@pytest.fixture
+def flat():
+    return pd.DataFrame({"cluster_id": [f"c{i}" for i in range(7)],
+                         "yield_kg":   np.arange(7) * 1.5,
+                         "notes":      [None] * 7})
+
+def _read(data, fmt, compression):
+    if fmt == "csv":
+        return pd.read_csv(io.BytesIO(gzip.decompress(data) if compression == "gzip" else data))
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+    return pa.ipc.open_file(io.BytesIO(data)).read_all().to_pandas()
+
+@pytest.mark.parametrize("fmt,compression", [(f, c) for f in FORMATS for c in FORMATS[f][2]])
+def test_download_button_accepts_export(flat, fmt, compression):
+    if fmt not in available_formats():
+        pytest.skip(f"{fmt} needs pyarrow")
+    row_ids, columns = [5, 1, 3], ["cluster_id", "yield_kg", "notes"]
+    # What st.download_button does with the deferred ``data`` callable's result
+    data, _ = convert_data_to_bytes_and_infer_mime(
+        (lambda: export_file(flat, row_ids, columns, fmt, compression, chunk_rows=2))(),
+        unsupported_error=TypeError("unsupported download data"))
+    out = _read(data, fmt, compression)
+    assert list(out.columns) == columns
+    assert out["cluster_id"].tolist() == ["c5", "c1", "c3"]
+    assert out["yield_kg"].tolist() == [7.5, 1.5, 4.5]
@@ -0,0 +1,123 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loader import DumpSource, DuplicateKeyError, file_digest, keyed_join, parse_table, resolve_duplicates
+
+DUMP = """
+-- farms
+INSERT INTO public.farms (id, name, note) VALUES
+('f1', 'Kape, ni Reyes', NULL),
+('f2', 'O''Brien Estate', 'planted NOW()'),
+('f3', 'short row');
+INSERT INTO farms (note, id, name) VALUES ('', 'f4', 'Tanaw');
+INSERT INTO clusters (id, farm_id) VALUES ('c1', 'f1');
+-- VERIFY
+"""
+
+def test_parse_table_quotes_nulls_and_column_order():
+    df = parse_table(DUMP, "farms")
+    assert df.columns.tolist() == ["id", "name", "note"]
+    # The short tuple is skipped; later blocks are realigned to the first header
+    assert df["id"].tolist() == ["f1", "f2", "f4"]
+    assert df["name"].tolist() == ["Kape, ni Reyes", "O'Brien Estate", "Tanaw"]
+    assert df["note"].isna().tolist() == [True, False, True]
+
+def test_parse_table_bytes_str_and_mmap_agree(tmp_path):
+    path = tmp_path / "dump.sql"
+    path.write_text(DUMP, encoding="utf-8")
+    with DumpSource.from_path(str(path)).open() as buf:
+        from_mmap = parse_table(buf, "farms")
+    assert from_mmap.equals(parse_table(DUMP, "farms"))
+    assert from_mmap.equals(parse_table(DUMP.encode(), "farms"))
+    assert parse_table(DUMP, "clusters")["farm_id"].tolist() == ["f1"]
+    assert parse_table(DUMP, "harvests").empty
+
+def test_array_constructors_become_literals():
+    df = parse_table("INSERT INTO h (id, picks) VALUES ('h1', ARRAY[1, 2.5, NULL]), ('h2', '{3}');", "h")
+    assert df["picks"].tolist() == ["{1, 2.5, NULL}", "{3}"]
+
+def test_upload_is_hashed_while_spooled_and_deleted_on_close():
+    upload = io.BytesIO(DUMP.encode())
+    upload.name = "coffee.sql"
+    source = DumpSource.from_upload(upload)
+    assert source.name == "coffee.sql" and source.size == len(DUMP.encode())
+    assert source.digest == file_digest(source.path)
+    source.close()
+    assert not os.path.exists(source.path)
+
+def test_digest_follows_content_and_empty_dump_opens(tmp_path):
+    a, b = tmp_path / "a.sql", tmp_path / "b.sql"
+    a.write_text(DUMP)
+    b.write_text(DUMP + "\n")
+    assert DumpSource.from_path(str(a)).digest != DumpSource.from_path(str(b)).digest
+    empty = tmp_path / "empty.sql"
+    empty.write_bytes(b"")
+    with DumpSource.from_path(str(empty)).open() as buf:
+        assert buf == b"" and parse_table(buf, "farms").empty
+    # Only spooled uploads are owned: closing a path source leaves the file alone
+    DumpSource.from_path(str(a)).close()
+    assert a.exists()
+
+def test_missing_dump_raises():
+    with pytest.raises(FileNotFoundError):
+        DumpSource.from_path("/nonexistent/dump.sql")
+
+# ═════════════════════════════════════════════════════════════════════════════
+# KEYED JOIN
+# ═════════════════════════════════════════════════════════════════════════════
+
+ON = ["cluster_id", "season"]
+
+@pytest.fixture
+def csd():
+    # c1/2024 was re-submitted: the later row corrects the first; the undated row is oldest
+    return pd.DataFrame({"cluster_id": ["c1", "c1", "c1", "c2"],
+                         "season":     ["2024", "2024", "2024", "2024"],
+                         "yield_kg":   [10.0, 30.0, 80.0, 7.0],
+                         "grade":      ["A", None, "C", "B"],
+                         "updated_at": ["2024-05-01", "2024-06-01", None, "2024-01-01"]})
+
+def test_latest_keeps_newest_row_per_key(csd):
+    unique, n_keys = resolve_duplicates(csd, ON, "latest", order_by="updated_at")
+    assert n_keys == 1
+    assert unique.set_index("cluster_id")["yield_kg"].to_dict() == {"c1": 30.0, "c2": 7.0}
+
+def test_latest_without_timestamps_falls_back_to_dump_order(csd):
+    unique, _ = resolve_duplicates(csd.drop(columns="updated_at"), ON, "latest")
+    assert unique.set_index("cluster_id")["yield_kg"].to_dict() == {"c1": 80.0, "c2": 7.0}
+
+def test_aggregate_averages_numbers_and_keeps_latest_non_null(csd):
+    unique, n_keys = resolve_duplicates(csd, ON, "aggregate", order_by="updated_at")
+    row = unique.set_index("cluster_id").loc["c1"]
+    assert n_keys == 1 and row["yield_kg"] == 40.0
+    # Newest row has no grade, so the newest non-null one is taken
+    assert row["grade"] == "A"
+    assert unique.columns.tolist() == csd.columns.tolist()
+
+def test_reject_raises_and_unknown_policy_is_a_value_error(csd):
+    with pytest.raises(DuplicateKeyError, match="1 duplicate"):
+        resolve_duplicates(csd, ON, "reject")
+    assert resolve_duplicates(csd.iloc[2:], ON, "reject")[1] == 0
+    with pytest.raises(ValueError, match="Unknown duplicate policy"):
+        resolve_duplicates(csd, ON, "first")
+
+@pytest.mark.parametrize("policy, c1_yield", [("latest", 30.0), ("aggregate", 40.0)])
+def test_keyed_join_preserves_left_rows(csd, policy, c1_yield):
+    left = pd.DataFrame({"cluster_id": ["c2", "c1", "c3", "c1"], "season": "2024",
+                         "yield_kg": [1.0, 2.0, 3.0, 4.0]}, index=[10, 11, 12, 13])
+    joined, stats = keyed_join(left, csd, ON, policy, order_by="updated_at")
+    assert joined.index.tolist() == [10, 11, 12, 13]
+    assert joined["yield_kg"].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert joined["yield_kg_csd"].tolist()[:2] == [7.0, c1_yield] and np.isnan(joined["yield_kg_csd"].iloc[2])
+    assert "updated_at" not in joined
+    assert (stats["matched_rows"], stats["unmatched_rows"], stats["duplicate_rows"]) == (3, 1, 2)
+    assert stats["out_rows"] == stats["left_rows"] == 4
+
+def test_keyed_join_reject_raises(csd):
+    left = pd.DataFrame({"cluster_id": ["c1"], "season": ["2024"]})
+    with pytest.raises(DuplicateKeyError):
+        keyed_join(left, csd, ON, "reject")
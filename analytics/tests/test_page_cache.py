@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from loader import filter_mask
+from page_cache import filter_signature
+
+def test_signature_is_order_insensitive():
+    options = ["Bukidnon", "Davao"]
+    assert filter_signature(province=(["Davao", "Bukidnon"], options)) == \
+           filter_signature(province=(["Bukidnon", "Davao"], options))
+
+def test_all_selected_differs_from_none_selected():
+    # A missing province survives an empty selection but not a full one
+    flat = pd.DataFrame({"province": ["Bukidnon", "Davao", np.nan], "municipality": "x", "season": "s"})
+    options = ["Bukidnon", "Davao"]
+    assert filter_mask(flat, []).sum() != filter_mask(flat, options).sum()
+    assert filter_signature(province=([], options)) != filter_signature(province=(options, options))
+    assert filter_signature(province=([], options)) == filter_signature(province=(None, options))
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from picks import PickArrays, _align, curve_metrics, parse_arrays, pick_profile, season_curves
+
+def _records(yields, fines=None, mode="increments"):
+    df = pd.DataFrame({"id": [f"r{i}" for i in range(len(yields))], "yield_kg": yields})
+    if fines is not None:
+        df["grade_fine"] = fines
+    return PickArrays.from_records(df, mode)
+
+def test_parse_arrays_literals_scalars_and_nulls():
+    values, offsets = parse_arrays(["{1,2.5,3}", "7", None, "{}", "NULL", '{"4", NULL}', "[5,6]"])
+    assert offsets.tolist() == [0, 3, 4, 4, 4, 4, 6, 8]
+    np.testing.assert_array_equal(values, [1, 2.5, 3, 7, 4, np.nan, 5, 6])
+
+def test_cumulative_arrays_become_per_pick_increments():
+    picks = _records(["{2,5,9}", "{4}", "{}", "{1,1,3}"], mode="cumulative")
+    np.testing.assert_array_equal(picks.values["yield_kg"], [2, 3, 4, 4, 1, 0, 2])
+    # Season totals equal the last running total, i.e. the old scalar (NULL if no picks)
+    np.testing.assert_array_equal(picks.totals()["yield_kg"], [9, 4, np.nan, 3])
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        _records(["{1}"], mode="monthly")
+
+def test_align_pads_short_and_trims_long_records():
+    v, off = parse_arrays(["{1,2}", "{3,4,5,6}", "{}"])
+    _, target = parse_arrays(["{0,0,0}", "{0,0}", "{0}"])
+    np.testing.assert_array_equal(_align(v, off, target), [1, 2, np.nan, 3, 4, np.nan])
+
+def test_short_grade_arrays_stay_missing_after_cumulative_conversion():
+    picks = _records(["{5,10,15}", "{2,4}"], ["{1,2}", "{1,2}"], mode="cumulative")
+    np.testing.assert_array_equal(picks.values["grade_fine"], [1, 1, np.nan, 1, 1])
+
+def test_subset_is_compact_in_requested_order():
+    picks = _records(["{1,2}", "{3}", "{4,5,6}"], ["{0,1}", "{1}", "{1,1,0}"])
+    sub = picks.subset(["r2", "missing", "r0", "r2"])
+    assert sub.ids.tolist() == ["r2", "r0"]
+    assert sub.offsets.tolist() == [0, 3, 5]
+    np.testing.assert_array_equal(sub.values["yield_kg"], [4, 5, 6, 1, 2])
+    np.testing.assert_array_equal(sub.values["grade_fine"], [1, 1, 0, 0, 1])
+
+def test_padded_picks_do_not_count_as_zero_fine():
+    # Fine is only known for the first two picks: no late-season Fine %, so no quality drop
+    cm = curve_metrics(_records(["{5,5,5,50}"], ["{1,2}"]))
+    row = cm.loc["r0"]
+    assert row["fine_pct_early"] == 30.0
+    assert np.isnan(row["fine_pct_late"]) and np.isnan(row["fine_drift_pp"])
+    assert row["pattern"] != "Late quality drop"
+
+def test_pick_profile_takes_fine_pct_over_graded_yield_only():
+    prof = pick_profile(_records(["{5,5,5,50}", "{10,10,10}"], ["{1,2}", "{5,5,5}"]))
+    assert prof["records"].tolist() == [2, 2, 2, 1]
+    assert prof["fine_pct"].tolist()[:3] == [40.0, 46.67, 50.0]
+    assert np.isnan(prof["fine_pct"].iloc[3])
+
+def test_season_curves_skip_few_pick_records():
+    picks = _records(["{10}", "{1,1,1,1}", "{4,2}"], ["{1}", "{1,1,1,1}", "{1,1}"])
+    curves = season_curves(picks, points=5)
+    assert curves["records"].unique().tolist() == [1]
+    assert curves["cum_share"].tolist() == [0.0, 0.25, 0.5, 0.75, 1.0]
+    assert curves["fine_pct"].dropna().eq(100.0).all()
+    assert season_curves(_records(["{1}", "{2,3}"])).empty
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_index import RiskIndex, build_risk_index, high_priority_counts
+
+@pytest.fixture
+def table():
+    rng = np.random.default_rng(0)
+    n = 300
+    farm = rng.integers(0, 40, n)
+    return pd.DataFrame({
+        "cluster_id":     [f"c{i}" for i in range(n)],
+        "farm_id":        [f"f{f}" for f in farm],
+        "farm_name":      [f"Farm {f % 30}" for f in farm],  # some names shared by two farms
+        "municipality":   [f"m{f % 7}" for f in farm],
+        "province":       [f"p{f % 3}" for f in farm],
+        "priority_score": rng.integers(0, 60, n).astype(float),  # plenty of ties
+    })
+
+def _reference(table, k, province=None, municipality=None, farm_name=None):
+    t = table.sort_values("priority_score", ascending=False, kind="stable")
+    for col, v in (("province", province), ("municipality", municipality), ("farm_name", farm_name)):
+        if v:
+            t = t[t[col].isin(v)]
+    return t.head(k)
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"province": ["p1"]},
+    {"municipality": ["m2", "m5"]},
+    {"province": ["p0", "p2"], "municipality": ["m0", "m3", "m4"]},
+    {"farm_name": ["Farm 3", "Farm 12"], "province": ["p0"]},
+    {"province": ["nowhere"]},
+])
+def test_top_k_matches_a_full_sort(table, filters):
+    index = RiskIndex(table)
+    for k in (1, 5, 50, 1000):
+        got = index.top_k(k, **filters)
+        want = _reference(table, k, **filters)
+        assert got["cluster_id"].tolist() == want["cluster_id"].tolist()
+
+def test_empty_filters_do_not_filter(table):
+    index = RiskIndex(table)
+    assert index.top_k(10, province=[], municipality=None)["cluster_id"].tolist() == \
+           index.top_k(10)["cluster_id"].tolist()
+
+def test_per_farm_keeps_each_farms_riskiest_cluster(table):
+    index = RiskIndex(table)
+    got = index.top_k(8, province=["p1"], per_farm=True)
+    want = (_reference(table, len(table), province=["p1"])
+            .drop_duplicates("farm_id").head(8))
+    assert got["cluster_id"].tolist() == want["cluster_id"].tolist()
+    assert got["clusters"].tolist() == [int((table["farm_id"] == f).sum()) for f in got["farm_id"]]
+
+def test_clusters_drill_down(table):
+    index = RiskIndex(table)
+    got = index.clusters("f7")
+    assert got["cluster_id"].tolist() == _reference(table[table["farm_id"] == "f7"], 1000)["cluster_id"].tolist()
+    assert index.clusters("missing").empty
+
+def test_high_priority_counts_only_count_sides_with_a_message():
+    df = pd.DataFrame({"ph": [4.0, 6.0, 8.0, np.nan], "shade": [0, 50, 90, 10]})
+    rules = [("ph",    5.0, 7.0, "too acidic", "",          "High"),
+             ("shade", 20,  80,  "add shade",  "thin shade", "High"),
+             ("ph",    5.5, 6.5, "lime",       "sulfur",     "Medium"),
+             ("absent", 0,  1,   "x",          "y",          "High")]
+    assert high_priority_counts(df, rules).tolist() == [2, 0, 1, 1]
+
+def test_build_risk_index_scores_latest_season_per_cluster():
+    flat = pd.DataFrame({
+        "cluster_id":      ["a", "a", "b", "c"],
+        "cluster_name":    ["A", "A", "B", "C"],
+        "farm_id":         ["f1", "f1", "f1", "f2"],
+        "farm_name":       ["One", "One", "One", "Two"],
+        "municipality":    "m", "province": "p",
+        "season":          ["2023", "2024", "2024", "2024"],
+        "season_idx":      [0, 1, 1, 1],
+        "yield_kg":        [100.0, 50.0, 100.0, 100.0],
+        "yield_delta_pct": [np.nan, -50.0, 0.0, 10.0],
+        "climate_stress":  [0.1, 0.9, 0.5, 0.1],
+        "mgmt_score":      [5, 1, 3, 5],
+    })
+    forecasts = pd.DataFrame({"forecast_yield_kg": [25.0, 100.0]}, index=["a", "c"])
+    index = build_risk_index(flat, [], forecasts)
+    assert index.table["cluster_id"].tolist() == ["a", "b", "c"]
+    row = index.table.loc["a"]
+    assert (row["season"], row["yield_decline_pct"], row["predicted_decline_pct"]) == ("2024", 50.0, 50.0)
+    assert row["risk_level"] in ("Critical", "High")
+    assert np.isnan(index.table.loc["b", "predicted_decline_pct"])
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from shared_store import SharedStore, _KeyedLocks
+
+def _frame(n):
+    return pd.DataFrame({"x": np.zeros(n)})
+
+@pytest.fixture
+def store():
+    # Budget fits one 1000-row frame (8 kB) but not two
+    return SharedStore(budget_bytes=12_000)
+
+def test_dataset_is_loaded_once_and_shared(store):
+    calls = []
+    def load():
+        calls.append(1)
+        return _frame(10)
+    a = store.dataset("d1", "s1", load)
+    b = store.dataset("d1", "s2", load)
+    assert calls == [1] and a is not b
+    # Views share buffers but writes stay local
+    a["x"] = 1.0
+    assert (b["x"] == 0).all()
+    m = store.metrics()
+    assert (m["datasets"], m["hits"], m["misses"], m["active_sessions"]) == (1, 1, 1, 2)
+
+def test_referenced_datasets_are_never_evicted(store):
+    store.dataset("d1", "s1", lambda: _frame(1000))
+    store.dataset("d2", "s2", lambda: _frame(1000))
+    assert store.metrics()["datasets"] == 2 and store.metrics()["evictions"] == 0
+    # Dropping the last reference lets the store shrink back under budget
+    store.release("s1")
+    m = store.metrics()
+    assert (m["datasets"], m["evictions"]) == (1, 1) and m["bytes"] <= store.budget_bytes
+
+def test_switching_dataset_moves_the_reference(store):
+    store.dataset("d1", "s1", lambda: _frame(1000))
+    store.dataset("d2", "s1", lambda: _frame(1000))
+    calls = []
+    store.dataset("d1", "s2", lambda: calls.append(1) or _frame(1000))
+    assert calls == [1]  # d1 lost its only reference when s1 moved on
+
+def test_idle_sessions_expire(store):
+    store.session_ttl = 0.05
+    store.dataset("d1", "s1", lambda: _frame(1000))
+    time.sleep(0.1)
+    store.dataset("d2", "s2", lambda: _frame(1000))
+    m = store.metrics()
+    assert (m["active_sessions"], m["datasets"], m["evictions"]) == (1, 1, 1)
+
+def test_artifacts_evict_least_recently_used_first(store):
+    store.artifact(("a",), lambda: _frame(500))
+    store.artifact(("b",), lambda: _frame(500))
+    store.artifact(("a",), lambda: pytest.fail("recomputed a live artifact"))
+    store.artifact(("c",), lambda: _frame(500))
+    calls = []
+    store.artifact(("a",), lambda: calls.append("a") or _frame(500))
+    store.artifact(("b",), lambda: calls.append("b") or _frame(500))
+    assert calls == ["b"]
+
+def test_concurrent_misses_compute_once():
+    store, calls, started = SharedStore(), [], threading.Event()
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return _frame(10)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.artifact(("k",), compute)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert calls == [1] and len(results) == 8
+    assert store.metrics()["misses"] == 1 and store.metrics()["hits"] == 7
+
+def test_keyed_locks_serialise_per_key_and_clean_up():
+    locks, inside, overlap = _KeyedLocks(), [], []
+    def work(key):
+        with locks(key):
+            inside.append(key)
+            overlap.append(inside.count(key))
+            time.sleep(0.02)
+            inside.remove(key)
+    threads = [threading.Thread(target=work, args=(k,)) for k in "aabba"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert max(overlap) == 1
+    assert locks._locks == {}
+
+def test_keyed_locks_do_not_block_other_keys():
+    locks, other_done = _KeyedLocks(), threading.Event()
+    def other():
+        with locks("b"):
+            other_done.set()
+    with locks("a"):
+        t = threading.Thread(target=other)
+        t.start()
+        assert other_done.wait(2)
+    t.join(2)
+    assert locks._locks == {}
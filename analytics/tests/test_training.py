@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+
+import training
+from training import ML_FEATURES, ML_TARGETS, TrainingService, data_fingerprint
+
+@pytest.fixture
+def rows():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.uniform(1, 10, size=(30, len(ML_FEATURES) + len(ML_TARGETS))),
+                        columns=ML_FEATURES + ML_TARGETS)
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Stub out model fitting; jobs finish only once the returned event is set."""
+    release, calls = threading.Event(), []
+    def fake_train(flat_df, progress=None):
+        calls.append(len(flat_df))
+        release.wait(5)
+        return {"GBR": {"model": object()}}, {}, {}, None, "GBR", flat_df
+    monkeypatch.setattr(training, "train_models", fake_train)
+    monkeypatch.setattr(training, "explain_models", lambda *a, **k: {})
+    release.calls = calls
+    return release
+
+def test_fingerprint_depends_on_rows_and_dump(rows):
+    assert data_fingerprint(rows, "dump-a") == data_fingerprint(rows.copy(), "dump-a")
+    assert data_fingerprint(rows, "dump-a") != data_fingerprint(rows, "dump-b")
+    assert data_fingerprint(rows, "dump-a") != data_fingerprint(rows.iloc[1:], "dump-a")
+
+def test_submit_joins_running_job(rows, gate):
+    svc = TrainingService()
+    fp = data_fingerprint(rows, "dump-a")
+    first = svc.submit(fp, rows, "dump-a")
+    assert svc.submit(fp, rows, "dump-a") is first and svc.joins == 1
+    gate.set()
+    first.future.result(5)
+    assert gate.calls == [len(rows)]
+    assert svc.submit(fp, rows, "dump-a") is first and svc.running == 0
+    assert first.profile is not None and first.error is None
+
+def test_latest_is_scoped_to_the_dump(rows, gate):
+    # Regression: the same rows in another dump (reversed) must not reuse this dump's model
+    svc = TrainingService()
+    gate.set()
+    job = svc.submit(data_fingerprint(rows, "dump-a"), rows, "dump-a")
+    job.future.result(5)
+    assert svc.latest("dump-a") is job
+    assert svc.latest("dump-b") is None
+    reversed_rows = rows.iloc[::-1]
+    assert svc.job(data_fingerprint(reversed_rows, "dump-b")) is None
+
+def test_latest_skips_failed_and_empty_jobs(rows, gate, monkeypatch):
+    svc = TrainingService()
+    gate.set()
+    good = svc.submit(data_fingerprint(rows, "d"), rows, "d")
+    good.future.result(5)
+    monkeypatch.setattr(training, "train_models", lambda df, progress=None: (None, None, None, None))
+    empty = svc.submit(data_fingerprint(rows.iloc[:5], "d"), rows.iloc[:5], "d")
+    empty.future.result(5)
+    monkeypatch.setattr(training, "train_models", lambda df, progress=None: 1 / 0)
+    failed = svc.submit(data_fingerprint(rows.iloc[:6], "d"), rows.iloc[:6], "d")
+    failed.future.result(5)
+    assert isinstance(failed.error, ZeroDivisionError)
+    assert svc.latest("d") is good
+
+def test_tuning_does_not_block_training(rows, gate, monkeypatch):
+    import tuning
+    searching = threading.Event()
+    def slow_tune(flat_df, **kw):
+        searching.set()
+        gate.wait(5)
+    monkeypatch.setattr(tuning, "tune", slow_tune)
+    monkeypatch.setattr(tuning, "save", lambda summary: None)
+    monkeypatch.setattr(training, "train_models",
+                        lambda df, progress=None: ({"GBR": {"model": object()}}, {}, {}, None, "GBR", df))
+    svc = TrainingService()
+    search = svc.submit_tuning(rows, budget_s=60, n_candidates=4)
+    assert searching.wait(5)
+    job = svc.submit(data_fingerprint(rows, "d"), rows, "d")
+    job.future.result(5)
+    assert job.error is None and not search.done
+    gate.set()
+    search.future.result(5)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from training import DEFAULT_PARAMS
+from tuning import successive_halving
+
+def _data(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 4))
+    return X, 3 * X[:, 0] - X[:, 1] + rng.normal(scale=0.5, size=n)
+
+def test_truncated_search_keeps_the_default():
+    X, y = _data()
+    # No time for more than the first rung: nothing was compared on full rows
+    best, score, trace, _ = successive_halving("Ridge", X, y, budget_s=1e-9, n_candidates=7, n_jobs=1)
+    assert best == DEFAULT_PARAMS["Ridge"]
+    assert trace[-1]["rows"] < len(X)
+    assert trace[-1]["outcome"].startswith("default kept: truncated")
+    assert round(score, 4) == trace[-1]["default_r2"]
+
+def test_full_search_races_the_default_to_the_last_rung():
+    X, y = _data()
+    best, score, trace, _ = successive_halving("Ridge", X, y, budget_s=60, n_candidates=7, n_jobs=1)
+    assert trace[-1]["rows"] == len(X)
+    assert not np.isnan(trace[-1]["default_r2"])
+    if trace[-1]["outcome"] == "tuned":
+        assert best != DEFAULT_PARAMS["Ridge"] and score > trace[-1]["default_r2"]
+    else:
+        assert best == DEFAULT_PARAMS["Ridge"] and round(score, 4) == trace[-1]["default_r2"]
@@ -0,0 +1,270 @@
+# ============================================================
+# ☕ Model Training
+# Yield / grade model fitting plus a background training service
+# that serves the last compatible result while a new one trains
+# ============================================================
+
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from attributions import explain_models
+from drift import DriftProfile
+from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+ML_FEATURES = [
+    "plant_age_months", "pre_yield_kg", "pruning_interval_months",
+    "shade_binary", "fert_type_enc", "fert_freq_enc", "pest_type_enc", "pest_freq_enc",
+    "mgmt_score", "soil_ph", "avg_temp_c", "avg_rainfall_mm", "avg_humidity_pct",
+    "elevation_m", "planting_density", "climate_stress", "season_idx",
+    "previous_fine_pct", "previous_premium_pct", "previous_commercial_pct"
+]
+ML_TARGETS = ["yield_kg", "fine_grade_pct", "premium_grade_pct", "commercial_grade_pct"]
+GRADE_TARGETS = ["fine_grade_pct", "premium_grade_pct", "commercial_grade_pct"]
+
+# Hand-picked defaults; tuned winners saved by tuning.py override them per model
+DEFAULT_PARAMS = {
+    "GBR":   {"n_estimators": 400, "learning_rate": 0.04, "max_depth": 4, "subsample": 0.8},
+    "RF":    {"n_estimators": 300, "max_depth": 8, "min_samples_leaf": 2},
+    "Ridge": {"alpha": 10.0},
+    "grade": {"n_estimators": 300, "learning_rate": 0.04, "max_depth": 3},
+}
+TUNED_PARAMS_PATH = os.environ.get(
+    "KAPE_TUNED_PARAMS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tuned_params.json"))
+
+def load_tuned():
+    """Saved tuning run (``{"params": {...}, "trace": [...], ...}``) or ``{}``."""
+    try:
+        with open(TUNED_PARAMS_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def model_params():
+    """Effective hyperparameters: defaults overlaid with saved tuned winners.
+
+    Grade models may be tuned per target (``"grade:fine_grade_pct"``) and fall
+    back to the shared ``"grade"`` entry.
+    """
+    params = {k: dict(v) for k, v in DEFAULT_PARAMS.items()}
+    for key, tuned in load_tuned().get("params", {}).items():
+        params[key] = {**params.get(key.split(":")[0], {}), **tuned}
+    for target in GRADE_TARGETS:
+        params.setdefault(f"grade:{target}", params["grade"])
+    return params
+
+def make_model(kind, params):
+    if kind == "GBR" or kind.startswith("grade"):
+        return GradientBoostingRegressor(random_state=42, **params)
+    if kind == "RF":
+        return RandomForestRegressor(random_state=42, **params)
+    if kind == "Ridge":
+        return Pipeline([("scaler", StandardScaler()), ("ridge", Ridge(**params))])
+    raise ValueError(f"Unknown model kind: {kind!r}")
+
+# ═════════════════════════════════════════════════════════════════════════════
+# TRAINING
+# ═════════════════════════════════════════════════════════════════════════════
+
+def ml_ready(flat_df):
+    return flat_df.dropna(subset=ML_FEATURES + ML_TARGETS)
+
+def data_fingerprint(flat_df, digest):
+    """Content hash of the training rows/columns, their dump and the hyperparameters in effect.
+
+    ``digest`` (the dump's content digest) keeps identical rows of two dumps,
+    e.g. another user's upload, from ever sharing a job.
+    """
+    ml_clean = ml_ready(flat_df)
+    h = hashlib.blake2b(str(digest).encode(), digest_size=12)
+    h.update(",".join(ML_FEATURES + ML_TARGETS).encode())
+    h.update(json.dumps(model_params(), sort_keys=True).encode())
+    h.update(pd.util.hash_pandas_object(ml_clean[ML_FEATURES + ML_TARGETS], index=False).values.tobytes())
+    return h.hexdigest()
+
+def train_models(flat_df, progress=None):
+    """Fit the yield and grade models. ``progress(frac, label)`` is optional."""
+    report = progress or (lambda frac, label: None)
+    ml_clean = ml_ready(flat_df.copy())
+    if len(ml_clean) < 10:
+        return None, None, None, None
+    X = ml_clean[ML_FEATURES].values
+    y_yield = ml_clean["yield_kg"].values
+    X_tr, X_te, y_tr, y_te = train_test_split(X, y_yield, test_size=0.2, random_state=42)
+    params = model_params()
+    models = {name: make_model(name, params[name]) for name in ["GBR", "RF", "Ridge"]}
+    n_steps, step = len(models) + len(GRADE_TARGETS), 0
+    results = {}
+    for name, mdl in models.items():
+        report(step / n_steps, f"Yield model: {name}")
+        mdl.fit(X_tr, y_tr)
+        yp = mdl.predict(X_te)
+        cv = cross_val_score(mdl, X, y_yield, cv=min(5,len(ml_clean)), scoring="r2")
+        results[name] = {"model":mdl,"y_pred":yp,"y_test":y_te,
+                         "MAE":round(mean_absolute_error(y_te,yp),2),
+                         "RMSE":round(mean_squared_error(y_te,yp)**0.5,2),
+                         "R2":round(r2_score(y_te,yp),4),
+                         "CV_R2":round(cv.mean(),4)}
+        step += 1
+    grade_models, grade_metrics = {}, {}
+    for target in GRADE_TARGETS:
+        report(step / n_steps, f"Grade model: {target}")
+        yg = ml_clean[target].values
+        Xg_tr,Xg_te,yg_tr,yg_te = train_test_split(X, yg, test_size=0.2, random_state=42)
+        gm = make_model("grade", params[f"grade:{target}"])
+        gm.fit(Xg_tr, yg_tr)
+        yg_p = gm.predict(Xg_te)
+        cv_g = cross_val_score(gm, X, yg, cv=min(5,len(ml_clean)), scoring="r2")
+        grade_models[target] = gm
+        grade_metrics[target] = {"model":gm,"y_pred":yg_p,"y_test":yg_te,
+                                  "MAE":round(mean_absolute_error(yg_te,yg_p),2),
+                                  "R2":round(r2_score(yg_te,yg_p),4),
+                                  "CV_R2":round(cv_g.mean(),4)}
+        step += 1
+    report(1.0, "Done")
+    best_name = max(results, key=lambda k: results[k]["R2"])
+    imp = pd.Series(results["GBR"]["model"].feature_importances_, index=ML_FEATURES).sort_values(ascending=False)
+    return results, grade_models, grade_metrics, imp, best_name, ml_clean
+
+# ═════════════════════════════════════════════════════════════════════════════
+# BACKGROUND TRAINING SERVICE
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TrainingJob:
+    def __init__(self, fingerprint, digest=None):
+        self.fingerprint = fingerprint
+        self.digest      = digest       # content digest of the dump the rows came from
+        self.progress    = 0.0
+        self.stage       = "Queued"
+        self.submitted   = time.time()
+        self.finished    = None
+        self.result      = None
+        self.attributions = None        # target -> TreeSHAP frames by harvest id, same model version
+        self.profile     = None         # DriftProfile of the training rows
+        self.params      = None         # hyperparameters the models were fitted with
+        self.error       = None
+        self.future      = None
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def _report(self, frac, label):
+        self.progress, self.stage = frac, label
+
+class TrainingService:
+    """Trains models off the script thread, one job per data fingerprint.
+
+    Finished results are kept in a small LRU so pages can serve the most
+    recent compatible result while a new job runs. The service is shared by
+    every session, so results are only ever handed out for the dataset
+    (dump digest) they were trained on.
+    """
+
+    def __init__(self, max_workers=1, keep=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="train")
+        self._tuner    = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tune")  # never queues ahead of training
+        self._lock     = threading.Lock()
+        self._jobs     = {}            # fingerprint -> running TrainingJob
+        self._results  = OrderedDict() # fingerprint -> finished TrainingJob
+        self._keep     = keep
+        self.joins     = 0              # submits that attached to a running job
+        self.tuning    = None           # latest hyperparameter search (running or finished)
+
+    def result(self, fingerprint):
+        with self._lock:
+            job = self._results.get(fingerprint)
+            if job is not None:
+                self._results.move_to_end(fingerprint)
+            return job
+
+    def job(self, fingerprint):
+        """Running or finished job for ``fingerprint``, without starting one."""
+        with self._lock:
+            return self._jobs.get(fingerprint) or self._results.get(fingerprint)
+
+    def submit(self, fingerprint, flat_df, digest):
+        """Start training ``flat_df`` (rows of dump ``digest``) or join the job already running."""
+        with self._lock:
+            if fingerprint in self._results:
+                return self._results[fingerprint]
+            job = self._jobs.get(fingerprint)
+            if job is None:
+                job = self._jobs[fingerprint] = TrainingJob(fingerprint, digest)
+                job.future = self._executor.submit(self._run, job, flat_df)
+            else:
+                self.joins += 1
+            return job
+
+    def submit_tuning(self, flat_df, budget_s, n_candidates):
+        """Start a hyperparameter search on its own worker, or return the running one.
+
+        The winners are saved when it finishes, so the next model job trains
+        with them; ``job.result`` is the run summary (``None``: too few rows).
+        """
+        # Imported here, on the calling thread: tuning builds on this module
+        from tuning import save, tune
+
+        with self._lock:
+            if self.tuning is None or self.tuning.done:
+                self.tuning = TrainingJob(("tune", budget_s, n_candidates))
+                self.tuning.future = self._tuner.submit(
+                    self._tune, self.tuning, lambda progress: tune(
+                        flat_df, budget_s=budget_s, n_candidates=n_candidates, progress=progress), save, budget_s)
+            return self.tuning
+
+    @property
+    def running(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def latest(self, digest):
+        """Most recently finished job with usable models trained on dump ``digest``, or ``None``."""
+        with self._lock:
+            for job in reversed(self._results.values()):
+                if job.digest == digest and job.result is not None and job.result[0] is not None:
+                    return job
+        return None
+
+    def _run(self, job, flat_df):
+        job.stage = "Training"
+        try:
+            job.params = model_params()
+            job.result = train_models(flat_df, progress=lambda f, label: job._report(0.8 * f, label))
+            if job.result[0] is not None:
+                job.profile = DriftProfile.from_frame(job.result[5], ML_FEATURES)
+                job._report(0.8, "Explaining predictions (TreeSHAP)")
+                results, grade_models = job.result[0], job.result[1]
+                job.attributions = explain_models(
+                    flat_df, ML_FEATURES, {"yield_kg": results["GBR"]["model"], **grade_models})
+                job._report(1.0, "Done")
+        except Exception as exc:  # surfaced on the page instead of killing the worker
+            job.error = exc
+        job.finished = time.time()
+        with self._lock:
+            # Failed jobs are kept too so the page shows the error instead of retrying
+            self._jobs.pop(job.fingerprint, None)
+            self._results[job.fingerprint] = job
+            while len(self._results) > self._keep:
+                self._results.popitem(last=False)
+        return job.result
+
+    def _tune(self, job, search, save, budget_s):
+        job.stage, t0 = "Tuning", time.time()
+        def progress(kind, rung, n_rungs):
+            job._report(min(0.99, (time.time() - t0) / budget_s), f"{kind} — rung {rung + 1} of {n_rungs + 1}")
+        try:
+            job.result = search(progress)
+            if job.result is not None:
+                save(job.result)
+            job._report(1.0, "Done")
+        except Exception as exc:
+            job.error = exc
+        job.finished = time.time()
+        return job.result
@@ -0,0 +1,160 @@
+# ============================================================
+# ☕ Hyperparameter Tuning
+# Budgeted successive-halving search for the yield and grade
+# models; winners are saved for later train_models runs
+# ============================================================
+
+import json, math, os, time
+from datetime import datetime
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.model_selection import KFold, cross_val_score, train_test_split
+
+from training import (ML_FEATURES, GRADE_TARGETS, DEFAULT_PARAMS, TUNED_PARAMS_PATH,
+                      make_model, ml_ready)
+
+SEARCH_SPACES = {
+    "GBR": {
+        "n_estimators":  [100, 200, 400, 600],
+        "learning_rate": [0.02, 0.04, 0.08, 0.15],
+        "max_depth":     [2, 3, 4, 5],
+        "subsample":     [0.6, 0.8, 1.0],
+    },
+    "RF": {
+        "n_estimators":     [100, 300, 500],
+        "max_depth":        [4, 6, 8, 12, None],
+        "min_samples_leaf": [1, 2, 4, 8],
+    },
+    "Ridge": {
+        "alpha": [0.1, 0.3, 1.0, 3.0, 10.0, 30.0, 100.0],
+    },
+    "grade": {
+        "n_estimators":  [100, 200, 300, 500],
+        "learning_rate": [0.02, 0.04, 0.08],
+        "max_depth":     [2, 3, 4],
+    },
+}
+
+def _sample_candidates(space, n, rng, default):
+    """Up to ``n`` distinct configurations; the current default is always one."""
+    keys = sorted(space)
+    total = math.prod(len(space[k]) for k in keys)
+    seen, out = set(), [dict(default)]
+    seen.add(tuple(default.get(k) for k in keys))
+    while len(out) < min(n, total):
+        cand = {k: space[k][rng.integers(len(space[k]))] for k in keys}
+        sig = tuple(cand[k] for k in keys)
+        if sig not in seen:
+            seen.add(sig)
+            out.append(cand)
+    return out
+
+def _cv_score(kind, params, X, y, folds):
+    cv = KFold(n_splits=folds, shuffle=True, random_state=42)
+    return float(np.nanmean(cross_val_score(make_model(kind, params), X, y, cv=cv, scoring="r2")))
+
+def successive_halving(kind, X, y, budget_s, n_candidates=27, eta=3, min_rows=40,
+                       folds=3, n_jobs=-1, seed=42, progress=None):
+    """Race random configurations, growing the row budget ``eta``× per rung.
+
+    Each rung scores the survivors in parallel (3-fold CV R² on a nested row
+    subsample) and keeps the top ``1/eta``. Every rung is checked against
+    ``budget_s`` before it starts: the first one times the default alone and
+    admits only as many challengers as the remaining budget fits, later ones
+    scale the previous rung's cost.
+
+    The default is raced in every rung as the control. A challenger only
+    wins if it beats the default on a completed full-size rung; otherwise the
+    default is returned and the last trace row's ``outcome`` says why.
+    """
+    rng = np.random.default_rng(seed)
+    base = DEFAULT_PARAMS["grade" if kind.startswith("grade") else kind]
+    space = SEARCH_SPACES["grade" if kind.startswith("grade") else kind]
+    cands = _sample_candidates(space, n_candidates, rng, base)
+    order = rng.permutation(len(X))
+    n_rungs = max(1, math.ceil(math.log(len(cands), eta))) if len(cands) > 1 else 1
+    workers = effective_n_jobs(n_jobs)
+    default = cands[0]
+    t0, trace, rung_cost, best = time.time(), [], None, (default, float("nan"))
+
+    for rung in range(n_rungs + 1):
+        rows = int(min(len(X), max(min_rows, len(X) / eta ** (n_rungs - rung))))
+        idx = order[:rows]
+        folds_r = min(folds, rows)
+        t_r = time.time()
+        if rung_cost is None:
+            # First rung: the default is the probe, challengers fill what is left
+            scores = [_cv_score(kind, cands[0], X[idx], y[idx], folds_r)]
+            per_cand = max(time.time() - t_r, 1e-3)
+            fits = int((budget_s - (time.time() - t0)) / per_cand * workers)
+            cands = cands[:1 + min(max(fits, 0), len(cands) - 1)]
+        else:
+            # Next rung: fewer candidates, more rows — scale the last rung's cost
+            est = rung_cost * len(cands) / trace[-1]["candidates"] * rows / trace[-1]["rows"]
+            if time.time() - t0 + est > budget_s:
+                break
+            scores = []
+        scores += Parallel(n_jobs=n_jobs)(
+            delayed(_cv_score)(kind, c, X[idx], y[idx], folds_r) for c in cands[len(scores):])
+        rung_cost = time.time() - t_r
+        ranked = sorted(zip(scores, range(len(cands))), key=lambda t: -np.nan_to_num(t[0], nan=-np.inf))
+        best = (cands[ranked[0][1]], ranked[0][0])
+        default_r2 = scores[cands.index(default)]
+        trace.append({"model": kind, "rung": rung, "candidates": len(cands), "rows": rows,
+                      "best_r2": round(ranked[0][0], 4), "default_r2": round(default_r2, 4),
+                      "best_params": best[0], "seconds": round(rung_cost, 2), "outcome": None})
+        if progress:
+            progress(kind, rung, n_rungs)
+        if len(cands) == 1:
+            break
+        keep = [cands[i] for _, i in ranked[:max(1, len(cands) // eta)]]
+        cands = keep if default in keep else keep + [default]
+
+    if trace[-1]["rows"] < len(X):
+        trace[-1]["outcome"] = f"default kept: truncated at {trace[-1]['rows']} of {len(X)} rows"
+    elif best[0] != default and best[1] > default_r2:
+        trace[-1]["outcome"] = "tuned"
+    else:
+        trace[-1]["outcome"] = "default best"
+    if trace[-1]["outcome"] != "tuned":
+        best = (default, default_r2)
+    return best[0], best[1], trace, time.time() - t0
+
+def tune(flat_df, budget_s=120, n_candidates=27, eta=3, n_jobs=-1, progress=None):
+    """Tune every yield / grade model within ``budget_s`` seconds in total.
+
+    Searches run on the same training split ``train_models`` uses, so its
+    hold-out metrics stay honest. Returns the run summary that :func:`save`
+    persists (``params`` only holds models whose winner beat the default,
+    ``cv_r2`` every model searched); ``None`` if there are too few ML-ready rows.
+    """
+    ml_clean = ml_ready(flat_df)
+    if len(ml_clean) < 10:
+        return None
+    X = ml_clean[ML_FEATURES].values
+    kinds = [("GBR", "yield_kg"), ("RF", "yield_kg"), ("Ridge", "yield_kg")] + \
+            [(f"grade:{t}", t) for t in GRADE_TARGETS]
+    t0, params, scores, trace = time.time(), {}, {}, []
+    for i, (kind, target) in enumerate(kinds):
+        # Split what is left of the budget evenly over the remaining searches
+        remaining = budget_s - (time.time() - t0)
+        if remaining <= 0:
+            break
+        X_tr, _, y_tr, _ = train_test_split(X, ml_clean[target].values, test_size=0.2, random_state=42)
+        best, score, tr, _ = successive_halving(
+            kind, X_tr, y_tr, remaining / (len(kinds) - i), n_candidates=n_candidates,
+            eta=eta, n_jobs=n_jobs, progress=progress)
+        # Only winners that beat the default on full rows are saved as overrides
+        if tr[-1]["outcome"] == "tuned":
+            params[kind] = best
+        scores[kind] = round(score, 4)
+        trace.extend(tr)
+    return {"params": params, "cv_r2": scores, "trace": trace, "rows": len(ml_clean),
+            "budget_s": budget_s, "elapsed_s": round(time.time() - t0, 1),
+            "tuned_at": datetime.now().isoformat(timespec="seconds")}
+
+def save(run, path=TUNED_PARAMS_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    os.replace(tmp, path)